@@ -0,0 +1,144 @@
+# benchmarks/fake_bot_api.py
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotApi:
+    """Локальная имитация Telegram Bot API для нагрузочных замеров.
+
+    Отвечает на методы, которые использует бот, с настраиваемой задержкой
+    и долей ответов 429 (Too Many Requests) и считает вызовы.
+    """
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.5, rate_429: float = 0.0,
+                 retry_after: int = 1, seed: int = 42):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.calls = {}
+        self.too_many_requests = 0
+        self._message_id = 0
+        self.web_app = web.Application()
+        self.web_app.router.add_post("/bot{token}/{method}", self._handle)
+        self.web_app.router.add_get("/stats", self._handle_stats)
+        self.web_app.router.add_post("/reset", self._handle_reset)
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        """Адрес для ApplicationBuilder.base_url (токен добавляется PTB)"""
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def port(self) -> int:
+        return self._runner.addresses[0][1]
+
+    def reset(self):
+        self.calls = {}
+        self.too_many_requests = 0
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.calls), "too_many_requests": self.too_many_requests}
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def _handle_reset(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"ok": True})
+
+    async def _read_params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        # PTB передает параметры формой, сложные значения — строками JSON
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = await self._read_params(request)
+
+        if self.latency > 0:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0.0, self._random.uniform(self.latency - spread, self.latency + spread)))
+
+        if method == "sendMessage" and self.rate_429 and self._random.random() < self.rate_429:
+            self.too_many_requests += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if method == "getUpdates":
+            return []
+        return True
+
+    async def start(self, port: int = 0):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+        logger.info(f"Fake Bot API слушает {self.base_url}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(args):
+    api = FakeBotApi(args.latency, args.jitter, args.rate_429, args.retry_after, args.seed)
+    await api.start(args.port)
+    # Строка-сигнал для запускающего процесса: сервер готов
+    print(f"READY {api.port}", flush=True)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Имитация Telegram Bot API")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/import_time.py
+"""Замер холодного импорта модулей бота.
+
+Каждый модуль импортируется в новом процессе Python (как при перезапуске или
+запуске дополнительного процесса кластера), без BOT_TOKEN и в пустом рабочем
+каталоге. Кроме времени проверяется, что импорт не имеет побочных эффектов:
+ничего не выводит, не создает файл БД и не создает сервисы контейнера.
+
+Пример:
+    python benchmarks/import_time.py --runs 5 --budget-ms 800
+
+С --budget-ms код возврата ненулевой, если медиана импорта какого-либо модуля
+превышает бюджет или импорт имеет побочные эффекты.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = (
+    "src.utils.config",
+    "src.services.database",
+    "src.services.schedule_manager",
+    "src.services.notifier",
+    "src.services.admin_panel",
+    "src.handlers.user_handlers",
+)
+
+# Выполняется в дочернем процессе: время импорта и признаки побочных эффектов
+PROBE = """
+import io, json, os, sys, time
+sys.path.insert(0, {root!r})
+captured = io.StringIO()
+stdout, sys.stdout = sys.stdout, captured
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+sys.stdout = stdout
+from src.container import container
+print(json.dumps({{
+    "elapsed_ms": elapsed * 1000,
+    "stdout": captured.getvalue(),
+    "services": container.created,
+    "files": sorted(os.listdir(".")),
+    "aiohttp": "aiohttp" in sys.modules,
+}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замер холодного импорта модулей бота")
+    parser.add_argument("--modules", default=",".join(MODULES), help="Модули через запятую")
+    parser.add_argument("--runs", type=int, default=5, help="Число запусков на модуль")
+    parser.add_argument("--budget-ms", type=float, help="Допустимая медиана импорта, мс")
+    parser.add_argument("--json", action="store_true", help="Вывести результаты в JSON")
+    return parser.parse_args()
+
+
+def probe(module: str, work_dir: str) -> dict:
+    env = {key: value for key, value in os.environ.items() if key != "BOT_TOKEN"}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=PROJECT_ROOT, module=module)],
+        cwd=work_dir, env=env, capture_output=True, text=True, check=False
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure(module: str, runs: int) -> dict:
+    samples = []
+    side_effects = set()
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = probe(module, work_dir)
+        samples.append(result["elapsed_ms"])
+        if result["stdout"]:
+            side_effects.add("вывод в stdout")
+        if result["services"]:
+            side_effects.add(f"созданы сервисы: {', '.join(result['services'])}")
+        if result["files"]:
+            side_effects.add(f"созданы файлы: {', '.join(result['files'])}")
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "aiohttp": result["aiohttp"],
+        "side_effects": sorted(side_effects),
+    }
+
+
+def main():
+    args = parse_args()
+    modules = [name for name in args.modules.split(",") if name]
+    results = [measure(module, args.runs) for module in modules]
+
+    failed = False
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    for result in results:
+        over_budget = args.budget_ms is not None and result["median_ms"] > args.budget_ms
+        failed = failed or over_budget or bool(result["side_effects"])
+        if not args.json:
+            status = "❌" if over_budget or result["side_effects"] else "✅"
+            notes = "; ".join(result["side_effects"]) or ("aiohttp импортирован" if result["aiohttp"] else "")
+            print(f"{status} {result['module']:<32} медиана {result['median_ms']:7.1f} мс, "
+                  f"максимум {result['max_ms']:7.1f} мс {notes}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# benchmarks/run_benchmarks.py
+"""Нагрузочные замеры бота на локальной имитации Bot API.
+
+Пример:
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --latency 0.02 --rate-429 0.001
+
+Результаты пишутся в JSON (по умолчанию benchmarks/results/<время>-<коммит>.json);
+--compare сравнивает их с ранее сохраненным файлом.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import aiohttp
+
+SCENARIOS = ("broadcast", "reminder", "today")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочные замеры бота расписания")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Число пользователей через запятую")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Сценарии через запятую")
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа Bot API, секунды")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Доля ответов 429 на sendMessage")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument("--rate-limit", type=float, default=100000, help="BROADCAST_RATE_LIMIT на время замера")
+    parser.add_argument("--concurrency", type=int, help="BROADCAST_CONCURRENCY на время замера (по умолчанию из конфигурации)")
+    parser.add_argument("--update-concurrency", type=int, default=64,
+                        help="Одновременно обрабатываемых обновлений в сценарии today")
+    parser.add_argument("--output", help="Файл результатов JSON")
+    parser.add_argument("--compare", help="Файл результатов для сравнения")
+    parser.add_argument("--verbose", action="store_true", help="Не приглушать логи бота")
+    return parser.parse_args()
+
+
+def configure_environment(args, work_dir: str):
+    """Настройки бота задаются до импорта src: конфигурация читается при импорте"""
+    os.environ["BOT_TOKEN"] = "123456:BENCHMARK"
+    os.environ["METRICS_ENABLED"] = "false"
+    os.environ["BROADCAST_RATE_LIMIT"] = str(args.rate_limit)
+    if args.concurrency:
+        os.environ["BROADCAST_CONCURRENCY"] = str(args.concurrency)
+    os.environ["BROADCAST_PER_CHAT_INTERVAL"] = "0"
+    os.environ["BROADCAST_CHECKPOINT_SIZE"] = "1000"
+    # База данных создается в текущем каталоге — отдельная временная для замеров
+    os.chdir(work_dir)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def command_update(update_id: int, user_id: int, command: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+class FakeBotApiProcess:
+    """Имитация Bot API в отдельном процессе, чтобы не делить процессор с ботом"""
+
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.port = None
+        self.session = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmarks.fake_bot_api",
+            "--latency", str(self.args.latency),
+            "--rate-429", str(self.args.rate_429),
+            "--retry-after", str(self.args.retry_after),
+            cwd=PROJECT_ROOT, stdout=asyncio.subprocess.PIPE
+        )
+        line = (await asyncio.wait_for(self.process.stdout.readline(), timeout=30)).decode()
+        if not line.startswith("READY"):
+            raise RuntimeError(f"Fake Bot API не запустился: {line!r}")
+        self.port = int(line.split()[1])
+        self.session = aiohttp.ClientSession(f"http://127.0.0.1:{self.port}")
+
+    async def stats(self) -> dict:
+        async with self.session.get("/stats") as response:
+            return await response.json()
+
+    async def reset(self):
+        async with self.session.post("/reset") as response:
+            response.raise_for_status()
+
+    async def stop(self):
+        if self.session:
+            await self.session.close()
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            await self.process.wait()
+
+
+class BenchmarkRunner:
+    def __init__(self, args, api: FakeBotApiProcess):
+        from src.handlers.user_handlers import ScheduleBot
+        from src.services.database import db
+        from src.services.user_registry import user_registry
+
+        self.args = args
+        self.api = api
+        self.db = db
+        self.registry = user_registry
+        self.bot = ScheduleBot("123456:BENCHMARK", base_url=api.base_url)
+        self.bot.setup_handlers()
+        self.application = self.bot.application
+        self.context = SimpleNamespace(bot=self.application.bot)
+
+    async def reset(self, users: int):
+        """Пустая БД и реестр с заданным числом пользователей"""
+        conn = self.db.get_connection()
+        with conn:
+            for table in ("users", "user_groups", "broadcast_outbox", "broadcast_jobs"):
+                conn.execute(f"DELETE FROM {table}")
+        await self.registry.load_async()
+        for i in range(users):
+            self.registry.add_user(100000 + i, f"bench_{i}", "Bench")
+        await self.registry.flush_async()
+        await self.api.reset()
+
+    async def _result(self, scenario: str, users: int, elapsed: float, messages: int = None, **extra) -> dict:
+        stats = await self.api.stats()
+        if messages is None:
+            messages = stats["calls"].get("sendMessage", 0)
+        result = {
+            "scenario": scenario,
+            "users": users,
+            "elapsed_s": round(elapsed, 4),
+            "messages": messages,
+            "rate_per_s": round(messages / elapsed, 1) if elapsed > 0 else 0.0,
+            "api_calls": stats["calls"],
+            "too_many_requests": stats["too_many_requests"],
+        }
+        result.update(extra)
+        return result
+
+    async def broadcast(self, users: int) -> dict:
+        started = time.perf_counter()
+        await self.bot.notifier.send_daily_schedule(self.context)
+        elapsed = time.perf_counter() - started
+        return await self._result("broadcast", users, elapsed)
+
+    async def reminder(self, users: int) -> dict:
+        planner = self.bot.notifier.reminder_planner
+        lessons = None
+        for offset in range(14):
+            plan = planner.plan_for_date(datetime.now() + timedelta(days=offset))
+            if plan:
+                lessons = plan[0][2]
+                break
+        if lessons is None:
+            raise RuntimeError("В расписании нет занятий на ближайшие две недели")
+
+        started = time.perf_counter()
+        await self.bot.notifier.send_lesson_reminder(self.context, lessons)
+        elapsed = time.perf_counter() - started
+        return await self._result("reminder", users, elapsed)
+
+    async def today(self, users: int) -> dict:
+        from telegram import Update
+
+        semaphore = asyncio.Semaphore(self.args.update_concurrency)
+        latencies = []
+
+        async def process(i: int):
+            update = Update.de_json(command_update(i + 1, 100000 + i, "/today"), self.application.bot)
+            async with semaphore:
+                update_started = time.perf_counter()
+                await self.application.process_update(update)
+                latencies.append(time.perf_counter() - update_started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(process(i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+        return await self._result(
+            "today", users, elapsed, len(latencies),
+            latency_p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+            latency_p95_ms=round(percentile(latencies, 0.95) * 1000, 2),
+            latency_p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+            latency_mean_ms=round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        )
+
+    async def run(self, sizes, scenarios) -> list:
+        results = []
+        async with self.application:
+            await self.bot.on_startup(self.application)
+            try:
+                for users in sizes:
+                    for scenario in scenarios:
+                        await self.reset(users)
+                        result = await getattr(self, scenario)(users)
+                        results.append(result)
+                        print(
+                            f"{scenario:>10} {users:>7} польз.: {result['elapsed_s']:.2f} с, "
+                            f"{result['rate_per_s']} сообщ./с, 429: {result['too_many_requests']}"
+                        )
+            finally:
+                await self.bot.on_shutdown(self.application)
+        return results
+
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(item["scenario"], item["users"]): item for item in json.load(f)["results"]}
+    print(f"\nСравнение с {baseline_path} (время, меньше — лучше):")
+    for item in results:
+        previous = baseline.get((item["scenario"], item["users"]))
+        if not previous or not previous["elapsed_s"]:
+            continue
+        ratio = item["elapsed_s"] / previous["elapsed_s"]
+        print(f"{item['scenario']:>10} {item['users']:>7}: {previous['elapsed_s']:.2f} с → {item['elapsed_s']:.2f} с (x{ratio:.2f})")
+
+
+async def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    results_dir = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+    commit = git_commit()
+    output = args.output or os.path.join(
+        results_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    )
+    output = os.path.abspath(output)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure_environment(args, work_dir)
+        api = FakeBotApiProcess(args)
+        await api.start()
+        try:
+            runner = BenchmarkRunner(args, api)
+            if not args.verbose:
+                logging.getLogger().setLevel(logging.ERROR)
+            results = await runner.run(sizes, scenarios)
+        finally:
+            await api.stop()
+            os.chdir(PROJECT_ROOT)
+
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "latency_s": args.latency,
+            "rate_429": args.rate_429,
+            "retry_after_s": args.retry_after,
+            "rate_limit": args.rate_limit,
+            "concurrency": int(os.environ.get("BROADCAST_CONCURRENCY", 0)) or None,
+            "update_concurrency": args.update_concurrency,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,7 +7,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.handlers.user_handlers import ScheduleBot
-from src.utils.config import BOT_TOKEN
+from src.utils.config import BOT_TOKEN, validate_config
 from src.utils.helpers import setup_logging
 
 def main():
@@ -16,6 +16,7 @@ def main():
     logger = logging.getLogger(__name__)
     
     try:
+        validate_config()
         bot = ScheduleBot(BOT_TOKEN)
         print("🚀 Бот запускается...")
         bot.run()
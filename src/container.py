@@ -0,0 +1,97 @@
+# container.py
+import logging
+from functools import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+class AppContainer:
+    """Контейнер сервисов приложения.
+
+    Сервисы создаются при первом обращении, а не при импорте модулей: импорт
+    не открывает БД и не читает файл расписания, поэтому тесты, утилиты и новые
+    процессы кластера не платят за то, что им не нужно. Модули сервисов
+    импортируются внутри свойств — сам контейнер можно импортировать откуда угодно
+    без циклических зависимостей. Прежние имена (db, schedule_manager и т. п.)
+    доступны в модулях сервисов и берутся отсюда.
+    """
+
+    @cached_property
+    def clock(self):
+        from src.services.clock import Clock
+        return Clock()
+
+    @cached_property
+    def database(self):
+        from src.services.database import Database
+        return Database()
+
+    @cached_property
+    def async_database(self):
+        from src.services.database import AsyncDatabase
+        return AsyncDatabase(self.database)
+
+    @cached_property
+    def schedule_manager(self):
+        from src.services.schedule_manager import ScheduleManager
+        return ScheduleManager(database=self.database, clock=self.clock)
+
+    @cached_property
+    def broadcaster(self):
+        from src.services.broadcaster import Broadcaster
+        return Broadcaster()
+
+    @cached_property
+    def broadcast_jobs(self):
+        from src.services.broadcast_jobs import BroadcastJobManager
+        return BroadcastJobManager(self.async_database, self.broadcaster)
+
+    @cached_property
+    def user_registry(self):
+        from src.services.user_registry import UserRegistry
+        return UserRegistry(self.database, self.async_database)
+
+    @cached_property
+    def user_preferences(self):
+        from src.services.user_preferences import PreferenceStore
+        return PreferenceStore(self.database, self.async_database)
+
+    @cached_property
+    def state_store(self):
+        from src.services.state_store import create_state_store
+        return create_state_store(async_database=self.async_database)
+
+    @cached_property
+    def admin_panel(self):
+        from src.services.admin_panel import AdminPanel
+        return AdminPanel(
+            self.state_store, self.async_database, self.broadcast_jobs, self.user_registry, self.schedule_manager,
+            self.clock
+        )
+
+    @cached_property
+    def ical_exporter(self):
+        from src.services.ical_export import ICalExporter
+        return ICalExporter(self.schedule_manager, self.database)
+
+    @property
+    def created(self) -> list:
+        """Уже созданные сервисы"""
+        return [name for name in vars(self) if isinstance(getattr(type(self), name, None), cached_property)]
+
+    def reset(self):
+        """Забывает созданные сервисы: следующие обращения создадут новые"""
+        for name in self.created:
+            delattr(self, name)
+
+
+def legacy_attribute(module_name: str, names: dict):
+    """__getattr__ для модуля сервиса: прежние глобальные экземпляры берутся из контейнера при обращении"""
+    def __getattr__(name):
+        if name in names:
+            return getattr(container, names[name])
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+    return __getattr__
+
+# Глобальный контейнер приложения
+container = AppContainer()
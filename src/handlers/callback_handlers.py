@@ -2,7 +2,7 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from src.services.admin_panel import admin_panel
+from src.container import container
 
 logger = logging.getLogger(__name__)
 
@@ -12,4 +12,4 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     # Передаем обработку в админ-панель
-    await admin_panel.handle_admin_callback(update, context)
\ No newline at end of file
+    await container.admin_panel.handle_admin_callback(update, context)
\ No newline at end of file
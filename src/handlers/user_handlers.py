@@ -1,27 +1,99 @@
 # handlers/user_handlers.py
 import logging
-from datetime import datetime
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler
-from telegram import Update, ReplyKeyboardRemove
-from src.utils.config import BOT_TOKEN
-from src.services.database import db
-from src.services.schedule_manager import schedule_manager
+import asyncio
+import signal
+from telegram.ext import (
+    Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler, ChatMemberHandler
+)
+from telegram import Update, ReplyKeyboardRemove, ChatMember, InputFile
+from src.utils.config import (
+    BOT_TOKEN, BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS,
+    METRICS_ENABLED, METRICS_LISTEN, METRICS_PORT, CLUSTER_ENABLED, UPDATE_CONCURRENCY,
+    CALENDAR_ENABLED, CALENDAR_LISTEN, CALENDAR_PORT, CALENDAR_URL
+)
+from src.container import AppContainer, container
+from src.services.database import USER_STATUS_ACTIVE, USER_STATUS_BLOCKED
 from src.services.notifier import Notifier
-from src.services.admin_panel import admin_panel
-from src.utils.keyboards import get_main_keyboard, get_admin_keyboard
+from src.services.webhook_server import WebhookServer
+from src.services.cluster import ClusterCoordinator, ClusterWorker, LocalCoordinator
+from src.services.update_processor import ChatOrderedUpdateProcessor
+from src.services.ical_export import CalendarFeedServer
+from src.services.metrics import metrics, MetricsServer, instrument_handler
+from src.services.user_preferences import (
+    parse_minute, format_minute, DIGEST_TIME_CHOICES, REMINDER_LEAD_CHOICES, TIMEZONE_CHOICES
+)
+from src.utils.keyboards import get_main_keyboard, get_admin_keyboard, get_groups_keyboard, get_settings_keyboard
+from src.utils.roles import is_admin
 from src.utils.helpers import setup_logging
 
 logger = logging.getLogger(__name__)
 
 class ScheduleBot:
-    def __init__(self, token: str):
-        self.application = Application.builder().token(token).build()
-        self.notifier = Notifier(self.application)
+    def __init__(self, token: str, base_url: str = None, services: AppContainer = None):
+        # Сервисы создаются здесь, при запуске бота, а не при импорте модулей
+        self.services = services or container
+        self.async_db = self.services.async_database
+        self.schedule_manager = self.services.schedule_manager
+        self.broadcaster = self.services.broadcaster
+        self.broadcast_jobs = self.services.broadcast_jobs
+        self.user_registry = self.services.user_registry
+        self.user_preferences = self.services.user_preferences
+        self.admin_panel = self.services.admin_panel
+        self.ical_exporter = self.services.ical_exporter
+        self.clock = self.services.clock
+        
+        builder = (
+            Application.builder()
+            .token(token)
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+            # Обновления разных чатов обрабатываются параллельно, одного чата — по порядку
+            .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        )
+        if base_url:
+            # Другой адрес Bot API: локальный сервер Bot API или тестовый стенд
+            builder = builder.base_url(base_url)
+        self.application = builder.build()
+        self.coordinator = ClusterCoordinator(self.async_db) if CLUSTER_ENABLED else LocalCoordinator()
+        self.broadcast_jobs.coordinator = self.coordinator
+        self.notifier = Notifier(self.application, self.coordinator, self.services)
+        self.metrics_server = None
+        self.calendar_server = None
+        # file_id загруженных файлов календаря: {(группа, ETag): file_id}, повторно файл не загружается
+        self._calendar_files = {}
         setup_logging()
     
+    async def on_startup(self, application: Application):
+        """Загрузка состояния перед началом обработки обновлений"""
+        await self.user_registry.load_async()
+        await self.user_preferences.load_async()
+        # Итоги всех отправок обновляют состояние доставки получателей
+        self.broadcaster.add_delivery_listener(self.user_registry.record_delivery)
+        # Рассылки, прерванные перезапуском, продолжаются с последней контрольной точки
+        # (в кластере этим занимается лидер, см. on_leadership)
+        if not self.coordinator.enabled:
+            await self.broadcast_jobs.resume_pending(application.bot)
+        
+        metrics.gauge("bot_users_active", "Активные получатели рассылок", lambda: len(self.user_registry))
+        if METRICS_ENABLED:
+            self.metrics_server = MetricsServer(metrics, METRICS_LISTEN, METRICS_PORT)
+            await self.metrics_server.start()
+        if CALENDAR_ENABLED:
+            self.calendar_server = CalendarFeedServer(self.ical_exporter, self.async_db, CALENDAR_LISTEN, CALENDAR_PORT)
+            await self.calendar_server.start()
+    
+    async def on_shutdown(self, application: Application):
+        """Сохранение накопленных изменений при остановке"""
+        await self.user_registry.flush_async()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.calendar_server:
+            await self.calendar_server.stop()
+    
     def is_user_admin(self, username: str) -> bool:
         """Проверяет, является ли пользователь администратором"""
-        return admin_panel.is_user_admin(username)
+        return is_admin(username)
     
     def get_main_keyboard(self):
         """Возвращает основную клавиатуру с кнопками"""
@@ -30,17 +102,26 @@ class ScheduleBot:
     def get_admin_keyboard(self):
         """Возвращает клавиатуру для администратора"""
         return get_admin_keyboard()
+    
+    async def get_user_groups(self, user_id: int) -> list:
+        """Группы пользователя; без подписок — группа по умолчанию"""
+        groups = [
+            group for group in self.user_registry.get_user_groups(user_id)
+            if self.schedule_manager.has_group(group)
+        ]
+        return groups or [self.schedule_manager.default_group]
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             user = update.effective_user
-            db.add_user(user.id, user.username, user.first_name, user.last_name)
+            self.user_registry.add_user(user.id, user.username, user.first_name, user.last_name)
             
             welcome_text = (
                 "📚 Бот расписания активирован\n\n"
                 "Я буду присылать:\n"
-                "• 📅 Расписание на завтра каждый день в 21:00\n"
-                "• 🔔 Напоминания за 10 минут до начала занятий\n\n"
+                "• 📅 Расписание на завтра каждый вечер\n"
+                "• 🔔 Напоминания перед началом занятий\n\n"
+                "Время рассылки и напоминаний можно выбрать в /settings\n\n"
                 "Используйте кнопки ниже для навигации:"
             )
             
@@ -68,6 +149,9 @@ class ScheduleBot:
 📆 Завтра - Расписание на завтра
 📅 Неделя - Расписание на всю неделю
 ❓ Помощь - Эта справка
+/group - Выбор учебной группы
+/calendar - Расписание для Google/Apple Календаря (.ics)
+/settings - Время рассылки и напоминаний
 
 Для администраторов:
 ⚙️ Админ-панель - Управление мероприятиями
@@ -90,10 +174,16 @@ class ScheduleBot:
     async def today(self, update: Update, context: ContextTypes.DEFAULT_TYPE = None):
         """Показывает расписание на сегодня"""
         try:
-            current_date = datetime.now()
-            logger.info(f"Запрос расписания на сегодня: {current_date}, день недели: {current_date.weekday()}")
+            current_date = self.schedule_manager.now()
+            logger.info(
+                "Запрос расписания на сегодня: %s, день недели: %s", current_date, current_date.weekday(),
+                extra={"event": "today_request", "user_id": update.effective_user.id}
+            )
             
-            schedule_text = schedule_manager.get_today_schedule()
+            groups = await self.get_user_groups(update.effective_user.id)
+            schedule_text = await self.async_db.run(
+                self.schedule_manager.get_schedules_for_groups, self.schedule_manager.get_today_schedule, groups
+            )
             
             if hasattr(update, 'message') and update.message:
                 user = update.effective_user
@@ -120,7 +210,10 @@ class ScheduleBot:
     async def tomorrow(self, update: Update, context: ContextTypes.DEFAULT_TYPE = None):
         """Показывает расписание на завтра"""
         try:
-            schedule_text = schedule_manager.get_tomorrow_schedule()
+            groups = await self.get_user_groups(update.effective_user.id)
+            schedule_text = await self.async_db.run(
+                self.schedule_manager.get_schedules_for_groups, self.schedule_manager.get_tomorrow_schedule, groups
+            )
             
             if hasattr(update, 'message') and update.message:
                 user = update.effective_user
@@ -147,7 +240,10 @@ class ScheduleBot:
     async def week(self, update: Update, context: ContextTypes.DEFAULT_TYPE = None):
         """Показывает расписание на неделю"""
         try:
-            week_schedule = schedule_manager.get_week_schedule()
+            groups = await self.get_user_groups(update.effective_user.id)
+            week_schedule = await self.async_db.run(
+                self.schedule_manager.get_schedules_for_groups, self.schedule_manager.get_week_schedule, groups
+            )
             
             if hasattr(update, 'message') and update.message:
                 user = update.effective_user
@@ -167,6 +263,136 @@ class ScheduleBot:
             elif hasattr(update, 'callback_query') and update.callback_query:
                 await update.callback_query.message.reply_text(error_msg)
     
+    async def group_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /group: выбор групп для расписания и уведомлений"""
+        try:
+            user = update.effective_user
+            subscribed = set(await self.get_user_groups(user.id))
+            await update.message.reply_text(
+                "👥 Выберите группы, расписание которых хотите получать:",
+                reply_markup=get_groups_keyboard(self.schedule_manager.groups, subscribed)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка в команде /group: {e}")
+            await update.message.reply_text("❌ Не удалось получить список групп.")
+    
+    async def calendar_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /calendar: файл .ics и ссылка на ленту для подписки"""
+        try:
+            for group_id in await self.get_user_groups(update.effective_user.id):
+                feed = await self.async_db.run(self.ical_exporter.feed, group_id)
+                caption = f"📆 {self.schedule_manager.groups.get(group_id, group_id)}: импортируйте файл в календарь"
+                if CALENDAR_URL:
+                    caption += f"\n🔗 Подписка с автообновлением: {CALENDAR_URL}/calendar/{group_id}.ics"
+                
+                cache_key = (group_id, feed.etag)
+                document = self._calendar_files.get(cache_key)
+                if document is None:
+                    document = InputFile(feed.body, filename=f"{group_id}.ics")
+                message = await update.message.reply_document(document, caption=caption)
+                if cache_key not in self._calendar_files and message.document:
+                    self._calendar_files[cache_key] = message.document.file_id
+        except Exception as e:
+            logger.error(f"Ошибка в команде /calendar: {e}")
+            await update.message.reply_text("❌ Не удалось подготовить календарь.")
+    
+    async def handle_group_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Переключение подписки на группу"""
+        query = update.callback_query
+        group_id = query.data[len("group_toggle_"):]
+        
+        if not self.schedule_manager.has_group(group_id):
+            await query.answer("Группа не найдена")
+            return
+        
+        user_id = query.from_user.id
+        current = set(self.user_registry.get_user_groups(user_id))
+        if not current:
+            # Неявная подписка на группу по умолчанию становится явной
+            self.user_registry.set_user_group(user_id, self.schedule_manager.default_group, True)
+            current = {self.schedule_manager.default_group}
+        subscribe = group_id not in current
+        
+        # Без подписок пользователь остается в группе по умолчанию, поэтому последнюю не снимаем
+        if not subscribe and len(current) == 1:
+            await query.answer("Должна остаться хотя бы одна группа")
+            return
+        
+        self.user_registry.set_user_group(user_id, group_id, subscribe)
+        await query.answer("Подписка оформлена" if subscribe else "Подписка отменена")
+        
+        subscribed = set(await self.get_user_groups(user_id))
+        await query.edit_message_reply_markup(
+            reply_markup=get_groups_keyboard(self.schedule_manager.groups, subscribed)
+        )
+    
+    def settings_view(self, user_id: int):
+        """Текст и клавиатура настроек рассылок пользователя"""
+        preferences = self.user_preferences.get(user_id)
+        if preferences.digest_enabled:
+            digest = f"в {format_minute(self.user_preferences.digest_minute(user_id))}"
+            if preferences.digest_minute is None:
+                digest += " (назначено автоматически)"
+        else:
+            digest = "выключено"
+        reminders = f"за {preferences.reminder_lead} мин до занятия" if preferences.reminders_enabled else "выключены"
+        timezone = preferences.timezone or self.clock.default_zone.key
+        text = (
+            "⚙️ Настройки рассылок\n\n"
+            f"📅 Расписание на завтра: {digest}\n"
+            f"🔔 Напоминания: {reminders}\n"
+            f"🌍 Часовой пояс: {TIMEZONE_CHOICES.get(timezone, timezone)} ({timezone})\n\n"
+            "Выберите время рассылки, интервал напоминаний и часовой пояс:"
+        )
+        return text, get_settings_keyboard(
+            preferences, DIGEST_TIME_CHOICES, REMINDER_LEAD_CHOICES, timezone, TIMEZONE_CHOICES
+        )
+    
+    async def settings_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /settings: время рассылки, отключение рассылок, интервал напоминаний"""
+        try:
+            text, keyboard = self.settings_view(update.effective_user.id)
+            await update.message.reply_text(text, reply_markup=keyboard)
+        except Exception as e:
+            logger.error(f"Ошибка в команде /settings: {e}")
+            await update.message.reply_text("❌ Не удалось открыть настройки.")
+    
+    async def handle_settings_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Изменение настроек рассылок"""
+        query = update.callback_query
+        data = query.data
+        user_id = query.from_user.id
+        current = self.user_preferences.get(user_id)
+        
+        if data == "pref_digest_toggle":
+            changes = {"digest_enabled": not current.digest_enabled}
+        elif data == "pref_reminders_toggle":
+            changes = {"reminders_enabled": not current.reminders_enabled}
+        elif data == "pref_digest_time_auto":
+            changes = {"digest_minute": None, "digest_enabled": True}
+        elif data.startswith("pref_digest_time_") and data[len("pref_digest_time_"):] in DIGEST_TIME_CHOICES:
+            changes = {"digest_minute": parse_minute(data[len("pref_digest_time_"):]), "digest_enabled": True}
+        elif data.startswith("pref_lead_") and data[len("pref_lead_"):].isdigit() \
+                and int(data[len("pref_lead_"):]) in REMINDER_LEAD_CHOICES:
+            changes = {"reminder_lead": int(data[len("pref_lead_"):]), "reminders_enabled": True}
+        elif data.startswith("pref_tz_") and data[len("pref_tz_"):] in TIMEZONE_CHOICES:
+            # Пояс по умолчанию не сохраняется: пользователь следует за TIMEZONE
+            zone = data[len("pref_tz_"):]
+            changes = {"timezone": zone if zone != self.clock.default_zone.key else None}
+        else:
+            await query.answer("Настройка недоступна")
+            return
+        
+        updated = await self.user_preferences.update(user_id, **changes)
+        if updated == current:
+            await query.answer()
+            return
+        self.notifier.on_preferences_changed()
+        await query.answer("Настройки сохранены")
+        
+        text, keyboard = self.settings_view(user_id)
+        await query.edit_message_text(text, reply_markup=keyboard)
+    
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /admin"""
         await self.admin(update, context)
@@ -180,7 +406,7 @@ class ScheduleBot:
             return
         
         await update.message.reply_text("🔄 Переход в админ-панель...", reply_markup=ReplyKeyboardRemove())
-        await admin_panel.admin_menu(update, context)
+        await self.admin_panel.admin_menu(update, context)
     
     async def get_my_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает информацию о пользователе"""
@@ -210,13 +436,15 @@ class ScheduleBot:
             user = update.effective_user
             text = update.message.text
             
-            logger.info(f"Получено сообщение от {user.username}: {text}")
+            logger.info(
+                "Получено сообщение от %s: %s", user.username, text,
+                extra={"event": "message_received", "user_id": user.id}
+            )
             
             # Сначала проверяем, находится ли пользователь в диалоге с админ-панелью
-            if self.is_user_admin(user.username):
-                if user.id in admin_panel.waiting_for_event_data or user.id in admin_panel.waiting_for_broadcast:
-                    await admin_panel.handle_admin_message(update, context)
-                    return
+            if self.is_user_admin(user.username) and await self.admin_panel.has_pending_dialog(user.id):
+                await self.admin_panel.handle_admin_message(update, context)
+                return
             
             # Затем обрабатываем обычные команды
             if text == "📅 Сегодня":
@@ -243,10 +471,18 @@ class ScheduleBot:
         """Обработчик callback запросов от инлайн-кнопок"""
         try:
             query = update.callback_query
+            
+            if query.data and query.data.startswith("group_toggle_"):
+                await self.handle_group_callback(update, context)
+                return
+            if query.data and query.data.startswith("pref_"):
+                await self.handle_settings_callback(update, context)
+                return
+            
             await query.answer()
             
             # Передаем обработку в админ-панель
-            await admin_panel.handle_admin_callback(update, context)
+            await self.admin_panel.handle_admin_callback(update, context)
         except Exception as e:
             logger.error(f"Ошибка в handle_callback_query: {e}")
             try:
@@ -254,25 +490,138 @@ class ScheduleBot:
             except:
                 pass
     
+    async def handle_my_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Отслеживает блокировку и разблокировку бота пользователем"""
+        member_update = update.my_chat_member
+        if member_update.chat.type != "private":
+            return
+        
+        status = member_update.new_chat_member.status
+        if status in (ChatMember.BANNED, ChatMember.LEFT):
+            self.user_registry.set_delivery_status(member_update.chat.id, USER_STATUS_BLOCKED)
+        elif status == ChatMember.MEMBER:
+            self.user_registry.set_delivery_status(member_update.chat.id, USER_STATUS_ACTIVE)
+    
     def setup_handlers(self):
         """Настраивает обработчики команд"""
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("today", self.today_command))
-        self.application.add_handler(CommandHandler("tomorrow", self.tomorrow_command))
-        self.application.add_handler(CommandHandler("week", self.week_command))
-        self.application.add_handler(CommandHandler("admin", self.admin_command))
-        self.application.add_handler(CommandHandler("myinfo", self.get_my_info))
+        # Каждый обработчик измеряется: длительность и необработанные исключения
+        timed = instrument_handler
+        self.application.add_handler(CommandHandler("start", timed("start", self.start)))
+        self.application.add_handler(CommandHandler("help", timed("help", self.help_command)))
+        self.application.add_handler(CommandHandler("today", timed("today", self.today_command)))
+        self.application.add_handler(CommandHandler("tomorrow", timed("tomorrow", self.tomorrow_command)))
+        self.application.add_handler(CommandHandler("week", timed("week", self.week_command)))
+        self.application.add_handler(CommandHandler("group", timed("group", self.group_command)))
+        self.application.add_handler(CommandHandler("calendar", timed("calendar", self.calendar_command)))
+        self.application.add_handler(CommandHandler("settings", timed("settings", self.settings_command)))
+        self.application.add_handler(CommandHandler("admin", timed("admin", self.admin_command)))
+        self.application.add_handler(CommandHandler("myinfo", timed("myinfo", self.get_my_info)))
         
-        self.application.add_handler(CallbackQueryHandler(self.handle_callback_query))
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text_message))
+        self.application.add_handler(CallbackQueryHandler(timed("callback_query", self.handle_callback_query)))
+        self.application.add_handler(ChatMemberHandler(
+            timed("my_chat_member", self.handle_my_chat_member), ChatMemberHandler.MY_CHAT_MEMBER
+        ))
+        self.application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND, timed("text_message", self.handle_text_message)
+        ))
     
     def run(self):
         """Запускает бота"""
         self.setup_handlers()
         self.notifier.setup_jobs()
         
-        logger.info("Бот успешно запущен")
+        logger.info(f"Бот успешно запущен (режим: {BOT_MODE})")
         print("🤖 Бот запущен и готов к работе!")
         
-        self.application.run_polling()
\ No newline at end of file
+        if CLUSTER_ENABLED:
+            asyncio.run(self.run_cluster())
+        elif BOT_MODE == "webhook":
+            asyncio.run(self.run_webhook())
+        else:
+            # run_polling сам удаляет установленный ранее webhook
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+    
+    async def run_webhook(self):
+        """Работа в режиме webhook через локальный HTTP-сервер"""
+        if not WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL не задан для режима webhook")
+        
+        server = WebhookServer(
+            self.application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+        )
+        stop_event = self._stop_event()
+        
+        async with self.application:
+            # post_init/post_shutdown вызываются только run_polling/run_webhook, здесь — вручную
+            await self.on_startup(self.application)
+            await self.application.start()
+            await server.start()
+            await self.application.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=server.secret_token,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Webhook установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+            
+            try:
+                await stop_event.wait()
+            finally:
+                await server.stop()
+                await self.application.stop()
+                await self.on_shutdown(self.application)
+    
+    def _stop_event(self) -> asyncio.Event:
+        """Событие остановки по SIGINT/SIGTERM"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        return stop_event
+    
+    async def run_cluster(self):
+        """Работа одним из процессов кластера: обновления проходят через общую очередь в БД"""
+        worker = ClusterWorker(self.application, self.coordinator, on_leadership=self.on_leadership)
+        server = None
+        if BOT_MODE == "webhook":
+            # Webhook принимает любой процесс за балансировщиком, поэтому токен должен быть общим
+            if not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN:
+                raise ValueError("Для кластера в режиме webhook нужны WEBHOOK_URL и WEBHOOK_SECRET_TOKEN")
+            server = WebhookServer(
+                self.application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN,
+                on_update=lambda update: worker.enqueue([update])
+            )
+        stop_event = self._stop_event()
+        
+        async with self.application:
+            await self.on_startup(self.application)
+            await self.application.start()
+            if server:
+                await server.start()
+            logger.info(f"🧩 Процесс кластера {self.coordinator.worker_id} запущен")
+            
+            try:
+                await worker.run(stop_event, polling=BOT_MODE == "polling")
+            finally:
+                if server:
+                    await server.stop()
+                await self.application.stop()
+                await self.on_shutdown(self.application)
+                await self.coordinator.shutdown()
+    
+    async def on_leadership(self, bot):
+        """Действия процесса, ставшего лидером кластера"""
+        if BOT_MODE == "webhook":
+            await bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            # getUpdates не работает, пока установлен webhook
+            await bot.delete_webhook()
+        await self.broadcast_jobs.resume_pending(bot)
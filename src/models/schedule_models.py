@@ -1,24 +1,40 @@
 # models/schedule_models.py
+from datetime import datetime, time
+
+
+def parse_time(value: str) -> time:
+    """Разбирает время в формате Ч:ММ или ЧЧ:ММ"""
+    return datetime.strptime(value, "%H:%M").time()
+
+
 class Subject:
     """Класс для представления одного занятия"""
+    __slots__ = ("name", "room", "start_time", "end_time", "lesson_type", "start", "end")
+
     def __init__(self, name: str, room: str, start_time: str, end_time: str, lesson_type: str):
         self.name = name
         self.room = room
         self.start_time = start_time
         self.end_time = end_time
         self.lesson_type = lesson_type
-    
+        # Разобранное время: сравнения и вычисления без повторного strptime
+        self.start = parse_time(start_time)
+        self.end = parse_time(end_time)
+
     def __str__(self):
         return f"{self.name} {self.room} {self.start_time} - {self.end_time} ({self.lesson_type})"
 
 class DaySchedule:
     """Класс для представления расписания на один день"""
+    __slots__ = ("day_name", "subjects")
+
     def __init__(self, day_name: str, subjects: list):
         self.day_name = day_name
-        self.subjects = subjects
-    
+        # Неизменяемый кортеж, отсортированный по времени начала
+        self.subjects = tuple(sorted(subjects, key=lambda subject: subject.start))
+
     def __str__(self):
         result = f"{self.day_name}\n"
         for i, subject in enumerate(self.subjects, 1):
             result += f"{subject}\n"
-        return result
\ No newline at end of file
+        return result
@@ -1,7 +1,17 @@
 # services/__init__.py
-from .database import db
-from .schedule_manager import schedule_manager
-from .notifier import Notifier
-from .admin_panel import admin_panel
+# Пакет ничего не импортирует заранее: импорт одного сервиса не тянет за собой остальные.
+# Экземпляры сервисов создаются контейнером приложения при первом обращении (см. src/container.py)
+from src.container import legacy_attribute
 
-__all__ = ['db', 'schedule_manager', 'Notifier', 'admin_panel']
\ No newline at end of file
+_legacy_attribute = legacy_attribute(__name__, {
+    'db': 'database', 'async_db': 'async_database',
+    'schedule_manager': 'schedule_manager', 'admin_panel': 'admin_panel'
+})
+
+def __getattr__(name):
+    if name == 'Notifier':
+        from .notifier import Notifier
+        return Notifier
+    return _legacy_attribute(name)
+
+__all__ = ['db', 'async_db', 'schedule_manager', 'Notifier', 'admin_panel']
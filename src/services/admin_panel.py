@@ -4,23 +4,93 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
-from src.services.database import db
+from src.services.database import AsyncDatabase, BROADCAST_ACTIVE_STATUSES
+from src.services.broadcast_jobs import BroadcastJobManager
+from src.services.user_registry import UserRegistry
+from src.services.schedule_manager import ScheduleManager
+from src.services.state_store import StateStore
+from src.services.clock import Clock
+from src.container import container, legacy_attribute
 from src.utils.config import ADMIN_USERNAME_LIST
+from src.utils.helpers import validate_date
 from src.utils.keyboards import get_admin_menu_keyboard
+from src.utils.markups import (
+    BACK_BUTTON, BACK_TO_MENU_MARKUP, CANCEL_TO_MENU_MARKUP, TO_MENU_MARKUP, reply_keyboard_for
+)
+from src.utils.roles import is_admin
 
 logger = logging.getLogger(__name__)
 
+# Пространство имен диалогов админ-панели в хранилище состояния
+DIALOG_NAMESPACE = "admin_dialog"
+# Фильтр списка мероприятий администратора: {"start": ..., "end": ..., "subject": ...}
+EVENT_FILTER_NAMESPACE = "admin_event_filter"
+# Мероприятий на одной странице списка
+EVENTS_PAGE_SIZE = 10
+# Режимы списка мероприятий в callback_data: просмотр и выбор для удаления
+EVENTS_VIEW = "l"
+EVENTS_DELETE = "d"
+
+
+def parse_event_filter(text: str) -> dict:
+    """Фильтр мероприятий из ввода «[ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [предмет]»; «-» — без фильтра"""
+    tokens = text.split()
+    if tokens == ["-"]:
+        return {}
+    
+    dates = []
+    while tokens and len(dates) < 2 and validate_date(tokens[0]):
+        dates.append(tokens.pop(0))
+    
+    event_filter = {}
+    if dates:
+        event_filter["start"] = dates[0]
+    if len(dates) > 1:
+        if dates[1] < dates[0]:
+            raise ValueError("Конец периода раньше начала")
+        event_filter["end"] = dates[1]
+    if tokens:
+        event_filter["subject"] = " ".join(tokens)
+    if not event_filter:
+        raise ValueError("Фильтр пуст")
+    return event_filter
+
 class AdminPanel:
-    def __init__(self):
-        self.waiting_for_event_data = {}
-        self.waiting_for_broadcast = set()
+    def __init__(self, store: StateStore = None, async_database: AsyncDatabase = None,
+                 broadcast_jobs: BroadcastJobManager = None, user_registry: UserRegistry = None,
+                 schedule_manager: ScheduleManager = None, clock: Clock = None):
+        # Текущий диалог администратора: {"dialog": "add_event" | "broadcast" | "event_filter", ...}
+        self.dialogs = store if store is not None else container.state_store
+        # Не переданные зависимости берутся из контейнера приложения
+        self.async_db = async_database if async_database is not None else container.async_database
+        self.broadcast_jobs = broadcast_jobs if broadcast_jobs is not None else container.broadcast_jobs
+        self.user_registry = user_registry if user_registry is not None else container.user_registry
+        self.schedule_manager = schedule_manager if schedule_manager is not None else container.schedule_manager
+        self.clock = clock if clock is not None else container.clock
+    
+    async def get_dialog(self, user_id: int):
+        return await self.dialogs.get(DIALOG_NAMESPACE, user_id)
+    
+    async def has_pending_dialog(self, user_id: int) -> bool:
+        """Ожидает ли админ-панель текстового ответа от пользователя"""
+        return await self.get_dialog(user_id) is not None
+    
+    async def _save_dialog(self, user_id: int, dialog: dict):
+        await self.dialogs.set(DIALOG_NAMESPACE, user_id, dialog)
+    
+    async def _clear_dialog(self, user_id: int):
+        await self.dialogs.delete(DIALOG_NAMESPACE, user_id)
+    
+    def _local_time(self, value: str) -> str:
+        """Время из БД (UTC) в поясе по умолчанию"""
+        try:
+            return self.clock.from_utc_text(value).strftime("%Y-%m-%d %H:%M")
+        except (TypeError, ValueError):
+            return str(value)
     
     def is_user_admin(self, username: str) -> bool:
         """Проверяет, является ли пользователь администратором"""
-        if not username:
-            return False
-        clean_username = username.lstrip('@')
-        return clean_username in ADMIN_USERNAME_LIST
+        return is_admin(username)
     
     async def admin_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Главное меню админ-панели"""
@@ -66,10 +136,7 @@ class AdminPanel:
             
             # Очищаем состояние ожидания при любом возврате в меню или отмене
             if data in ["admin_back_to_menu", "admin_back_to_schedule"]:
-                if user.id in self.waiting_for_event_data:
-                    del self.waiting_for_event_data[user.id]
-                if user.id in self.waiting_for_broadcast:
-                    self.waiting_for_broadcast.discard(user.id)
+                await self._clear_dialog(user.id)
             
             if data == "admin_list_events":
                 await self._list_events(update, context)
@@ -81,6 +148,23 @@ class AdminPanel:
                 await self._list_admins(update, context)
             elif data == "admin_broadcast_message":
                 await self._start_broadcast_message(update, context)
+            elif data == "admin_broadcast_jobs":
+                await self._list_broadcast_jobs(update, context)
+            elif data.startswith("cancel_broadcast_"):
+                job_id = int(data.split("_")[2])
+                await self._cancel_broadcast_job(update, context, job_id)
+            elif data.startswith("events_page_"):
+                _, _, mode, direction, date, event_id = data.split("_")
+                key = (date, int(event_id))
+                if direction == "n":
+                    await self._show_events(update, mode, after=key)
+                else:
+                    await self._show_events(update, mode, before=key)
+            elif data.startswith("events_filter_reset_"):
+                await self.dialogs.delete(EVENT_FILTER_NAMESPACE, user.id)
+                await self._show_events(update, data.split("_")[3])
+            elif data.startswith("events_filter_"):
+                await self._start_event_filter(update, context, data.split("_")[2])
             elif data.startswith("delete_event_"):
                 event_id = int(data.split("_")[2])
                 await self._confirm_delete_event(update, context, event_id)
@@ -101,39 +185,114 @@ class AdminPanel:
                 pass
     
     async def _list_events(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показать список всех контрольных мероприятий"""
+        """Показать первую страницу контрольных мероприятий"""
+        await self._show_events(update, EVENTS_VIEW)
+    
+    async def _show_events(self, update: Update, mode: str, after: tuple = None, before: tuple = None):
+        """Показать страницу мероприятий: после ключа after, перед ключом before или первую"""
         try:
             query = update.callback_query
-            events = db.get_all_control_events()
-            
-            if not events:
-                await query.edit_message_text(
-                    "📋 Список контрольных мероприятий пуст",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")]
-                    ])
-                )
-                return
-            
-            events_text = "📋 Все контрольные мероприятия:\n\n"
-            for event in events:
-                event_id, date, subject, event_type, created_by = event
-                events_text += f"🆔 ID: {event_id}\n"
-                events_text += f"📅 Дата: {date}\n"
-                events_text += f"📚 Предмет: {subject}\n"
-                events_text += f"🎯 Тип: {event_type}\n"
-                events_text += f"👤 Добавил: {created_by or 'Неизвестно'}\n"
-                events_text += "─" * 30 + "\n"
+            text, reply_markup = await self._render_events_page(query.from_user.id, mode, after, before)
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.error(f"Ошибка в _show_events: {e}")
+            await update.callback_query.edit_message_text("❌ Ошибка при получении списка мероприятий")
+    
+    async def _render_events_page(self, user_id: int, mode: str, after: tuple = None, before: tuple = None):
+        """Текст и клавиатура страницы мероприятий с учетом фильтра администратора.
+        
+        Из БД читается только показываемая страница; кнопки листания несут ключ
+        (дата, id) крайней строки, от которого продолжится выборка.
+        """
+        event_filter = await self.dialogs.get(EVENT_FILTER_NAMESPACE, user_id) or {}
+        events, has_more = await self.async_db.get_control_events_page(
+            EVENTS_PAGE_SIZE, after, before,
+            event_filter.get("start"), event_filter.get("end"), event_filter.get("subject")
+        )
+        if not events and (after is not None or before is not None):
+            # Соседние мероприятия успели удалить — показываем начало списка
+            return await self._render_events_page(user_id, mode)
+        
+        if before is not None:
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = after is not None, has_more
+        
+        if mode == EVENTS_DELETE:
+            text = "❌ Выберите мероприятие для удаления:\n"
+        else:
+            text = "📋 Контрольные мероприятия:\n"
+        if event_filter:
+            text += f"{self._describe_event_filter(event_filter)}\n"
+        text += "\n"
+        
+        keyboard = []
+        if not events:
+            text += "Мероприятий не найдено" if event_filter else "Список контрольных мероприятий пуст"
+        for event in events:
+            event_id, date, subject, event_type, created_by, group_id = event
+            if mode == EVENTS_DELETE:
+                keyboard.append([
+                    InlineKeyboardButton(f"❌ {date} - {subject}", callback_data=f"delete_event_{event_id}")
+                ])
+                continue
+            text += f"🆔 ID: {event_id}\n"
+            text += f"📅 Дата: {date}\n"
+            text += f"📚 Предмет: {subject}\n"
+            text += f"🎯 Тип: {event_type}\n"
+            text += f"👥 Группа: {self._group_title(group_id)}\n"
+            text += f"👤 Добавил: {created_by or 'Неизвестно'}\n"
+            text += "─" * 30 + "\n"
+        
+        navigation = []
+        if has_previous:
+            first = events[0]
+            navigation.append(InlineKeyboardButton(
+                "⬅️ Раньше", callback_data=f"events_page_{mode}_p_{first[1]}_{first[0]}"
+            ))
+        if has_next:
+            last = events[-1]
+            navigation.append(InlineKeyboardButton(
+                "Позже ➡️", callback_data=f"events_page_{mode}_n_{last[1]}_{last[0]}"
+            ))
+        if navigation:
+            keyboard.append(navigation)
+        
+        filter_row = [InlineKeyboardButton("🔍 Фильтр", callback_data=f"events_filter_{mode}")]
+        if event_filter:
+            filter_row.append(InlineKeyboardButton("♻️ Сбросить фильтр", callback_data=f"events_filter_reset_{mode}"))
+        keyboard.append(filter_row)
+        keyboard.append([BACK_BUTTON])
+        return text, InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def _describe_event_filter(event_filter: dict) -> str:
+        parts = []
+        if event_filter.get("start") or event_filter.get("end"):
+            parts.append(f"📅 {event_filter.get('start') or '…'} — {event_filter.get('end') or '…'}")
+        if event_filter.get("subject"):
+            parts.append(f"📚 «{event_filter['subject']}»")
+        return "🔍 Фильтр: " + ", ".join(parts)
+    
+    async def _start_event_filter(self, update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str):
+        """Начать ввод фильтра списка мероприятий"""
+        try:
+            query = update.callback_query
+            await self._save_dialog(query.from_user.id, {"dialog": "event_filter", "mode": mode})
             
             await query.edit_message_text(
-                events_text,
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")]
-                ])
+                "🔍 Фильтр мероприятий\n\n"
+                "Введите период и/или часть названия предмета:\n"
+                "• 2024-01-01 2024-01-31 — мероприятия за январь\n"
+                "• 2024-01-01 — начиная с даты\n"
+                "• 2024-01-01 2024-06-30 физика — по предмету за период\n"
+                "• физика — по предмету за все время\n"
+                "• - — без фильтра",
+                reply_markup=CANCEL_TO_MENU_MARKUP
             )
         except Exception as e:
-            logger.error(f"Ошибка в _list_events: {e}")
-            await update.callback_query.edit_message_text("❌ Ошибка при получении списка мероприятий")
+            logger.error(f"Ошибка в _start_event_filter: {e}")
+            await update.callback_query.edit_message_text("❌ Ошибка при настройке фильтра")
     
     async def _list_admins(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показывает список администраторов"""
@@ -143,9 +302,7 @@ class AdminPanel:
             if not ADMIN_USERNAME_LIST:
                 await query.edit_message_text(
                     "❌ Нет назначенных администраторов",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")]
-                    ])
+                    reply_markup=BACK_TO_MENU_MARKUP
                 )
                 return
             
@@ -158,9 +315,7 @@ class AdminPanel:
             
             await query.edit_message_text(
                 admin_info,
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")]
-                ])
+                reply_markup=BACK_TO_MENU_MARKUP
             )
         except Exception as e:
             logger.error(f"Ошибка в _list_admins: {e}")
@@ -173,14 +328,12 @@ class AdminPanel:
             
             # Сохраняем состояние для этого пользователя
             user_id = query.from_user.id
-            self.waiting_for_event_data[user_id] = {"step": "waiting_for_date"}
+            await self._save_dialog(user_id, {"dialog": "add_event", "step": "waiting_for_date"})
             
             await query.edit_message_text(
                 "➕ Добавление контрольного мероприятия\n\n"
                 "Введите дату в формате ГГГГ-ММ-ДД (например, 2024-01-20):",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Отмена", callback_data="admin_back_to_menu")]
-                ])
+                reply_markup=CANCEL_TO_MENU_MARKUP
             )
         except Exception as e:
             logger.error(f"Ошибка в _start_add_event: {e}")
@@ -193,14 +346,12 @@ class AdminPanel:
             
             # Добавляем пользователя в состояние ожидания рассылки
             user_id = query.from_user.id
-            self.waiting_for_broadcast.add(user_id)
+            await self._save_dialog(user_id, {"dialog": "broadcast"})
             
             await query.edit_message_text(
                 "📢 Отправка сообщения всем пользователям\n\n"
                 "Введите текст сообщения, которое будет отправлено всем пользователям бота:",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Отмена", callback_data="admin_back_to_menu")]
-                ])
+                reply_markup=CANCEL_TO_MENU_MARKUP
             )
         except Exception as e:
             logger.error(f"Ошибка в _start_broadcast_message: {e}")
@@ -208,62 +359,26 @@ class AdminPanel:
     
     async def _start_delete_event(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начать процесс удаления мероприятия"""
-        try:
-            query = update.callback_query
-            events = db.get_all_control_events()
-            
-            if not events:
-                await query.edit_message_text(
-                    "❌ Нет мероприятий для удаления",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")]
-                    ])
-                )
-                return
-            
-            keyboard = []
-            for event in events:
-                event_id, date, subject, event_type, _ = event
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"❌ {date} - {subject}",
-                        callback_data=f"delete_event_{event_id}"
-                    )
-                ])
-            
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")])
-            
-            await query.edit_message_text(
-                "❌ Выберите мероприятие для удаления:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        except Exception as e:
-            logger.error(f"Ошибка в _start_delete_event: {e}")
-            await update.callback_query.edit_message_text("❌ Ошибка при получении списка мероприятий для удаления")
+        await self._show_events(update, EVENTS_DELETE)
     
     async def _confirm_delete_event(self, update: Update, context: ContextTypes.DEFAULT_TYPE, event_id: int):
         """Подтверждение удаления мероприятия"""
         try:
             query = update.callback_query
-            events = db.get_all_control_events()
-            event_to_delete = None
-            
-            for event in events:
-                if event[0] == event_id:
-                    event_to_delete = event
-                    break
+            event_to_delete = await self.async_db.get_control_event_by_id(event_id)
             
             if not event_to_delete:
                 await query.edit_message_text("❌ Мероприятие не найдено")
                 return
             
-            _, date, subject, event_type, _ = event_to_delete
+            _, date, subject, event_type, _, group_id = event_to_delete
             
             await query.edit_message_text(
                 f"⚠️ Подтвердите удаление:\n\n"
                 f"📅 Дата: {date}\n"
                 f"📚 Предмет: {subject}\n"
-                f"🎯 Тип: {event_type}\n\n"
+                f"🎯 Тип: {event_type}\n"
+                f"👥 Группа: {self._group_title(group_id)}\n\n"
                 f"Вы уверены, что хотите удалить это мероприятие?",
                 reply_markup=InlineKeyboardMarkup([
                     [
@@ -281,19 +396,15 @@ class AdminPanel:
         try:
             query = update.callback_query
             
-            if db.delete_control_event(event_id):
+            if await self.async_db.delete_control_event(event_id):
                 await query.edit_message_text(
                     "✅ Мероприятие успешно удалено",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⬅️ В меню", callback_data="admin_back_to_menu")]
-                    ])
+                    reply_markup=TO_MENU_MARKUP
                 )
             else:
                 await query.edit_message_text(
                     "❌ Ошибка при удалении мероприятия",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⬅️ В меню", callback_data="admin_back_to_menu")]
-                    ])
+                    reply_markup=TO_MENU_MARKUP
                 )
         except Exception as e:
             logger.error(f"Ошибка в _execute_delete_event: {e}")
@@ -302,77 +413,170 @@ class AdminPanel:
     async def _execute_broadcast_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Выполнить рассылку сообщения всем пользователям"""
         try:
-            users = db.get_all_users()
+            users = self.user_registry.get_all_users()
             
             if not users:
                 await update.message.reply_text("❌ Нет пользователей для рассылки")
                 return
             
-            success_count = 0
-            fail_count = 0
-            
             # Отправляем сообщение о начале рассылки
             progress_msg = await update.message.reply_text("🔄 Начинаю рассылку сообщения...")
             
-            for user_id in users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=f"📢 Объявление от администратора:\n\n{message_text}"
-                    )
-                    success_count += 1
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-                    fail_count += 1
+            async def report_progress(result):
+                await progress_msg.edit_text(
+                    f"🔄 Рассылка #{job_id}: {result.processed}/{result.total}\n"
+                    f"✅ Успешно: {result.success}\n"
+                    f"❌ Не удалось: {result.failed}"
+                )
             
-            report_text = (
-                f"📊 Результат рассылки:\n"
-                f"✅ Успешно: {success_count}\n"
-                f"❌ Не удалось: {fail_count}\n"
-                f"👥 Всего пользователей: {len(users)}"
+            job_id = await self.broadcast_jobs.submit(
+                "admin",
+                f"📢 Объявление от администратора:\n\n{message_text}",
+                users,
+                created_by=update.effective_user.username
             )
+            if job_id is None:
+                await progress_msg.edit_text("❌ Не удалось создать задание рассылки")
+                return
             
-            await progress_msg.edit_text(report_text)
+            # Рассылка идет в фоне: обработка обновлений других пользователей не ждет ее окончания
+            task = self.broadcast_jobs.start(context.bot, job_id, progress_callback=report_progress)
+            context.application.create_task(
+                self._report_broadcast(task, progress_msg, job_id, len(users)), update=update
+            )
             
         except Exception as e:
             logger.error(f"Ошибка при рассылке сообщений: {e}")
             await update.message.reply_text("❌ Произошла ошибка при рассылке")
     
+    async def _report_broadcast(self, task, progress_msg, job_id: int, total_users: int):
+        """Дожидается фоновой рассылки и показывает итоги"""
+        try:
+            result = await task
+            report_text = (
+                f"📊 Результат рассылки #{job_id}:\n"
+                f"✅ Успешно: {result.success}\n"
+                f"❌ Не удалось: {result.failed}\n"
+                f"🚫 Исключены из рассылок: {result.unreachable}\n"
+                f"👥 Всего пользователей: {total_users}\n"
+                f"⏱ Время: {result.elapsed:.1f} с ({result.rate:.1f} сообщ./с)"
+            )
+            await progress_msg.edit_text(report_text)
+        except Exception as e:
+            logger.error(f"Ошибка фоновой рассылки #{job_id}: {e}")
+            try:
+                await progress_msg.edit_text(f"❌ Ошибка рассылки #{job_id}, ход можно посмотреть в «📤 Ход рассылок»")
+            except TelegramError:
+                pass
+    
+    async def _list_broadcast_jobs(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать ход последних рассылок"""
+        try:
+            query = update.callback_query
+            jobs = await self.async_db.get_broadcast_jobs(limit=5)
+            
+            status_titles = {
+                "pending": "⏳ В очереди",
+                "running": "🔄 Выполняется",
+                "done": "✅ Завершена",
+                "cancelled": "⛔ Отменена",
+            }
+            keyboard = []
+            if not jobs:
+                jobs_text = "📤 Рассылок пока не было"
+            else:
+                jobs_text = "📤 Последние рассылки:\n\n"
+                for job in jobs:
+                    processed = job["success"] + job["failed"]
+                    jobs_text += f"🆔 #{job['id']} ({job['kind']})\n"
+                    jobs_text += f"📌 {status_titles.get(job['status'], job['status'])}\n"
+                    jobs_text += f"📊 {processed}/{job['total']}: ✅ {job['success']}, ❌ {job['failed']}\n"
+                    jobs_text += f"🕒 {self._local_time(job['created_at'])}\n"
+                    jobs_text += "─" * 30 + "\n"
+                    if job["status"] in BROADCAST_ACTIVE_STATUSES:
+                        keyboard.append([InlineKeyboardButton(
+                            f"⛔ Отменить #{job['id']}", callback_data=f"cancel_broadcast_{job['id']}"
+                        )])
+            
+            keyboard.append([InlineKeyboardButton("🔄 Обновить", callback_data="admin_broadcast_jobs")])
+            keyboard.append([BACK_BUTTON])
+            try:
+                await query.edit_message_text(jobs_text, reply_markup=InlineKeyboardMarkup(keyboard))
+            except TelegramError as e:
+                # Повторное нажатие «Обновить» без изменений — не ошибка
+                if "not modified" not in str(e).lower():
+                    raise
+        except Exception as e:
+            logger.error(f"Ошибка в _list_broadcast_jobs: {e}")
+            await update.callback_query.edit_message_text("❌ Ошибка при получении списка рассылок")
+    
+    async def _cancel_broadcast_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE, job_id: int):
+        """Отменить рассылку"""
+        try:
+            query = update.callback_query
+            if await self.broadcast_jobs.cancel(job_id):
+                logger.info(f"Рассылка #{job_id} отменена администратором {update.effective_user.username}")
+            await self._list_broadcast_jobs(update, context)
+        except Exception as e:
+            logger.error(f"Ошибка в _cancel_broadcast_job: {e}")
+            await update.callback_query.edit_message_text("❌ Ошибка при отмене рассылки")
+    
     async def _back_to_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Вернуться к основному расписанию"""
         try:
             query = update.callback_query
             
             # Очищаем состояние ожидания при возврате к расписанию
-            user_id = query.from_user.id
-            if user_id in self.waiting_for_event_data:
-                del self.waiting_for_event_data[user_id]
-            if user_id in self.waiting_for_broadcast:
-                self.waiting_for_broadcast.discard(user_id)
+            await self._clear_dialog(query.from_user.id)
             
             await query.edit_message_text("🔄 Возврат к основному расписанию...")
             
-            # Импортируем здесь, чтобы избежать циклического импорта
-            from src.handlers.user_handlers import ScheduleBot
-            
-            # Создаем временный экземпляр бота для доступа к методам клавиатуры
-            temp_bot = ScheduleBot("dummy_token")
-            user = query.from_user
-            
-            if self.is_user_admin(user.username):
-                keyboard = temp_bot.get_admin_keyboard()
-            else:
-                keyboard = temp_bot.get_main_keyboard()
-            
             await context.bot.send_message(
                 chat_id=query.message.chat_id,
                 text="Вы вернулись в главное меню. Используйте кнопки ниже:",
-                reply_markup=keyboard
+                reply_markup=reply_keyboard_for(self.is_user_admin(query.from_user.username))
             )
         except Exception as e:
             logger.error(f"Ошибка в _back_to_schedule: {e}")
             await update.callback_query.edit_message_text("❌ Ошибка при возврате к расписанию")
     
+    def _group_title(self, group_id) -> str:
+        """Название группы мероприятия для отображения"""
+        if group_id is None:
+            return "все группы"
+        return self.schedule_manager.groups.get(group_id, group_id)
+    
+    async def _save_event(self, update: Update, context: ContextTypes.DEFAULT_TYPE, step_data: dict):
+        """Сохраняет введенное мероприятие и возвращает в меню"""
+        user = update.effective_user
+        group_id = step_data.get("group_id")
+        
+        # Сохраняем мероприятие в БД
+        event_id = await self.async_db.add_control_event(
+            step_data["date"],
+            step_data["subject"],
+            step_data["event_type"],
+            user.username,
+            group_id
+        )
+        
+        if event_id:
+            await update.message.reply_text(
+                f"✅ Мероприятие успешно добавлено!\n\n"
+                f"📅 Дата: {step_data['date']}\n"
+                f"📚 Предмет: {step_data['subject']}\n"
+                f"🎯 Тип: {step_data['event_type']}\n"
+                f"👥 Группа: {self._group_title(group_id)}"
+            )
+        else:
+            await update.message.reply_text("❌ Ошибка при добавлении мероприятия в базу данных")
+        
+        # Очищаем состояние
+        await self._clear_dialog(user.id)
+        
+        # Возвращаем в админ-меню
+        await self.admin_menu(update, context)
+    
     async def handle_admin_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик сообщений для админ-панели"""
         try:
@@ -385,24 +589,46 @@ class AdminPanel:
             user_id = user.id
             message_text = update.message.text
             
+            dialog = await self.get_dialog(user_id)
+            if dialog is None:
+                return
+            
             # Если пользователь в состоянии рассылки
-            if user_id in self.waiting_for_broadcast:
+            if dialog["dialog"] == "broadcast":
                 # Удаляем из состояния рассылки
-                self.waiting_for_broadcast.discard(user_id)
+                await self._clear_dialog(user_id)
                 # Выполняем рассылку
                 await self._execute_broadcast_message(update, context, message_text)
                 # Возвращаем в меню
                 await self.admin_menu(update, context)
                 return
             
+            # Если пользователь вводит фильтр списка мероприятий
+            if dialog["dialog"] == "event_filter":
+                try:
+                    event_filter = parse_event_filter(message_text)
+                except ValueError as e:
+                    await update.message.reply_text(f"❌ {e}. Введите фильтр еще раз:")
+                    return
+                
+                await self._clear_dialog(user_id)
+                if event_filter:
+                    await self.dialogs.set(EVENT_FILTER_NAMESPACE, user_id, event_filter)
+                else:
+                    await self.dialogs.delete(EVENT_FILTER_NAMESPACE, user_id)
+                
+                text, reply_markup = await self._render_events_page(user_id, dialog["mode"])
+                await update.message.reply_text(text, reply_markup=reply_markup)
+                return
+            
             # Если пользователь в процессе добавления мероприятия
-            if user_id in self.waiting_for_event_data:
-                step_data = self.waiting_for_event_data[user_id]
+            if dialog["dialog"] == "add_event":
+                step_data = dialog
                 
                 # Проверяем, не хочет ли пользователь отменить операцию
                 if message_text.lower() in ['отмена', 'cancel', 'назад']:
                     # Очищаем состояние
-                    del self.waiting_for_event_data[user_id]
+                    await self._clear_dialog(user_id)
                     await update.message.reply_text("❌ Добавление мероприятия отменено.")
                     await self.admin_menu(update, context)
                     return
@@ -413,6 +639,7 @@ class AdminPanel:
                         datetime.strptime(message_text, "%Y-%m-%d")
                         step_data["date"] = message_text
                         step_data["step"] = "waiting_for_subject"
+                        await self._save_dialog(user_id, step_data)
                         await update.message.reply_text("📚 Теперь введите название предмета:")
                     except ValueError:
                         await update.message.reply_text("❌ Неверный формат даты. Используйте ГГГГ-ММ-ДД:")
@@ -424,6 +651,7 @@ class AdminPanel:
                     
                     step_data["subject"] = message_text.strip()
                     step_data["step"] = "waiting_for_event_type"
+                    await self._save_dialog(user_id, step_data)
                     await update.message.reply_text("🎯 Теперь введите тип мероприятия (например, 'контрольная работа', 'домашняя работа'):")
                 
                 elif step_data["step"] == "waiting_for_event_type":
@@ -433,32 +661,34 @@ class AdminPanel:
                     
                     step_data["event_type"] = message_text.strip()
                     
-                    # Сохраняем мероприятие в БД
-                    event_id = db.add_control_event(
-                        step_data["date"],
-                        step_data["subject"],
-                        step_data["event_type"],
-                        user.username
-                    )
-                    
-                    if event_id:
+                    # При нескольких группах уточняем, к какой относится мероприятие
+                    if len(self.schedule_manager.groups) > 1:
+                        step_data["step"] = "waiting_for_group"
+                        await self._save_dialog(user_id, step_data)
+                        groups_list = "\n".join(
+                            f"• {group_id} — {title}" for group_id, title in self.schedule_manager.groups.items()
+                        )
                         await update.message.reply_text(
-                            f"✅ Мероприятие успешно добавлено!\n\n"
-                            f"📅 Дата: {step_data['date']}\n"
-                            f"📚 Предмет: {step_data['subject']}\n"
-                            f"🎯 Тип: {step_data['event_type']}"
+                            f"👥 Введите идентификатор группы или «все»:\n\n{groups_list}"
                         )
-                    else:
-                        await update.message.reply_text("❌ Ошибка при добавлении мероприятия в базу данных")
+                        return
                     
-                    # Очищаем состояние
-                    del self.waiting_for_event_data[user_id]
+                    await self._save_event(update, context, step_data)
+                
+                elif step_data["step"] == "waiting_for_group":
+                    group_id = message_text.strip()
+                    if group_id.lower() in ['все', 'all']:
+                        step_data["group_id"] = None
+                    elif self.schedule_manager.has_group(group_id):
+                        step_data["group_id"] = group_id
+                    else:
+                        await update.message.reply_text("❌ Группа не найдена. Введите идентификатор группы или «все»:")
+                        return
                     
-                    # Возвращаем в админ-меню
-                    await self.admin_menu(update, context)
+                    await self._save_event(update, context, step_data)
         except Exception as e:
             logger.error(f"Ошибка в handle_admin_message: {e}")
             await update.message.reply_text("❌ Произошла ошибка при обработке запроса")
 
-# Глобальный экземпляр админ-панели
-admin_panel = AdminPanel()
\ No newline at end of file
+# Глобальная админ-панель создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"admin_panel": "admin_panel"})
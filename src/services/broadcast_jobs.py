@@ -0,0 +1,159 @@
+# services/broadcast_jobs.py
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional
+from src.services.broadcaster import Broadcaster, BroadcastResult, ProgressCallback
+from src.services.database import AsyncDatabase, BROADCAST_DONE, BROADCAST_CANCELLED
+from src.services.cluster import LocalCoordinator
+from src.utils.config import BROADCAST_CHECKPOINT_SIZE
+from src.utils.keyboards import get_main_keyboard
+from src.container import legacy_attribute
+
+logger = logging.getLogger(__name__)
+
+# Клавиатуры, которые можно приложить к рассылке: в БД хранится только имя
+KEYBOARDS = {
+    "main": get_main_keyboard,
+}
+
+
+class BroadcastJobManager:
+    """Рассылки как сохраняемые задания.
+
+    Задание и очередь получателей хранятся в SQLite. Получатели забираются
+    порциями, итоги каждой порции фиксируются контрольной точкой, поэтому после
+    перезапуска рассылка продолжается с места остановки. Получатели, отправка
+    которым прервалась на середине, повторно не отправляются.
+    """
+
+    def __init__(self, async_database: AsyncDatabase, engine: Broadcaster,
+                 batch_size: int = BROADCAST_CHECKPOINT_SIZE, coordinator=None):
+        self.async_database = async_database
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        # В кластере задание выполняет процесс, удерживающий аренду broadcast:<id>
+        self.coordinator = coordinator or LocalCoordinator()
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def submit(self, kind: str, text: str, chat_ids: Iterable[int], created_by: str = None,
+                     dedupe_key: str = None, keyboard: str = None) -> Optional[int]:
+        """Сохраняет задание рассылки и возвращает его id"""
+        if keyboard is not None and keyboard not in KEYBOARDS:
+            raise ValueError(f"Неизвестная клавиатура рассылки: {keyboard}")
+        return await self.async_database.create_broadcast_job(
+            kind, text, chat_ids, created_by, dedupe_key, keyboard
+        )
+
+    def start(self, bot, job_id: int, progress_callback: Optional[ProgressCallback] = None,
+              progress_interval: float = 5.0) -> asyncio.Task:
+        """Запускает выполнение задания в фоне; повторный вызов возвращает ту же задачу"""
+        task = self._tasks.get(job_id)
+        if task is None:
+            task = asyncio.create_task(self._run(bot, job_id, progress_callback, progress_interval))
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return task
+
+    async def run(self, bot, job_id: int, progress_callback: Optional[ProgressCallback] = None,
+                  progress_interval: float = 5.0) -> BroadcastResult:
+        """Выполняет задание и возвращает итоги"""
+        return await self.start(bot, job_id, progress_callback, progress_interval)
+
+    def is_running(self, job_id: int) -> bool:
+        return job_id in self._tasks
+
+    async def _run(self, bot, job_id: int, progress_callback: Optional[ProgressCallback],
+                   progress_interval: float) -> BroadcastResult:
+        job = await self.async_database.get_broadcast_job(job_id)
+        if job is None:
+            raise ValueError(f"Задание рассылки #{job_id} не найдено")
+
+        # Итоги включают получателей, обработанных до перезапуска
+        result = BroadcastResult(job["total"])
+        result.success = job["success"]
+        result.failed = job["failed"]
+
+        lease = f"broadcast:{job_id}"
+        if not await self.coordinator.hold(lease):
+            logger.info(f"⏭ Рассылку #{job_id} выполняет другой процесс")
+            return result
+        try:
+            completed = await self._run_batches(bot, job_id, job, result, progress_callback, progress_interval, lease)
+        finally:
+            await self.coordinator.release(lease)
+
+        result.finished_at = time.monotonic()
+        if not completed:
+            return result
+        if await self.async_database.finish_broadcast_job(job_id, BROADCAST_DONE):
+            logger.info(f"✅ Задание рассылки #{job_id} завершено: {result}")
+        else:
+            logger.info(f"⛔ Задание рассылки #{job_id} остановлено: {result}")
+        return result
+
+    async def _run_batches(self, bot, job_id: int, job: dict, result: BroadcastResult,
+                           progress_callback: Optional[ProgressCallback], progress_interval: float,
+                           lease: str) -> bool:
+        """Отправляет порции до конца очереди. False, если выполнение перешло к другому процессу"""
+        kwargs = {}
+        if job["keyboard"]:
+            kwargs["reply_markup"] = KEYBOARDS[job["keyboard"]]()
+
+        last_progress = time.monotonic()
+        while True:
+            # Пустая порция: получатели закончились или задание отменено
+            batch = await self.async_database.claim_broadcast_batch(job_id, self.batch_size)
+            if not batch:
+                return True
+
+            batch_result = await self.engine.broadcast(bot, batch, job["text"], **kwargs)
+            failed = {chat_id: str(error) for chat_id, error in batch_result.failures.items()}
+            sent = [chat_id for chat_id in batch if chat_id not in failed]
+            await self.async_database.complete_broadcast_batch(job_id, sent, failed)
+
+            result.success += batch_result.success
+            result.failed += batch_result.failed
+            result.retry_after_count += batch_result.retry_after_count
+            result.failures.update(batch_result.failures)
+
+            now = time.monotonic()
+            if progress_callback and now - last_progress >= progress_interval:
+                last_progress = now
+                try:
+                    await progress_callback(result)
+                except Exception as e:
+                    logger.debug(f"Ошибка обновления прогресса рассылки #{job_id}: {e}")
+
+            if not await self.coordinator.hold(lease):
+                logger.warning(f"⚠️ Аренда рассылки #{job_id} потеряна, выполнение передано другому процессу")
+                return False
+
+    async def cancel(self, job_id: int) -> bool:
+        """Отменяет задание: выполнение остановится после текущей порции"""
+        cancelled = await self.async_database.finish_broadcast_job(job_id, BROADCAST_CANCELLED)
+        if cancelled:
+            logger.info(f"⛔ Задание рассылки #{job_id} отменено")
+        return cancelled
+
+    async def resume_pending(self, bot) -> int:
+        """Продолжает задания, прерванные перезапуском. Возвращает их число"""
+        resumed = 0
+        for job in await self.async_database.get_broadcast_jobs(active_only=True, limit=100):
+            job_id = job["id"]
+            if self.is_running(job_id):
+                continue
+            # Задание, которое сейчас выполняет другой живой процесс, не трогаем
+            if not await self.coordinator.hold(f"broadcast:{job_id}"):
+                continue
+            unknown = await self.async_database.recover_broadcast_job(job_id)
+            logger.info(
+                f"🔁 Возобновление рассылки #{job_id} ({job['kind']}): "
+                f"обработано {job['success'] + job['failed']}/{job['total']}, без подтверждения {unknown}"
+            )
+            self.start(bot, job_id)
+            resumed += 1
+        return resumed
+
+# Глобальный менеджер заданий рассылки создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"broadcast_jobs": "broadcast_jobs"})
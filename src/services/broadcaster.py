@@ -0,0 +1,263 @@
+# services/broadcaster.py
+import logging
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from telegram.error import TelegramError, RetryAfter, NetworkError, Forbidden, BadRequest
+from src.services.database import (
+    USER_STATUS_BLOCKED, USER_STATUS_DEACTIVATED, USER_STATUS_CHAT_NOT_FOUND
+)
+from src.services.metrics import MESSAGES_SENT, SEND_DURATION, TELEGRAM_RETRY_AFTER
+from src.container import legacy_attribute
+from src.utils.config import (
+    BROADCAST_CONCURRENCY, BROADCAST_RATE_LIMIT,
+    BROADCAST_PER_CHAT_INTERVAL, BROADCAST_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+def delivery_status_for_error(error: TelegramError) -> Optional[str]:
+    """Состояние получателя для окончательной ошибки доставки или None для временной"""
+    message = str(error).lower()
+    if isinstance(error, Forbidden):
+        if "deactivated" in message:
+            return USER_STATUS_DEACTIVATED
+        return USER_STATUS_BLOCKED
+    if isinstance(error, BadRequest) and "chat not found" in message:
+        return USER_STATUS_CHAT_NOT_FOUND
+    return None
+
+
+class TokenBucket:
+    """Token bucket с резервированием: ожидание вычисляется без блокировок"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _reserve(self) -> float:
+        """Резервирует один токен и возвращает время ожидания в секундах"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+        return max(wait, self._paused_until - now)
+
+    async def acquire(self):
+        """Дожидается разрешения на отправку одного сообщения"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (после RetryAfter от Telegram).
+
+        Запас токенов обнуляется и начинает пополняться только с конца паузы, поэтому
+        ожидающие воркеры выходят из нее по одному с интервалом 1/rate, а не все разом.
+        Долг уже зарезервированных слотов сохраняется: новые резервы встают после них
+        и после конца паузы, поэтому повторный RetryAfter не сводит слоты вместе.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = min(self._tokens, 0.0)
+        # Первый новый слот — не раньше конца паузы и не раньше последнего зарезервированного
+        self._updated = max(self._updated, self._paused_until + self._tokens / self.rate)
+
+
+class PerChatLimiter:
+    """Минимальный интервал между сообщениями в один и тот же чат"""
+
+    def __init__(self, interval: float, max_entries: int = 10000):
+        self.interval = interval
+        self.max_entries = max_entries
+        self._next_allowed: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next_allowed.get(chat_id, 0.0))
+        self._next_allowed[chat_id] = slot + self.interval
+
+        if len(self._next_allowed) > self.max_entries:
+            self._next_allowed = {
+                key: value for key, value in self._next_allowed.items() if value > now
+            }
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class BroadcastResult:
+    """Итоги рассылки"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.success = 0
+        self.failed = 0
+        self.retry_after_count = 0
+        self.failures: Dict[int, TelegramError] = {}
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.success + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def unreachable(self) -> int:
+        """Получатели, которым доставка больше невозможна (заблокировали бота и т. п.)"""
+        return sum(1 for error in self.failures.values() if delivery_status_for_error(error))
+
+    @property
+    def rate(self) -> float:
+        """Пропускная способность, сообщений в секунду"""
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.processed}/{self.total} (успешно {self.success}, не удалось {self.failed}), "
+            f"{self.rate:.1f} сообщ./с"
+        )
+
+
+ProgressCallback = Callable[[BroadcastResult], Awaitable[None]]
+# Получает итог доставки в чат: None при успехе или окончательную ошибку
+DeliveryListener = Callable[[int, Optional[TelegramError]], None]
+
+
+class Broadcaster:
+    """Общий движок рассылок с пулом воркеров и ограничением скорости"""
+
+    def __init__(self, concurrency: int = BROADCAST_CONCURRENCY,
+                 rate_limit: float = BROADCAST_RATE_LIMIT,
+                 per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+                 max_retries: int = BROADCAST_MAX_RETRIES,
+                 retry_backoff: float = 1.0):
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.bucket = TokenBucket(rate_limit)
+        self.chat_limiter = PerChatLimiter(per_chat_interval)
+        self._delivery_listeners: List[DeliveryListener] = []
+
+    def add_delivery_listener(self, callback: DeliveryListener):
+        """Регистрирует обработчик итогов доставки (для учета состояния получателей)"""
+        self._delivery_listeners.append(callback)
+
+    def _notify_delivery(self, chat_id: int, error: Optional[TelegramError]):
+        for callback in self._delivery_listeners:
+            try:
+                callback(chat_id, error)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика итогов доставки: {e}")
+
+    async def _deliver(self, bot, chat_id: int, text: str, kwargs: dict,
+                       result: Optional[BroadcastResult] = None) -> Optional[TelegramError]:
+        """Отправляет одно сообщение и сообщает итог обработчикам доставки"""
+        error = await self._attempt(bot, chat_id, text, kwargs, result)
+        MESSAGES_SENT.inc(result="success" if error is None else "error")
+        self._notify_delivery(chat_id, error)
+        return error
+
+    async def _attempt(self, bot, chat_id: int, text: str, kwargs: dict,
+                       result: Optional[BroadcastResult] = None) -> Optional[TelegramError]:
+        """Отправляет одно сообщение с учетом лимитов и повторов. Возвращает ошибку или None"""
+        attempt = 0
+        while True:
+            await self.chat_limiter.acquire(chat_id)
+            await self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                SEND_DURATION.observe(time.perf_counter() - started)
+                return None
+            except RetryAfter as e:
+                # Telegram просит подождать: притормаживаем все воркеры, а не только текущий
+                TELEGRAM_RETRY_AFTER.inc()
+                self.bucket.pause(e.retry_after)
+                if result is not None:
+                    result.retry_after_count += 1
+                attempt += 1
+                logger.warning(
+                    "⏳ Flood control, пауза %s с (чат %s)", e.retry_after, chat_id,
+                    extra={"event": "flood_wait", "chat_id": chat_id}
+                )
+                if attempt > self.max_retries:
+                    return e
+            except BadRequest as e:
+                # В PTB BadRequest — подкласс NetworkError, но повтор не поможет: ошибка окончательная
+                return e
+            except NetworkError as e:
+                # Временные ошибки сети (TimedOut и т. п.): повтор с экспоненциальной задержкой
+                attempt += 1
+                if attempt > self.max_retries:
+                    return e
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            except TelegramError as e:
+                return e
+
+    async def send(self, bot, chat_id: int, text: str, **kwargs) -> bool:
+        """Отправляет одно сообщение через общий лимитер"""
+        error = await self._deliver(bot, chat_id, text, kwargs)
+        if error is not None:
+            logger.warning(
+                "❌ Не удалось отправить сообщение пользователю %s: %s", chat_id, error,
+                extra={"event": "send_failed", "chat_id": chat_id}
+            )
+            return False
+        return True
+
+    async def broadcast(self, bot, chat_ids: Iterable[int], text: str,
+                        progress_callback: Optional[ProgressCallback] = None,
+                        progress_interval: float = 5.0, **kwargs) -> BroadcastResult:
+        """Рассылает сообщение списку чатов и возвращает итоги"""
+        chat_ids = list(chat_ids)
+        result = BroadcastResult(len(chat_ids))
+        if not chat_ids:
+            result.finished_at = time.monotonic()
+            return result
+
+        pending = iter(chat_ids)
+        last_progress = time.monotonic()
+
+        async def worker():
+            nonlocal last_progress
+            for chat_id in pending:
+                error = await self._deliver(bot, chat_id, text, kwargs, result)
+                if error is None:
+                    result.success += 1
+                else:
+                    result.failed += 1
+                    result.failures[chat_id] = error
+                    logger.warning(
+                        "❌ Не удалось отправить сообщение пользователю %s: %s", chat_id, error,
+                        extra={"event": "send_failed", "chat_id": chat_id}
+                    )
+
+                now = time.monotonic()
+                if now - last_progress >= progress_interval:
+                    last_progress = now
+                    logger.info(f"📤 Прогресс рассылки: {result}")
+                    if progress_callback:
+                        try:
+                            await progress_callback(result)
+                        except Exception as e:
+                            logger.debug(f"Ошибка обновления прогресса рассылки: {e}")
+
+        workers = min(self.concurrency, len(chat_ids))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        result.finished_at = time.monotonic()
+        logger.info(f"✅ Рассылка завершена: {result} за {result.elapsed:.1f} с")
+        return result
+
+# Глобальный движок рассылок создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"broadcaster": "broadcaster"})
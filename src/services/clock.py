@@ -0,0 +1,106 @@
+# services/clock.py
+import time
+from datetime import date, datetime, time as Time, timedelta, timezone
+from typing import Dict, Optional, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from src.utils.config import TIMEZONE
+
+Zone = Union[ZoneInfo, str, None]
+
+
+def get_zone(name: str) -> ZoneInfo:
+    """Часовой пояс по имени IANA; неизвестное имя — ValueError"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"Неизвестный часовой пояс: {name}") from e
+
+
+class Clock:
+    """Часы приложения.
+
+    Текущий момент — метка UTC (time()), местное время вычисляется через zoneinfo
+    в поясе группы, пользователя или в TIMEZONE по умолчанию, поэтому переходы на
+    летнее время и часовой пояс контейнера на результат не влияют. Границы текущих
+    суток вычисляются для каждого пояса один раз: today() на горячем пути только
+    сравнивает метку с ними.
+    """
+
+    def __init__(self, timezone_name: str = TIMEZONE):
+        self.default_zone = get_zone(timezone_name)
+        self._zones: Dict[str, ZoneInfo] = {}
+        # {пояс: (начало суток, конец суток, дата)}
+        self._days: Dict[ZoneInfo, Tuple[float, float, date]] = {}
+
+    def time(self) -> float:
+        return time.time()
+
+    def zone(self, zone: Zone = None) -> ZoneInfo:
+        """Пояс по имени или объекту; None — пояс по умолчанию"""
+        if zone is None or zone == "":
+            return self.default_zone
+        if isinstance(zone, ZoneInfo):
+            return zone
+        cached = self._zones.get(zone)
+        if cached is None:
+            cached = self._zones[zone] = get_zone(zone)
+        return cached
+
+    def now(self, zone: Zone = None) -> datetime:
+        """Текущее время в поясе (aware datetime)"""
+        return datetime.fromtimestamp(self.time(), self.zone(zone))
+
+    def today(self, zone: Zone = None) -> date:
+        """Текущая дата в поясе"""
+        zone = self.zone(zone)
+        now = self.time()
+        cached = self._days.get(zone)
+        if cached is not None and cached[0] <= now < cached[1]:
+            return cached[2]
+        day = datetime.fromtimestamp(now, zone).date()
+        start = self.localize(day, Time.min, zone).timestamp()
+        end = self.localize(day + timedelta(days=1), Time.min, zone).timestamp()
+        self._days[zone] = (start, end, day)
+        return day
+
+    def localize(self, day: date, at: Time, zone: Zone = None) -> datetime:
+        """Момент «день + местное время» в поясе.
+
+        Время, пропущенное при переходе на летнее время, сдвигается вперед на
+        величину перехода; из дважды повторившегося берется первое.
+        """
+        zone = self.zone(zone)
+        local = datetime.combine(day, at.replace(tzinfo=None), tzinfo=zone)
+        return local.astimezone(timezone.utc).astimezone(zone)
+
+    def aware(self, value: datetime, zone: Zone = None) -> datetime:
+        """Переводит время в пояс; время без пояса считается местным временем этого пояса"""
+        zone = self.zone(zone)
+        if value.tzinfo is None:
+            return value.replace(tzinfo=zone)
+        return value.astimezone(zone)
+
+    def from_utc_text(self, value: str, zone: Zone = None) -> datetime:
+        """Время SQLite CURRENT_TIMESTAMP (UTC, ГГГГ-ММ-ДД ЧЧ:ММ:СС) в поясе"""
+        moment = datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        return moment.astimezone(self.zone(zone))
+
+
+class FakeClock(Clock):
+    """Часы, которые идут только вручную: для тестов и детерминированных замеров"""
+
+    def __init__(self, now: Union[datetime, float], timezone_name: str = TIMEZONE):
+        super().__init__(timezone_name)
+        self._now = 0.0
+        self.set(now)
+
+    def time(self) -> float:
+        return self._now
+
+    def set(self, now: Union[datetime, float]):
+        """Переставляет часы; время без пояса считается временем пояса по умолчанию"""
+        self._now = self.aware(now).timestamp() if isinstance(now, datetime) else float(now)
+
+    def advance(self, **kwargs):
+        """Переводит часы вперед: advance(minutes=5), advance(days=1)"""
+        self._now += timedelta(**kwargs).total_seconds()
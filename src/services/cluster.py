@@ -0,0 +1,266 @@
+# services/cluster.py
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from telegram import Update
+from src.services.database import AsyncDatabase
+from src.utils.config import CLUSTER_PARTITIONS, CLUSTER_LEASE_TTL, CLUSTER_POLL_INTERVAL, WORKER_ID
+from src.container import container
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+WORKER_LEASE_PREFIX = "worker:"
+PARTITION_LEASE_PREFIX = "partition:"
+
+# Обработанные обновления хранятся сутки (столько Telegram хранит неподтвержденные),
+# записи о запусках заданий — неделю
+INBOX_RETENTION = 24 * 3600
+JOB_RUN_RETENTION = 7 * 24 * 3600
+MAINTENANCE_INTERVAL = 3600
+
+# Таймаут long polling при получении обновлений лидером, секунды
+POLL_TIMEOUT = 10
+
+
+def partition_for(chat_id: int, partitions: int) -> int:
+    """Раздел очереди для чата: все обновления одного чата попадают в один раздел"""
+    return chat_id % partitions
+
+
+def update_partition(update: Update, partitions: int) -> int:
+    chat = update.effective_chat
+    user = update.effective_user
+    key = chat.id if chat else (user.id if user else 0)
+    return partition_for(key, partitions)
+
+
+class LocalCoordinator:
+    """Координация для единственного процесса: все задания выполняются здесь"""
+
+    enabled = False
+    is_leader = True
+    worker_id = "local"
+
+    async def claim_run(self, job: str, run_key: str) -> bool:
+        return True
+
+    async def hold(self, name: str) -> bool:
+        return True
+
+    async def release(self, name: str):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class ClusterCoordinator:
+    """Координация нескольких процессов через аренды в общей БД.
+
+    Каждый процесс продлевает аренду worker:<id>. Лидер (аренда leader) получает
+    обновления в режиме polling и продолжает прерванные рассылки. Очередь обновлений
+    разбита на разделы по chat_id, разделы делятся поровну между живыми процессами.
+    Регулярное задание выполняет процесс, первым зарегистрировавший запуск с данным ключом.
+    """
+
+    enabled = True
+
+    def __init__(self, async_database: AsyncDatabase, worker_id: str = None,
+                 partitions: int = CLUSTER_PARTITIONS, lease_ttl: float = CLUSTER_LEASE_TTL):
+        self.async_database = async_database
+        self.worker_id = worker_id or WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.partitions = max(1, partitions)
+        self.lease_ttl = lease_ttl
+        self.is_leader = False
+        self.owned_partitions: Set[int] = set()
+
+    async def claim_run(self, job: str, run_key: str) -> bool:
+        """Регистрирует запуск задания. False — этот запуск уже выполнил другой процесс"""
+        claimed = await self.async_database.claim_job_run(job, run_key, self.worker_id, time.time())
+        if not claimed:
+            logger.info(f"⏭ {job} ({run_key}) уже выполнен другим процессом")
+        return claimed
+
+    async def hold(self, name: str) -> bool:
+        """Захватывает или продлевает именованную аренду"""
+        return await self.async_database.acquire_lease(name, self.worker_id, self.lease_ttl, time.time())
+
+    async def release(self, name: str):
+        await self.async_database.release_lease(name, self.worker_id)
+
+    async def heartbeat(self, now: float = None) -> bool:
+        """Продлевает аренды и перераспределяет разделы. True, если процесс только что стал лидером"""
+        now = time.time() if now is None else now
+        db = self.async_database
+        await db.acquire_lease(f"{WORKER_LEASE_PREFIX}{self.worker_id}", self.worker_id, self.lease_ttl, now)
+
+        was_leader = self.is_leader
+        self.is_leader = await db.acquire_lease(LEADER_LEASE, self.worker_id, self.lease_ttl, now)
+        if self.is_leader != was_leader:
+            logger.info(f"👑 Процесс {self.worker_id} {'стал лидером' if self.is_leader else 'больше не лидер'}")
+
+        workers = len(await db.get_leases(WORKER_LEASE_PREFIX, now)) or 1
+        share = math.ceil(self.partitions / workers)
+        holders = await db.get_leases(PARTITION_LEASE_PREFIX, now)
+
+        owned = set()
+        for partition in sorted(self.owned_partitions):
+            name = f"{PARTITION_LEASE_PREFIX}{partition}"
+            if len(owned) >= share:
+                # Лишние разделы освобождаются для присоединившихся процессов
+                await db.release_lease(name, self.worker_id)
+            elif await db.acquire_lease(name, self.worker_id, self.lease_ttl, now):
+                owned.add(partition)
+        for partition in range(self.partitions):
+            if len(owned) >= share:
+                break
+            name = f"{PARTITION_LEASE_PREFIX}{partition}"
+            if partition in owned or name in holders:
+                continue
+            if await db.acquire_lease(name, self.worker_id, self.lease_ttl, now):
+                owned.add(partition)
+
+        if owned != self.owned_partitions:
+            logger.info(f"🧩 Разделы процесса {self.worker_id}: {sorted(owned)}")
+        self.owned_partitions = owned
+        return self.is_leader and not was_leader
+
+    async def shutdown(self):
+        """Освобождает аренды, чтобы остальные процессы сразу забрали работу"""
+        for partition in self.owned_partitions:
+            await self.release(f"{PARTITION_LEASE_PREFIX}{partition}")
+        if self.is_leader:
+            await self.release(LEADER_LEASE)
+        await self.release(f"{WORKER_LEASE_PREFIX}{self.worker_id}")
+        self.owned_partitions = set()
+        self.is_leader = False
+
+
+class ClusterWorker:
+    """Цикл процесса кластера.
+
+    Продлевает аренды, обрабатывает обновления своих разделов общей очереди
+    (обновления одного чата — строго по порядку) и, будучи лидером в режиме
+    polling, получает обновления от Telegram и складывает их в очередь.
+    Обновление отмечается обработанным после обработчиков: при падении процесса
+    его обработает новый владелец раздела (доставка «хотя бы один раз»).
+    """
+
+    def __init__(self, application, coordinator: ClusterCoordinator, async_database: AsyncDatabase = None,
+                 poll_interval: float = CLUSTER_POLL_INTERVAL, batch_size: int = 100,
+                 on_leadership: Optional[Callable[[object], Awaitable[None]]] = None):
+        self.application = application
+        self.coordinator = coordinator
+        self.async_database = async_database if async_database is not None else container.async_database
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.on_leadership = on_leadership
+        self._offset = None
+
+    async def enqueue(self, updates: Iterable[Update]) -> int:
+        """Добавляет обновления в общую очередь; повторно полученные отбрасываются"""
+        partitions = self.coordinator.partitions
+        rows = [
+            (update.update_id, update_partition(update, partitions), json.dumps(update.to_dict(), ensure_ascii=False))
+            for update in updates
+        ]
+        if not rows:
+            return 0
+        return await self.async_database.enqueue_updates(rows, time.time())
+
+    async def process_pending(self) -> int:
+        """Обрабатывает очередную порцию обновлений своих разделов. Возвращает их число"""
+        rows = await self.async_database.fetch_updates(self.coordinator.owned_partitions, self.batch_size)
+        if not rows:
+            return 0
+
+        by_partition: Dict[int, List[tuple]] = {}
+        for update_id, partition, payload in rows:
+            by_partition.setdefault(partition, []).append((update_id, payload))
+        # Разделы обрабатываются параллельно, обновления внутри раздела — последовательно
+        await asyncio.gather(*(self._process_partition(items) for items in by_partition.values()))
+        await self.async_database.mark_updates_processed([row[0] for row in rows], time.time())
+        return len(rows)
+
+    async def _process_partition(self, items: List[tuple]):
+        for update_id, payload in items:
+            try:
+                update = Update.de_json(json.loads(payload), self.application.bot)
+                await self.application.process_update(update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update_id}: {e}")
+
+    async def poll_once(self, timeout: int = POLL_TIMEOUT) -> int:
+        """Один запрос getUpdates; полученные обновления попадают в очередь"""
+        updates = await self.application.bot.get_updates(
+            offset=self._offset, timeout=timeout, allowed_updates=Update.ALL_TYPES
+        )
+        if not updates:
+            return 0
+        await self.enqueue(updates)
+        # Обновления подтверждаются следующим запросом только после записи в очередь
+        self._offset = updates[-1].update_id + 1
+        return len(updates)
+
+    async def _poll_loop(self, stop_event: asyncio.Event):
+        while not stop_event.is_set():
+            if not self.coordinator.is_leader:
+                self._offset = None
+                await _wait(stop_event, self.poll_interval)
+                continue
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.warning(f"Ошибка получения обновлений: {e}")
+                await _wait(stop_event, 1.0)
+
+    async def _maintenance(self):
+        now = time.time()
+        purged_updates = await self.async_database.purge_updates(now - INBOX_RETENTION)
+        purged_runs = await self.async_database.purge_job_runs(now - JOB_RUN_RETENTION)
+        if purged_updates or purged_runs:
+            logger.info(f"🧹 Очередь обновлений: удалено {purged_updates}, запусков заданий: {purged_runs}")
+
+    async def run(self, stop_event: asyncio.Event, polling: bool = True):
+        """Работает до stop_event"""
+        poller = asyncio.create_task(self._poll_loop(stop_event)) if polling else None
+        heartbeat_interval = self.coordinator.lease_ttl / 3
+        next_heartbeat = 0.0
+        next_maintenance = 0.0
+        try:
+            while not stop_event.is_set():
+                # Аренды продлеваются между порциями: раздел не освобождается посреди обработки
+                now = time.monotonic()
+                if now >= next_heartbeat:
+                    next_heartbeat = now + heartbeat_interval
+                    if await self.coordinator.heartbeat() and self.on_leadership:
+                        try:
+                            await self.on_leadership(self.application.bot)
+                        except Exception as e:
+                            logger.error(f"Ошибка при получении лидерства: {e}")
+                if self.coordinator.is_leader and now >= next_maintenance:
+                    next_maintenance = now + MAINTENANCE_INTERVAL
+                    await self._maintenance()
+
+                if not await self.process_pending():
+                    await _wait(stop_event, self.poll_interval)
+        finally:
+            if poller:
+                poller.cancel()
+                try:
+                    await poller
+                except asyncio.CancelledError:
+                    pass
+
+
+async def _wait(event: asyncio.Event, timeout: float):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
@@ -2,10 +2,210 @@
 import sqlite3
 import logging
 import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from src.utils.config import ADMIN_USERNAME
+from src.services.metrics import DB_QUERY_DURATION
+from src.container import legacy_attribute
 
 logger = logging.getLogger(__name__)
 
+# Настройки соединения: WAL позволяет читать во время записи, NORMAL безопасен в режиме WAL
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+# Миграции схемы: (версия, SQL-выражения). Текущая версия хранится в PRAGMA user_version,
+# новые миграции добавляются только в конец списка
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS control_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            subject_name TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT DEFAULT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, [
+        # Составной индекс обслуживает и запросы по одной дате, и диапазоны дат,
+        # поэтому отдельный индекс только по date не нужен
+        "CREATE INDEX IF NOT EXISTS idx_control_events_date_subject ON control_events (date, subject_name)",
+    ]),
+    (3, [
+        # NULL в group_id означает мероприятие для всех групп
+        "ALTER TABLE control_events ADD COLUMN group_id TEXT DEFAULT NULL",
+        '''
+        CREATE TABLE IF NOT EXISTS user_groups (
+            user_id INTEGER NOT NULL,
+            group_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, group_id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_user_groups_group ON user_groups (group_id)",
+    ]),
+    (4, [
+        # Состояние доставки: неактивные получатели исключаются из рассылок
+        "ALTER TABLE users ADD COLUMN status TEXT NOT NULL DEFAULT 'active'",
+        "ALTER TABLE users ADD COLUMN fail_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN last_success_at TIMESTAMP DEFAULT NULL",
+    ]),
+    (5, [
+        # Рассылки как задания: после перезапуска продолжаются с последней контрольной точки
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            dedupe_key TEXT UNIQUE,
+            text TEXT NOT NULL,
+            keyboard TEXT DEFAULT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total INTEGER NOT NULL DEFAULT 0,
+            success INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_by TEXT DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP DEFAULT NULL,
+            finished_at TIMESTAMP DEFAULT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_outbox (
+            job_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT DEFAULT NULL,
+            PRIMARY KEY (job_id, chat_id)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_outbox_status ON broadcast_outbox (job_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)",
+    ]),
+    (6, [
+        # Состояние незавершенных диалогов (добавление мероприятия, рассылка)
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            namespace TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, user_id)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)",
+    ]),
+    (7, [
+        # Аренды кластера: лидер, живые процессы, разделы очереди обновлений
+        '''
+        CREATE TABLE IF NOT EXISTS cluster_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        # Запуски регулярных заданий: один запуск на ключ во всем кластере
+        '''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job TEXT NOT NULL,
+            run_key TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            PRIMARY KEY (job, run_key)
+        ) WITHOUT ROWID
+        ''',
+        # Общая очередь входящих обновлений, разделенная по chat_id
+        '''
+        CREATE TABLE IF NOT EXISTS update_inbox (
+            update_id INTEGER PRIMARY KEY,
+            partition INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            received_at REAL NOT NULL,
+            processed_at REAL DEFAULT NULL
+        )
+        ''',
+        # Обработанные строки остаются на сутки: повторно полученное обновление отбрасывается
+        "CREATE INDEX IF NOT EXISTS idx_update_inbox_pending ON update_inbox (partition, update_id) WHERE processed_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_update_inbox_processed ON update_inbox (processed_at)",
+    ]),
+    (8, [
+        # Настройки рассылок пользователя; строки есть только у тех, кто менял настройки.
+        # digest_minute — минута суток доставки расписания на завтра (NULL — назначается автоматически)
+        '''
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            user_id INTEGER PRIMARY KEY,
+            digest_minute INTEGER DEFAULT NULL,
+            digest_enabled INTEGER NOT NULL DEFAULT 1,
+            reminders_enabled INTEGER NOT NULL DEFAULT 1,
+            reminder_lead INTEGER NOT NULL DEFAULT 10,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (9, [
+        # Часовой пояс пользователя (IANA) для времени рассылки; NULL — пояс по умолчанию
+        "ALTER TABLE user_preferences ADD COLUMN timezone TEXT DEFAULT NULL",
+    ]),
+    (10, [
+        # Версии данных, общие для всех процессов: увеличиваются в одной транзакции с изменением,
+        # по ним процессы кластера узнают, что их кэши устарели
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ]),
+]
+
+# Имена версий данных в data_versions
+CONTROL_EVENTS_VERSION = "control_events"
+USER_PREFERENCES_VERSION = "user_preferences"
+
+# Состояния доставки пользователя
+USER_STATUS_ACTIVE = "active"
+USER_STATUS_BLOCKED = "blocked"
+USER_STATUS_DEACTIVATED = "deactivated"
+USER_STATUS_CHAT_NOT_FOUND = "chat_not_found"
+
+# Состояния задания рассылки
+BROADCAST_PENDING = "pending"
+BROADCAST_RUNNING = "running"
+BROADCAST_DONE = "done"
+BROADCAST_CANCELLED = "cancelled"
+BROADCAST_ACTIVE_STATUSES = (BROADCAST_PENDING, BROADCAST_RUNNING)
+
+
+def _bump_data_version(conn, name: str):
+    """Увеличивает версию данных; вызывается в транзакции самого изменения"""
+    conn.execute('''
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+
+def _casefold(value):
+    """SQL-функция casefold: lower() в SQLite не меняет регистр кириллицы"""
+    return value.casefold() if isinstance(value, str) else value
+
 class Database:
     def __init__(self, db_path="schedule.db"):
         if not os.path.isabs(db_path):
@@ -21,78 +221,146 @@ class Database:
             os.makedirs(db_dir, exist_ok=True)
             logger.info(f"Создана директория для БД: {db_dir}")
         
+        # Подписчики изменений мероприятий в этом процессе (версия для всех процессов — в БД)
+        self._change_listeners = []
+        self.schema_version = 0
+        
+        # Долгоживущее соединение для каждого потока вместо нового connect на каждый запрос
+        self._local = threading.local()
+        
         self.init_db()
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            conn.create_function("casefold", 1, _casefold, deterministic=True)
+            self._local.conn = conn
+        return conn
+    
+    def close(self):
+        """Закрывает соединение текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
     
     def init_db(self):
-        """Инициализация базы данных"""
+        """Инициализация базы данных: применяет недостающие миграции схемы"""
         try:
-            with self.get_connection() as conn:
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS control_events (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        date TEXT NOT NULL,
-                        subject_name TEXT NOT NULL,
-                        event_type TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        created_by TEXT DEFAULT NULL
-                    )
-                ''')
-                
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                logger.info(f"База данных инициализирована: {self.db_path}")
+            conn = self.get_connection()
+            # BEGIN IMMEDIATE не дает двум процессам одновременно мигрировать одну БД
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for target_version, statements in MIGRATIONS:
+                    if target_version <= version:
+                        continue
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {target_version}")
+                    logger.info(f"Применена миграция схемы БД v{target_version}")
+                    version = target_version
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            
+            self.schema_version = version
+            logger.info(f"База данных инициализирована: {self.db_path} (схема v{version})")
         except Exception as e:
             logger.error(f"Ошибка инициализации БД: {e}")
             raise
     
-    def add_control_event(self, date, subject_name, event_type, created_by=None):
-        """Добавление контрольного мероприятия"""
+    def add_change_listener(self, callback):
+        """Подписка на изменения контрольных мероприятий (callback получает дату ГГГГ-ММ-ДД)"""
+        self._change_listeners.append(callback)
+    
+    @property
+    def control_events_version(self) -> int:
+        """Версия контрольных мероприятий: общая для процессов кластера, меняется при каждом изменении"""
+        return self.get_data_version(CONTROL_EVENTS_VERSION)
+    
+    def get_data_version(self, name: str) -> int:
+        """Текущая версия данных name (0 — данные еще не менялись)"""
+        try:
+            row = self.get_connection().execute(
+                'SELECT version FROM data_versions WHERE name = ?', (name,)
+            ).fetchone()
+            return row[0] if row else 0
+        except Exception as e:
+            logger.error(f"Ошибка получения версии данных {name}: {e}")
+            return 0
+    
+    def _notify_control_events_changed(self, date):
+        """Оповещает подписчиков этого процесса об изменении мероприятий на дату"""
+        for callback in self._change_listeners:
+            try:
+                callback(date)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменения мероприятий: {e}")
+    
+    def add_control_event(self, date, subject_name, event_type, created_by=None, group_id=None):
+        """Добавление контрольного мероприятия (group_id=None — для всех групп)"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.execute('''
-                    INSERT INTO control_events (date, subject_name, event_type, created_by)
-                    VALUES (?, ?, ?, ?)
-                ''', (date, subject_name, event_type, created_by))
+                    INSERT INTO control_events (date, subject_name, event_type, created_by, group_id)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (date, subject_name, event_type, created_by, group_id))
+                _bump_data_version(conn, CONTROL_EVENTS_VERSION)
                 conn.commit()
                 logger.info(f"Добавлено контрольное мероприятие: {subject_name} на {date}")
-                return cursor.lastrowid
+            self._notify_control_events_changed(date)
+            return cursor.lastrowid
         except Exception as e:
             logger.error(f"Ошибка добавления контрольного мероприятия: {e}")
             return None
     
-    def get_control_events_by_date(self, date):
-        """Получение контрольных мероприятий на указанную дату"""
+    def get_control_events_by_date(self, date, group_id=None):
+        """Получение контрольных мероприятий на указанную дату (общих и для группы)"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.execute('''
                     SELECT subject_name, event_type 
                     FROM control_events 
-                    WHERE date = ?
-                ''', (date,))
+                    WHERE date = ? AND (group_id IS NULL OR group_id = ?)
+                ''', (date, group_id))
                 return cursor.fetchall()
         except Exception as e:
             logger.error(f"Ошибка получения контрольных мероприятий: {e}")
             return []
     
+    def get_control_events_between(self, start_date, end_date, group_id=None):
+        """Получение контрольных мероприятий в диапазоне дат (включительно) одним запросом"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    SELECT date, subject_name, event_type
+                    FROM control_events
+                    WHERE date BETWEEN ? AND ? AND (group_id IS NULL OR group_id = ?)
+                    ORDER BY date
+                ''', (start_date, end_date, group_id))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения контрольных мероприятий за период: {e}")
+            return []
+    
     def delete_control_event(self, event_id):
         """Удаление контрольного мероприятия"""
         try:
             with self.get_connection() as conn:
+                row = conn.execute('SELECT date FROM control_events WHERE id = ?', (event_id,)).fetchone()
                 conn.execute('DELETE FROM control_events WHERE id = ?', (event_id,))
+                if row:
+                    _bump_data_version(conn, CONTROL_EVENTS_VERSION)
                 conn.commit()
                 logger.info(f"Удалено контрольное мероприятие ID: {event_id}")
-                return True
+            if row:
+                self._notify_control_events_changed(row[0])
+            return True
         except Exception as e:
             logger.error(f"Ошибка удаления контрольного мероприятия: {e}")
             return False
@@ -102,7 +370,7 @@ class Database:
         try:
             with self.get_connection() as conn:
                 cursor = conn.execute('''
-                    SELECT id, date, subject_name, event_type, created_by
+                    SELECT id, date, subject_name, event_type, created_by, group_id
                     FROM control_events 
                     ORDER BY date
                 ''')
@@ -110,6 +378,67 @@ class Database:
         except Exception as e:
             logger.error(f"Ошибка получения всех контрольных мероприятий: {e}")
             return []
+    
+    def get_control_event_by_id(self, event_id):
+        """Контрольное мероприятие по id или None"""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute('''
+                    SELECT id, date, subject_name, event_type, created_by, group_id
+                    FROM control_events
+                    WHERE id = ?
+                ''', (event_id,)).fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения контрольного мероприятия {event_id}: {e}")
+            return None
+    
+    def get_control_events_page(self, limit: int = 10, after: tuple = None, before: tuple = None,
+                                start_date: str = None, end_date: str = None, subject: str = None):
+        """Страница контрольных мероприятий в порядке (date, id).
+        
+        after и before — ключ (date, id) последней или первой строки соседней
+        страницы: выборка продолжается с этого места по индексу (date, subject_name),
+        без OFFSET и без чтения предыдущих страниц; по id сортируются только строки
+        одной даты. subject ищется как подстрока без учета регистра.
+        Возвращает (строки по возрастанию, есть ли еще строки в направлении листания).
+        """
+        conditions, params = [], []
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        if subject:
+            conditions.append("instr(casefold(subject_name), ?) > 0")
+            params.append(subject.casefold())
+        if before is not None:
+            conditions.append("(date, id) < (?, ?)")
+            params.extend(before)
+            order = "DESC"
+        else:
+            if after is not None:
+                conditions.append("(date, id) > (?, ?)")
+                params.extend(after)
+            order = "ASC"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            with self.get_connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, date, subject_name, event_type, created_by, group_id
+                    FROM control_events
+                    {where}
+                    ORDER BY date {order}, id {order}
+                    LIMIT ?
+                ''', (*params, limit + 1)).fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения страницы контрольных мероприятий: {e}")
+            return [], False
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+        return rows, has_more
 
     def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None):
         """Добавление/обновление пользователя"""
@@ -121,7 +450,7 @@ class Database:
                     VALUES (?, ?, ?, ?)
                 ''', (user_id, username, first_name, last_name))
                 conn.commit()
-                logger.info(f"Добавлен/обновлен пользователь: {username}")
+                logger.info("Добавлен/обновлен пользователь: %s", username, extra={"event": "user_saved", "user_id": user_id})
                 return True
         except Exception as e:
             logger.error(f"Ошибка добавления пользователя: {e}")
@@ -131,7 +460,7 @@ class Database:
         """Получение всех пользователей"""
         try:
             with self.get_connection() as conn:
-                cursor = conn.execute('SELECT user_id FROM users')
+                cursor = conn.execute('SELECT user_id FROM users WHERE status = ?', (USER_STATUS_ACTIVE,))
                 return [row[0] for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Ошибка получения пользователей: {e}")
@@ -147,5 +476,633 @@ class Database:
             logger.error(f"Ошибка проверки пользователя: {e}")
             return False
 
-# Глобальный экземпляр базы данных
-db = Database()
\ No newline at end of file
+    def get_user_profiles(self):
+        """Профили всех пользователей: {user_id: (username, first_name, last_name)}"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('SELECT user_id, username, first_name, last_name FROM users')
+                return {row[0]: tuple(row[1:]) for row in cursor}
+        except Exception as e:
+            logger.error(f"Ошибка получения профилей пользователей: {e}")
+            return {}
+    
+    def get_user_delivery_states(self):
+        """Отличные от исходного состояния доставки: {user_id: (status, fail_count)}"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    'SELECT user_id, status, fail_count FROM users WHERE status != ? OR fail_count > 0',
+                    (USER_STATUS_ACTIVE,)
+                )
+                return {row[0]: (row[1], row[2]) for row in cursor}
+        except Exception as e:
+            logger.error(f"Ошибка получения состояний доставки: {e}")
+            return {}
+    
+    def save_users_batch(self, users: dict, group_changes: dict, delivery_changes: dict = None):
+        """Пакетная запись пользователей {user_id: (username, first_name, last_name)},
+        подписок {(user_id, group_id): подписан} и состояний доставки
+        {user_id: (status, fail_count, last_success_at или None)} одной транзакцией"""
+        delivery_changes = delivery_changes or {}
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.executemany('''
+                    INSERT INTO users (user_id, username, first_name, last_name)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = excluded.username,
+                        first_name = excluded.first_name,
+                        last_name = excluded.last_name
+                ''', [(user_id, *profile) for user_id, profile in users.items()])
+                conn.executemany(
+                    'INSERT OR IGNORE INTO user_groups (user_id, group_id) VALUES (?, ?)',
+                    [key for key, subscribed in group_changes.items() if subscribed]
+                )
+                conn.executemany(
+                    'DELETE FROM user_groups WHERE user_id = ? AND group_id = ?',
+                    [key for key, subscribed in group_changes.items() if not subscribed]
+                )
+                conn.executemany('''
+                    UPDATE users SET status = ?, fail_count = ?,
+                        last_success_at = COALESCE(?, last_success_at)
+                    WHERE user_id = ?
+                ''', [(*state, user_id) for user_id, state in delivery_changes.items()])
+            logger.info(
+                f"Записано пользователей: {len(users)}, изменений подписок: {len(group_changes)}, "
+                f"состояний доставки: {len(delivery_changes)}"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка пакетной записи пользователей: {e}")
+            return False
+    
+    def get_user_groups(self, user_id: int):
+        """Группы, на которые подписан пользователь"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    'SELECT group_id FROM user_groups WHERE user_id = ? ORDER BY created_at, group_id', (user_id,)
+                )
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения групп пользователя: {e}")
+            return []
+    
+    def set_user_group(self, user_id: int, group_id: str, subscribed: bool):
+        """Подписка пользователя на группу или отписка от нее"""
+        try:
+            with self.get_connection() as conn:
+                if subscribed:
+                    conn.execute(
+                        'INSERT OR IGNORE INTO user_groups (user_id, group_id) VALUES (?, ?)', (user_id, group_id)
+                    )
+                else:
+                    conn.execute(
+                        'DELETE FROM user_groups WHERE user_id = ? AND group_id = ?', (user_id, group_id)
+                    )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка изменения подписки на группу: {e}")
+            return False
+    
+    def get_user_group_map(self, include_inactive: bool = False):
+        """Снимок получателей: {user_id: кортеж групп}; пустой кортеж — подписок нет.
+        По умолчанию только активные пользователи"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    SELECT u.user_id, g.group_id
+                    FROM users u
+                    LEFT JOIN user_groups g ON g.user_id = u.user_id
+                    WHERE ? OR u.status = ?
+                ''', (include_inactive, USER_STATUS_ACTIVE))
+                groups_by_user = {}
+                for user_id, group_id in cursor:
+                    groups = groups_by_user.setdefault(user_id, [])
+                    if group_id is not None:
+                        groups.append(group_id)
+                return {user_id: tuple(groups) for user_id, groups in groups_by_user.items()}
+        except Exception as e:
+            logger.error(f"Ошибка получения групп пользователей: {e}")
+            return {}
+    
+    def get_group_users(self, group_id: str, include_unsubscribed: bool = False):
+        """Пользователи группы. include_unsubscribed добавляет тех, кто не выбрал ни одной группы
+        (они получают расписание группы по умолчанию)"""
+        try:
+            with self.get_connection() as conn:
+                query = '''
+                    SELECT g.user_id FROM user_groups g
+                    JOIN users u ON u.user_id = g.user_id
+                    WHERE g.group_id = ? AND u.status = ?
+                '''
+                params = [group_id, USER_STATUS_ACTIVE]
+                if include_unsubscribed:
+                    query += '''
+                        UNION
+                        SELECT user_id FROM users
+                        WHERE status = ? AND user_id NOT IN (SELECT user_id FROM user_groups)
+                    '''
+                    params.append(USER_STATUS_ACTIVE)
+                cursor = conn.execute(query, params)
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения пользователей группы: {e}")
+            return []
+    
+    def create_broadcast_job(self, kind: str, text: str, chat_ids, created_by: str = None,
+                             dedupe_key: str = None, keyboard: str = None):
+        """Создает задание рассылки с очередью получателей. Если задание с таким
+        dedupe_key уже есть, возвращает его id, не создавая второе"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                if dedupe_key is not None:
+                    row = conn.execute(
+                        'SELECT id FROM broadcast_jobs WHERE dedupe_key = ?', (dedupe_key,)
+                    ).fetchone()
+                    if row:
+                        return row[0]
+                
+                chat_ids = list(dict.fromkeys(chat_ids))
+                cursor = conn.execute('''
+                    INSERT INTO broadcast_jobs (kind, dedupe_key, text, keyboard, total, created_by)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (kind, dedupe_key, text, keyboard, len(chat_ids), created_by))
+                job_id = cursor.lastrowid
+                conn.executemany(
+                    'INSERT INTO broadcast_outbox (job_id, chat_id) VALUES (?, ?)',
+                    ((job_id, chat_id) for chat_id in chat_ids)
+                )
+            logger.info(f"Создано задание рассылки #{job_id} ({kind}): {len(chat_ids)} получателей")
+            return job_id
+        except Exception as e:
+            logger.error(f"Ошибка создания задания рассылки: {e}")
+            return None
+    
+    def claim_broadcast_batch(self, job_id: int, limit: int):
+        """Забирает следующую порцию получателей и помечает их как отправляемые.
+        Для завершенного или отмененного задания возвращает пустой список"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                row = conn.execute('SELECT status FROM broadcast_jobs WHERE id = ?', (job_id,)).fetchone()
+                if row is None or row[0] not in BROADCAST_ACTIVE_STATUSES:
+                    return []
+                chat_ids = [row[0] for row in conn.execute(
+                    'SELECT chat_id FROM broadcast_outbox WHERE job_id = ? AND status = ? LIMIT ?',
+                    (job_id, 'pending', limit)
+                )]
+                conn.executemany(
+                    "UPDATE broadcast_outbox SET status = 'sending' WHERE job_id = ? AND chat_id = ?",
+                    ((job_id, chat_id) for chat_id in chat_ids)
+                )
+                conn.execute('''
+                    UPDATE broadcast_jobs SET status = ?, started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+                    WHERE id = ? AND status = ?
+                ''', (BROADCAST_RUNNING, job_id, BROADCAST_PENDING))
+            return chat_ids
+        except Exception as e:
+            logger.error(f"Ошибка получения порции рассылки: {e}")
+            return []
+    
+    def complete_broadcast_batch(self, job_id: int, sent, failed: dict):
+        """Контрольная точка: фиксирует итоги порции {chat_id: текст ошибки}"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.executemany(
+                    "UPDATE broadcast_outbox SET status = 'sent' WHERE job_id = ? AND chat_id = ?",
+                    ((job_id, chat_id) for chat_id in sent)
+                )
+                conn.executemany(
+                    "UPDATE broadcast_outbox SET status = 'failed', error = ? WHERE job_id = ? AND chat_id = ?",
+                    ((error, job_id, chat_id) for chat_id, error in failed.items())
+                )
+                conn.execute(
+                    'UPDATE broadcast_jobs SET success = success + ?, failed = failed + ? WHERE id = ?',
+                    (len(sent), len(failed), job_id)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения итогов порции рассылки: {e}")
+            return False
+    
+    def recover_broadcast_job(self, job_id: int):
+        """После сбоя: получатели в состоянии 'sending' могли уже получить сообщение,
+        поэтому они не отправляются повторно, а помечаются как 'unknown'"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE broadcast_outbox SET status = 'unknown' WHERE job_id = ? AND status = 'sending'",
+                    (job_id,)
+                )
+                recovered = cursor.rowcount
+                if recovered:
+                    conn.execute('UPDATE broadcast_jobs SET failed = failed + ? WHERE id = ?', (recovered, job_id))
+            return recovered
+        except Exception as e:
+            logger.error(f"Ошибка восстановления задания рассылки: {e}")
+            return 0
+    
+    def finish_broadcast_job(self, job_id: int, status: str = BROADCAST_DONE):
+        """Завершает (или отменяет) активное задание. Возвращает False, если оно уже завершено"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE broadcast_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status IN (?, ?)
+                ''', (status, job_id, *BROADCAST_ACTIVE_STATUSES))
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Ошибка завершения задания рассылки: {e}")
+            return False
+    
+    def purge_broadcast_jobs(self, older_than: float):
+        """Удаляет завершенные и отмененные задания рассылки, законченные раньше older_than
+        (метка времени UTC), вместе с их очередью получателей. Возвращает число заданий"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                job_ids = [(row[0],) for row in conn.execute('''
+                    SELECT id FROM broadcast_jobs
+                    WHERE status IN (?, ?) AND finished_at < datetime(?, 'unixepoch')
+                ''', (BROADCAST_DONE, BROADCAST_CANCELLED, older_than))]
+                conn.executemany('DELETE FROM broadcast_outbox WHERE job_id = ?', job_ids)
+                conn.executemany('DELETE FROM broadcast_jobs WHERE id = ?', job_ids)
+            return len(job_ids)
+        except Exception as e:
+            logger.error(f"Ошибка очистки заданий рассылки: {e}")
+            return 0
+    
+    def get_broadcast_job(self, job_id: int):
+        """Задание рассылки в виде словаря или None"""
+        jobs = self._query_broadcast_jobs('WHERE id = ?', (job_id,))
+        return jobs[0] if jobs else None
+    
+    def get_broadcast_jobs(self, active_only: bool = False, limit: int = 10):
+        """Последние задания рассылки (новые первыми)"""
+        if active_only:
+            return self._query_broadcast_jobs(
+                'WHERE status IN (?, ?) ORDER BY id DESC LIMIT ?', (*BROADCAST_ACTIVE_STATUSES, limit)
+            )
+        return self._query_broadcast_jobs('ORDER BY id DESC LIMIT ?', (limit,))
+    
+    def _query_broadcast_jobs(self, where: str, params: tuple):
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(f'SELECT * FROM broadcast_jobs {where}', params)
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения заданий рассылки: {e}")
+            return []
+    
+    def get_conversation_state(self, namespace: str, user_id: int, now: float):
+        """Сохраненное состояние диалога (строка JSON) или None, если его нет или оно истекло"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute(
+                    'SELECT value FROM conversation_state WHERE namespace = ? AND user_id = ? AND expires_at > ?',
+                    (namespace, user_id, now)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния диалога: {e}")
+            return None
+    
+    def set_conversation_state(self, namespace: str, user_id: int, value: str, expires_at: float):
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    INSERT INTO conversation_state (namespace, user_id, value, expires_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, user_id) DO UPDATE SET
+                        value = excluded.value, expires_at = excluded.expires_at
+                ''', (namespace, user_id, value, expires_at))
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния диалога: {e}")
+            return False
+    
+    def delete_conversation_state(self, namespace: str, user_id: int):
+        try:
+            with self.get_connection() as conn:
+                conn.execute(
+                    'DELETE FROM conversation_state WHERE namespace = ? AND user_id = ?', (namespace, user_id)
+                )
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка удаления состояния диалога: {e}")
+            return False
+    
+    def purge_conversation_state(self, now: float):
+        """Удаляет истекшие состояния диалогов"""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (now,)).rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки состояний диалогов: {e}")
+            return 0
+
+    def acquire_lease(self, name: str, owner: str, ttl: float, now: float):
+        """Захватывает или продлевает аренду. True, если аренда принадлежит owner"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO cluster_leases (name, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE cluster_leases.owner = excluded.owner OR cluster_leases.expires_at <= ?
+                ''', (name, owner, now + ttl, now))
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Ошибка захвата аренды {name}: {e}")
+            return False
+    
+    def release_lease(self, name: str, owner: str):
+        try:
+            with self.get_connection() as conn:
+                conn.execute('DELETE FROM cluster_leases WHERE name = ? AND owner = ?', (name, owner))
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка освобождения аренды {name}: {e}")
+            return False
+    
+    def get_leases(self, prefix: str, now: float):
+        """Действующие аренды с именем, начинающимся с prefix: {имя: владелец}"""
+        try:
+            with self.get_connection() as conn:
+                rows = conn.execute(
+                    'SELECT name, owner FROM cluster_leases WHERE name >= ? AND name < ? AND expires_at > ?',
+                    (prefix, prefix + '\uffff', now)
+                ).fetchall()
+                return dict(rows)
+        except Exception as e:
+            logger.error(f"Ошибка получения аренд {prefix}: {e}")
+            return {}
+    
+    def claim_job_run(self, job: str, run_key: str, owner: str, now: float):
+        """Регистрирует запуск задания. False, если этот запуск уже выполнил другой процесс"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO job_runs (job, run_key, owner, started_at) VALUES (?, ?, ?, ?)',
+                    (job, run_key, owner, now)
+                )
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Ошибка регистрации запуска {job}/{run_key}: {e}")
+            return False
+    
+    def purge_job_runs(self, before: float):
+        try:
+            with self.get_connection() as conn:
+                return conn.execute('DELETE FROM job_runs WHERE started_at < ?', (before,)).rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки запусков заданий: {e}")
+            return 0
+    
+    def enqueue_updates(self, updates, now: float):
+        """Добавляет обновления [(update_id, раздел, JSON)] в очередь; повторы игнорируются"""
+        try:
+            with self.get_connection() as conn:
+                return conn.executemany(
+                    'INSERT OR IGNORE INTO update_inbox (update_id, partition, payload, received_at) VALUES (?, ?, ?, ?)',
+                    [(update_id, partition, payload, now) for update_id, partition, payload in updates]
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Ошибка записи обновлений в очередь: {e}")
+            return 0
+    
+    def fetch_updates(self, partitions, limit: int):
+        """Самые старые необработанные обновления указанных разделов: [(update_id, раздел, JSON)]"""
+        partitions = list(partitions)
+        if not partitions:
+            return []
+        try:
+            with self.get_connection() as conn:
+                placeholders = ",".join("?" * len(partitions))
+                return conn.execute(
+                    f'SELECT update_id, partition, payload FROM update_inbox '
+                    f'WHERE processed_at IS NULL AND partition IN ({placeholders}) '
+                    f'ORDER BY update_id LIMIT ?',
+                    (*partitions, limit)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка чтения очереди обновлений: {e}")
+            return []
+    
+    def mark_updates_processed(self, update_ids, now: float):
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(
+                    'UPDATE update_inbox SET processed_at = ? WHERE update_id = ?',
+                    [(now, update_id) for update_id in update_ids]
+                )
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка отметки обработанных обновлений: {e}")
+            return False
+    
+    def purge_updates(self, before: float):
+        """Удаляет обработанные обновления старше before"""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute('DELETE FROM update_inbox WHERE processed_at < ?', (before,)).rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки очереди обновлений: {e}")
+            return 0
+    
+    def get_user_preferences(self):
+        """Настройки рассылок: {user_id: (digest_minute, digest_enabled, reminders_enabled, reminder_lead, timezone)}"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute('''
+                    SELECT user_id, digest_minute, digest_enabled, reminders_enabled, reminder_lead, timezone
+                    FROM user_preferences
+                ''')
+                return {
+                    user_id: (digest_minute, bool(digest_enabled), bool(reminders_enabled), reminder_lead, timezone)
+                    for user_id, digest_minute, digest_enabled, reminders_enabled, reminder_lead, timezone in cursor
+                }
+        except Exception as e:
+            logger.error(f"Ошибка получения настроек пользователей: {e}")
+            return {}
+    
+    def set_user_preferences(self, user_id: int, digest_minute, digest_enabled: bool,
+                             reminders_enabled: bool, reminder_lead: int, timezone: str = None):
+        try:
+            with self.get_connection() as conn:
+                conn.execute('''
+                    INSERT INTO user_preferences
+                        (user_id, digest_minute, digest_enabled, reminders_enabled, reminder_lead, timezone)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        digest_minute = excluded.digest_minute,
+                        digest_enabled = excluded.digest_enabled,
+                        reminders_enabled = excluded.reminders_enabled,
+                        reminder_lead = excluded.reminder_lead,
+                        timezone = excluded.timezone,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', (user_id, digest_minute, int(digest_enabled), int(reminders_enabled), reminder_lead, timezone))
+                _bump_data_version(conn, USER_PREFERENCES_VERSION)
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения настроек пользователя {user_id}: {e}")
+            return False
+
+# Длительность публичных методов Database попадает в метрики (служебные методы не измеряются)
+for _name, _method in list(vars(Database).items()):
+    if callable(_method) and not _name.startswith("_") and _name not in ("get_connection", "close", "init_db", "add_change_listener"):
+        setattr(Database, _name, DB_QUERY_DURATION.wrap(_method, method=_name))
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database.
+
+    Все запросы выполняются в отдельном потоке с собственным долгоживущим
+    соединением, поэтому обработчики не блокируют цикл событий.
+    """
+    
+    def __init__(self, database: Database):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-worker")
+    
+    async def run(self, func, *args, **kwargs):
+        """Выполняет произвольную функцию в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    async def add_control_event(self, date, subject_name, event_type, created_by=None, group_id=None):
+        return await self.run(self.database.add_control_event, date, subject_name, event_type, created_by, group_id)
+    
+    async def get_control_events_by_date(self, date, group_id=None):
+        return await self.run(self.database.get_control_events_by_date, date, group_id)
+    
+    async def get_control_events_between(self, start_date, end_date, group_id=None):
+        return await self.run(self.database.get_control_events_between, start_date, end_date, group_id)
+    
+    async def delete_control_event(self, event_id):
+        return await self.run(self.database.delete_control_event, event_id)
+    
+    async def get_all_control_events(self):
+        return await self.run(self.database.get_all_control_events)
+    
+    async def get_data_version(self, name: str):
+        return await self.run(self.database.get_data_version, name)
+    
+    async def get_control_event_by_id(self, event_id):
+        return await self.run(self.database.get_control_event_by_id, event_id)
+    
+    async def get_control_events_page(self, limit: int = 10, after: tuple = None, before: tuple = None,
+                                      start_date: str = None, end_date: str = None, subject: str = None):
+        return await self.run(
+            self.database.get_control_events_page, limit, after, before, start_date, end_date, subject
+        )
+    
+    async def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None):
+        return await self.run(self.database.add_user, user_id, username, first_name, last_name)
+    
+    async def get_all_users(self):
+        return await self.run(self.database.get_all_users)
+    
+    async def user_exists(self, user_id: int):
+        return await self.run(self.database.user_exists, user_id)
+    
+    async def get_user_groups(self, user_id: int):
+        return await self.run(self.database.get_user_groups, user_id)
+    
+    async def set_user_group(self, user_id: int, group_id: str, subscribed: bool):
+        return await self.run(self.database.set_user_group, user_id, group_id, subscribed)
+    
+    async def get_user_group_map(self, include_inactive: bool = False):
+        return await self.run(self.database.get_user_group_map, include_inactive)
+    
+    async def get_group_users(self, group_id: str, include_unsubscribed: bool = False):
+        return await self.run(self.database.get_group_users, group_id, include_unsubscribed)
+    
+    async def create_broadcast_job(self, kind: str, text: str, chat_ids, created_by: str = None,
+                                   dedupe_key: str = None, keyboard: str = None):
+        return await self.run(
+            self.database.create_broadcast_job, kind, text, chat_ids, created_by, dedupe_key, keyboard
+        )
+    
+    async def claim_broadcast_batch(self, job_id: int, limit: int):
+        return await self.run(self.database.claim_broadcast_batch, job_id, limit)
+    
+    async def complete_broadcast_batch(self, job_id: int, sent, failed: dict):
+        return await self.run(self.database.complete_broadcast_batch, job_id, sent, failed)
+    
+    async def recover_broadcast_job(self, job_id: int):
+        return await self.run(self.database.recover_broadcast_job, job_id)
+    
+    async def finish_broadcast_job(self, job_id: int, status: str = BROADCAST_DONE):
+        return await self.run(self.database.finish_broadcast_job, job_id, status)
+    
+    async def purge_broadcast_jobs(self, older_than: float):
+        return await self.run(self.database.purge_broadcast_jobs, older_than)
+    
+    async def get_broadcast_job(self, job_id: int):
+        return await self.run(self.database.get_broadcast_job, job_id)
+    
+    async def get_broadcast_jobs(self, active_only: bool = False, limit: int = 10):
+        return await self.run(self.database.get_broadcast_jobs, active_only, limit)
+    
+    async def get_conversation_state(self, namespace: str, user_id: int, now: float):
+        return await self.run(self.database.get_conversation_state, namespace, user_id, now)
+    
+    async def set_conversation_state(self, namespace: str, user_id: int, value: str, expires_at: float):
+        return await self.run(self.database.set_conversation_state, namespace, user_id, value, expires_at)
+    
+    async def delete_conversation_state(self, namespace: str, user_id: int):
+        return await self.run(self.database.delete_conversation_state, namespace, user_id)
+    
+    async def purge_conversation_state(self, now: float):
+        return await self.run(self.database.purge_conversation_state, now)
+    
+    async def acquire_lease(self, name: str, owner: str, ttl: float, now: float):
+        return await self.run(self.database.acquire_lease, name, owner, ttl, now)
+    
+    async def release_lease(self, name: str, owner: str):
+        return await self.run(self.database.release_lease, name, owner)
+    
+    async def get_leases(self, prefix: str, now: float):
+        return await self.run(self.database.get_leases, prefix, now)
+    
+    async def claim_job_run(self, job: str, run_key: str, owner: str, now: float):
+        return await self.run(self.database.claim_job_run, job, run_key, owner, now)
+    
+    async def purge_job_runs(self, before: float):
+        return await self.run(self.database.purge_job_runs, before)
+    
+    async def enqueue_updates(self, updates, now: float):
+        return await self.run(self.database.enqueue_updates, updates, now)
+    
+    async def fetch_updates(self, partitions, limit: int):
+        return await self.run(self.database.fetch_updates, partitions, limit)
+    
+    async def mark_updates_processed(self, update_ids, now: float):
+        return await self.run(self.database.mark_updates_processed, update_ids, now)
+    
+    async def purge_updates(self, before: float):
+        return await self.run(self.database.purge_updates, before)
+    
+    async def get_user_preferences(self):
+        return await self.run(self.database.get_user_preferences)
+    
+    async def set_user_preferences(self, user_id: int, digest_minute, digest_enabled: bool,
+                                   reminders_enabled: bool, reminder_lead: int, timezone: str = None):
+        return await self.run(
+            self.database.set_user_preferences, user_id, digest_minute, digest_enabled, reminders_enabled,
+            reminder_lead, timezone
+        )
+    
+    async def close(self):
+        """Закрывает соединение потока БД и останавливает поток"""
+        await self.run(self.database.close)
+        self._executor.shutdown(wait=True)
+
+# Прежние глобальные экземпляры db и async_db создаются контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"db": "database", "async_db": "async_database"})
\ No newline at end of file
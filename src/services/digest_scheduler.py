@@ -0,0 +1,133 @@
+# services/digest_scheduler.py
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from telegram.ext import ContextTypes
+from src.services.clock import Clock
+from src.services.user_preferences import PreferenceStore
+from src.services.user_registry import UserRegistry
+from src.container import container
+
+logger = logging.getLogger(__name__)
+
+DIGEST_JOB_NAME = "daily_schedule"
+# Сколько пропущенных минут догоняется, если задание опоздало
+MAX_CATCHUP_MINUTES = 15
+
+MINUTE = timedelta(minutes=1)
+
+
+class DigestScheduler:
+    """Рассылка расписания на завтра по минутам доставки.
+
+    Получатели раскладываются по минуте суток — выбранной в настройках или
+    назначенной автоматически в окне вокруг DIGEST_TIME. Раскладка пересчитывается
+    только при изменении реестра пользователей или настроек. Повторяющееся раз в
+    минуту задание отправляет получателей наступившей минуты, поэтому вечерняя
+    нагрузка распределена по окну, а не приходится на один момент.
+
+    Минута доставки — местное время пояса пользователя. Наступившие минуты
+    считаются в UTC и переводятся в каждый используемый пояс: при переходе на
+    зимнее время повторившийся час не рассылается второй раз, а минуты, пропущенные
+    при переходе на летнее, в этот день не наступают.
+    """
+
+    def __init__(self, job_queue,
+                 send_callback: Callable[[ContextTypes.DEFAULT_TYPE, datetime, List[int]], Awaitable[None]],
+                 registry: UserRegistry, preferences: PreferenceStore,
+                 claim_run: Optional[Callable[[str, str], Awaitable[bool]]] = None,
+                 before_tick: Optional[Callable[[], Awaitable[None]]] = None,
+                 clock: Clock = None):
+        self.job_queue = job_queue
+        self.send_callback = send_callback
+        self.registry = registry
+        self.preferences = preferences
+        # В кластере минуту рассылает процесс, первым зарегистрировавший ее ключ
+        self.claim_run = claim_run
+        self.before_tick = before_tick
+        self.clock = clock if clock is not None else container.clock
+        # {пояс (None — пояс по умолчанию): {минута: [user_id]}}
+        self._buckets: Dict[Optional[str], Dict[int, List[int]]] = {}
+        self._buckets_version = None
+        self._last_minute: Optional[datetime] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _zone_buckets(self) -> Dict[Optional[str], Dict[int, List[int]]]:
+        version = (self.registry.version, self.preferences.version)
+        if version != self._buckets_version:
+            default_zone = self.clock.default_zone.key
+            zones: Dict[Optional[str], Dict[int, List[int]]] = {}
+            for user_id in self.registry.get_all_users():
+                preferences = self.preferences.get(user_id)
+                if preferences.digest_enabled:
+                    zone = preferences.timezone if preferences.timezone != default_zone else None
+                    zones.setdefault(zone, {}).setdefault(self.preferences.digest_minute(user_id), []).append(user_id)
+            self._buckets = zones
+            self._buckets_version = version
+            minutes = sum(len(buckets) for buckets in zones.values())
+            peak = max((len(users) for buckets in zones.values() for users in buckets.values()), default=0)
+            logger.info(
+                f"🗓 Рассылка расписания разложена по {minutes} минутам в {len(zones)} поясах, "
+                f"максимум {peak} получателей в минуту"
+            )
+        return self._buckets
+
+    def buckets(self, zone: Optional[str] = None) -> Dict[int, List[int]]:
+        """Получатели пояса по минуте суток: {минута: [user_id]} (None — пояс по умолчанию)"""
+        return self._zone_buckets().get(zone, {})
+
+    def due_minutes(self, now: datetime) -> List[datetime]:
+        """Минуты (UTC), наступившие с прошлого запуска (не больше MAX_CATCHUP_MINUTES)"""
+        current = self.clock.aware(now).astimezone(timezone.utc).replace(second=0, microsecond=0)
+        if self._last_minute is not None and current <= self._last_minute:
+            return []
+        if self._last_minute is None:
+            start = current
+        else:
+            start = max(self._last_minute + MINUTE, current - MAX_CATCHUP_MINUTES * MINUTE)
+        self._last_minute = current
+        count = int((current - start) / MINUTE) + 1
+        return [start + MINUTE * index for index in range(count)]
+
+    async def tick(self, context: ContextTypes.DEFAULT_TYPE, now: datetime = None) -> int:
+        """Запускает рассылку для наступивших минут. Возвращает число запущенных рассылок"""
+        minutes = self.due_minutes(now or self.clock.now())
+        if not minutes:
+            return 0
+        if self.before_tick:
+            await self.before_tick()
+
+        zones = self._zone_buckets()
+        started = 0
+        for minute in minutes:
+            for zone, buckets in zones.items():
+                local = minute.astimezone(self.clock.zone(zone))
+                # Повторившийся при переходе на зимнее время час: эти минуты уже были
+                if local.fold:
+                    continue
+                users = buckets.get(local.hour * 60 + local.minute)
+                if not users:
+                    continue
+                run_key = local.strftime("%Y-%m-%d_%H%M") + (f"@{zone}" if zone else "")
+                if self.claim_run and not await self.claim_run(DIGEST_JOB_NAME, run_key):
+                    continue
+                # Рассылка минуты может идти дольше минуты: следующая начинается, не дожидаясь ее
+                task = asyncio.create_task(self.send_callback(context, local, users))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                started += 1
+        return started
+
+    async def _tick_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.tick(context)
+
+    async def wait_idle(self):
+        """Дожидается запущенных рассылок"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def start(self):
+        """Регистрирует ежеминутное задание в начале каждой минуты"""
+        first = 61 - self.clock.now().second
+        self.job_queue.run_repeating(self._tick_job, interval=60, first=first, name=DIGEST_JOB_NAME)
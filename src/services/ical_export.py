@@ -0,0 +1,238 @@
+# services/ical_export.py
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Tuple
+from src.services.database import Database, AsyncDatabase
+from src.services.schedule_manager import ScheduleManager
+from src.services.timetable import GroupTimetable
+from src.container import legacy_attribute
+
+logger = logging.getLogger(__name__)
+
+PRODID = "-//schedule-bot//Расписание//RU"
+UID_DOMAIN = "schedule-bot"
+
+
+def _escape(text: str) -> str:
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Переносит строку длиннее 75 байт (RFC 5545, 3.1)"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    current = ""
+    limit = 75
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            # Продолжение начинается с пробела, он тоже занимает байт
+            limit = 74
+        current += char
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def _stamp(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime("%Y%m%dT%H%M%SZ")
+
+
+class CalendarFeed:
+    """Готовый файл календаря группы"""
+    __slots__ = ("group_id", "body", "etag", "last_modified")
+
+    def __init__(self, group_id: str, body: bytes, last_modified: float):
+        self.group_id = group_id
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        # Секунды: точность заголовка Last-Modified
+        self.last_modified = int(last_modified)
+
+    @property
+    def http_date(self) -> str:
+        return formatdate(self.last_modified, usegmt=True)
+
+
+class ICalExporter:
+    """Экспорт расписания группы и контрольных мероприятий в iCalendar.
+
+    Занятия разворачиваются по календарю семестров (с праздниками и переносами)
+    и кэшируются по версии расписания, мероприятия — по версии контрольных
+    мероприятий. Файл пересобирается только при изменении одной из версий.
+    """
+
+    def __init__(self, manager: ScheduleManager, database: Database):
+        self.manager = manager
+        self.database = database
+        # {группа: (версия расписания, строки VEVENT занятий)}
+        self._lessons: Dict[str, Tuple[int, List[str]]] = {}
+        # {группа: (версия расписания, версия мероприятий, файл)}
+        self._feeds: Dict[str, Tuple[int, int, CalendarFeed]] = {}
+
+    def feed(self, group: str = None) -> CalendarFeed:
+        """Файл календаря группы; повторные вызовы без изменений возвращают тот же объект"""
+        group_timetable = self.manager.timetable.group(group)
+        group_id = group_timetable.group_id
+        timetable_version = self.manager.timetable.version
+        events_version = self.database.control_events_version
+
+        cached = self._feeds.get(group_id)
+        if cached and cached[0] == timetable_version and cached[1] == events_version:
+            return cached[2]
+
+        now = time.time()
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODID}",
+            "CALSCALE:GREGORIAN",
+            f"X-WR-CALNAME:{_escape(group_timetable.title)}",
+            f"X-WR-TIMEZONE:{self.manager.group_zone(group_id).key}",
+        ]
+        lines.extend(self._lesson_lines(group_timetable, timetable_version, now))
+        lines.extend(self._event_lines(group_timetable, now))
+        lines.append("END:VCALENDAR")
+
+        body = ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode("utf-8")
+        feed = CalendarFeed(group_id, body, now)
+        self._feeds[group_id] = (timetable_version, events_version, feed)
+        logger.info(f"📆 Календарь группы {group_id} собран: {len(body)} байт")
+        return feed
+
+    def _lesson_lines(self, group_timetable: GroupTimetable, version: int, now: float) -> List[str]:
+        cached = self._lessons.get(group_timetable.group_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        calendar = group_timetable.calendar
+        clock = self.manager.clock
+        zone = self.manager.group_zone(group_timetable.group_id)
+        stamp = _stamp(now)
+        lines = []
+        day = calendar.first_day
+        while day <= calendar.last_day:
+            day_schedule = calendar.day_schedule(day)
+            if day_schedule:
+                for index, subject in enumerate(day_schedule.subjects):
+                    start = clock.localize(day, subject.start, zone).astimezone(timezone.utc)
+                    end = clock.localize(day, subject.end, zone).astimezone(timezone.utc)
+                    lines.extend([
+                        "BEGIN:VEVENT",
+                        f"UID:{day:%Y%m%d}-{subject.start:%H%M}-{index}-{group_timetable.group_id}@{UID_DOMAIN}",
+                        f"DTSTAMP:{stamp}",
+                        # Время в UTC, переведенное из пояса группы: календарь покажет занятие
+                        # в правильный момент в любом поясе, с учетом перехода на летнее время
+                        f"DTSTART:{start:%Y%m%dT%H%M%SZ}",
+                        f"DTEND:{end:%Y%m%dT%H%M%SZ}",
+                        f"SUMMARY:{_escape(subject.name)}",
+                        f"LOCATION:{_escape(subject.room)}",
+                        f"DESCRIPTION:{_escape(subject.lesson_type)}",
+                        "END:VEVENT",
+                    ])
+            day += timedelta(days=1)
+
+        self._lessons[group_timetable.group_id] = (version, lines)
+        return lines
+
+    def _event_lines(self, group_timetable: GroupTimetable, now: float) -> List[str]:
+        calendar = group_timetable.calendar
+        stamp = _stamp(now)
+        lines = []
+        events = self.database.get_control_events_between(
+            calendar.first_day.strftime("%Y-%m-%d"), calendar.last_day.strftime("%Y-%m-%d"),
+            group_timetable.group_id
+        )
+        for date_str, subject_name, event_type in events:
+            day = datetime.strptime(date_str, "%Y-%m-%d").date()
+            uid_hash = hashlib.sha1(f"{subject_name}|{event_type}".encode("utf-8")).hexdigest()[:12]
+            lines.extend([
+                "BEGIN:VEVENT",
+                f"UID:event-{day:%Y%m%d}-{uid_hash}-{group_timetable.group_id}@{UID_DOMAIN}",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+                f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}",
+                f"SUMMARY:{_escape(f'🚨 {event_type}: {subject_name}')}",
+                "END:VEVENT",
+            ])
+        return lines
+
+
+def is_not_modified(feed: CalendarFeed, if_none_match: str = None, if_modified_since: str = None) -> bool:
+    """Проверка условного запроса: If-None-Match приоритетнее If-Modified-Since (RFC 9110)"""
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or feed.etag in tags or f"W/{feed.etag}" in tags
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return feed.last_modified <= since
+    return False
+
+
+class CalendarFeedServer:
+    """HTTP-лента календаря: GET /calendar/<группа>.ics с поддержкой ETag и If-Modified-Since"""
+
+    def __init__(self, exporter: ICalExporter, async_database: AsyncDatabase, listen: str, port: int):
+        self.exporter = exporter
+        self.async_database = async_database
+        self.listen = listen
+        self.port = port
+        # aiohttp нужен только самой ленте: импортируется при ее создании, а не при импорте модуля
+        from aiohttp import web
+        self.web_app = web.Application()
+        self.web_app.router.add_get("/calendar/{group}.ics", self._handle_feed)
+        self._runner = None
+
+    @property
+    def bound_port(self) -> int:
+        if self._runner and self._runner.addresses:
+            return self._runner.addresses[0][1]
+        return self.port
+
+    async def _handle_feed(self, request):
+        from aiohttp import web
+        group = request.match_info["group"]
+        if not self.exporter.manager.has_group(group):
+            return web.Response(status=404)
+
+        # Сборка обращается к БД и может занять время — выполняется в потоке БД
+        feed = await self.async_database.run(self.exporter.feed, group)
+        headers = {
+            "ETag": feed.etag,
+            "Last-Modified": feed.http_date,
+            "Cache-Control": "public, max-age=300",
+        }
+        if is_not_modified(feed, request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")):
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=feed.body,
+            content_type="text/calendar",
+            charset="utf-8",
+            headers=dict(headers, **{"Content-Disposition": f'inline; filename="{group}.ics"'})
+        )
+
+    async def start(self):
+        from aiohttp import web
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"📆 Лента календаря доступна на {self.listen}:{self.bound_port}/calendar/<группа>.ics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Глобальный экспортер календаря создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"ical_exporter": "ical_exporter"})
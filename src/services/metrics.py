@@ -0,0 +1,273 @@
+# services/metrics.py
+import bisect
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Базовый класс метрики: значения хранятся по кортежу значений меток"""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, func: Callable[[], float] = None):
+        super().__init__(name, help_text)
+        self.func = func
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def _samples(self) -> List[str]:
+        value = self._value
+        if self.func is not None:
+            try:
+                value = self.func()
+            except Exception as e:
+                logger.debug(f"Ошибка вычисления метрики {self.name}: {e}")
+        return [f"{self.name} {value}"]
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с фиксированными корзинами"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {метки: [счетчики корзин..., +Inf], сумма}
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            state[0][index] += 1
+            state[1][0] += value
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def time(self, **labels):
+        """Контекстный менеджер, измеряющий длительность блока"""
+        return _Timer(self, labels)
+
+    def wrap(self, func, **labels):
+        """Оборачивает синхронную функцию измерением длительности"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - started, **labels)
+        return wrapper
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их выдача в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, func: Callable[[], float] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, func))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт с метриками для Prometheus"""
+
+    def __init__(self, registry: MetricsRegistry, listen: str, port: int, path: str = "/metrics"):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self.path = path
+        # aiohttp импортируется только при создании сервера: модуль метрик импортируют все сервисы
+        from aiohttp import web
+        self.web_app = web.Application()
+        self.web_app.router.add_get(self.path, self._handle_metrics)
+        self._runner = None
+
+    @property
+    def bound_port(self) -> int:
+        if self._runner and self._runner.addresses:
+            return self._runner.addresses[0][1]
+        return self.port
+
+    async def _handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"},
+            charset="utf-8"
+        )
+
+    async def start(self):
+        from aiohttp import web
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"📈 Метрики доступны на {self.listen}:{self.bound_port}{self.path}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
+
+HANDLER_DURATION = metrics.histogram(
+    "bot_handler_duration_seconds", "Длительность обработчиков обновлений", ("handler",)
+)
+HANDLER_ERRORS = metrics.counter(
+    "bot_handler_errors_total", "Необработанные исключения в обработчиках", ("handler",)
+)
+DB_QUERY_DURATION = metrics.histogram(
+    "bot_db_query_duration_seconds", "Длительность запросов к БД", ("method",)
+)
+MESSAGES_SENT = metrics.counter(
+    "bot_messages_sent_total", "Отправленные сообщения по итогу", ("result",)
+)
+SEND_DURATION = metrics.histogram(
+    "bot_send_duration_seconds", "Длительность вызова send_message"
+)
+TELEGRAM_RETRY_AFTER = metrics.counter(
+    "bot_telegram_retry_after_total", "Ответы Telegram 429 (RetryAfter)"
+)
+NOTIFIER_RUN_DURATION = metrics.histogram(
+    "bot_notifier_run_duration_seconds", "Длительность рассылок уведомлений", ("job",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+
+
+def instrument_handler(name: str, callback):
+    """Оборачивает асинхронный обработчик PTB измерением длительности и ошибок"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+    return wrapper
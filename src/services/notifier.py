@@ -1,30 +1,80 @@
 # services/notifier.py
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
 from telegram.ext import ContextTypes
-from telegram.error import TelegramError
-from src.services.schedule_manager import schedule_manager
-from src.services.database import db
-from src.utils.keyboards import get_main_keyboard
+from src.container import AppContainer, container
+from src.services.reminder_planner import ReminderPlanner
+from src.services.digest_scheduler import DigestScheduler
+from src.services.cluster import LocalCoordinator
+from src.services.metrics import NOTIFIER_RUN_DURATION
+from src.utils.config import SCHEDULE_RELOAD_INTERVAL, USER_REGISTRY_FLUSH_INTERVAL, DIGEST_TIME, DIGEST_SPREAD_MINUTES
 
 logger = logging.getLogger(__name__)
 
+# Период очистки истекших состояний диалогов, секунды
+STATE_PURGE_INTERVAL = 600
+
+# Период очистки завершенных рассылок и сколько они хранятся после завершения, секунды
+BROADCAST_PURGE_INTERVAL = 3600
+BROADCAST_RETENTION = 7 * 24 * 3600
+
+# Как часто процесс кластера перечитывает реестр пользователей перед рассылками, секунды
+REGISTRY_REFRESH_INTERVAL = 300
+
 class Notifier:
-    def __init__(self, application):
+    def __init__(self, application, coordinator=None, services: AppContainer = None):
         self.application = application
+        # Сервисы берутся из контейнера приложения
+        services = services or container
+        self.schedule_manager = services.schedule_manager
+        self.async_db = services.async_database
+        self.broadcaster = services.broadcaster
+        self.broadcast_jobs = services.broadcast_jobs
+        self.user_registry = services.user_registry
+        self.state_store = services.state_store
+        self.user_preferences = services.user_preferences
+        self.clock = services.clock
         self.job_queue = application.job_queue
+        # Задания регистрируются в каждом процессе, выполняет их один (см. ClusterCoordinator)
+        self.coordinator = coordinator or LocalCoordinator()
+        self.reminder_planner = ReminderPlanner(
+            self.job_queue, self.send_lesson_reminder, claim_run=self.coordinator.claim_run,
+            leads=self.user_preferences.reminder_leads, manager=self.schedule_manager
+        )
+        self.digest_scheduler = DigestScheduler(
+            self.job_queue, self.send_digest_bucket, self.user_registry, self.user_preferences,
+            claim_run=self.coordinator.claim_run,
+            before_tick=self._refresh_shared_state if self.coordinator.enabled else None,
+            clock=self.clock
+        )
+        self._planned_leads = None
+        self._registry_refreshed_at = 0.0
     
     async def send_daily_schedule(self, context: ContextTypes.DEFAULT_TYPE):
-        """Отправляет расписание на завтрашний день всем пользователям"""
+        """Отправляет расписание на завтрашний день сразу всем пользователям (ручной запуск, замеры).
+        Регулярная рассылка идет по минутам доставки, см. send_digest_bucket"""
+        started = time.perf_counter()
         try:
             # Логируем текущее время для отладки
-            now_utc = datetime.utcnow()
-            now_moscow = now_utc + timedelta(hours=3)  # UTC+3 для Москвы
-            logger.info(f"🕘 Запуск отправки ежедневного расписания. Время: UTC {now_utc.strftime('%H:%M')}, Moscow {now_moscow.strftime('%H:%M')}")
+            now = self.clock.now()
+            logger.info(
+                f"🕘 Запуск отправки ежедневного расписания. Время: UTC {now.astimezone(timezone.utc).strftime('%H:%M')}, "
+                f"{now.tzinfo} {now.strftime('%H:%M')}"
+            )
+            
+            tomorrow_key = (now.date() + timedelta(days=1)).strftime("%Y-%m-%d")
+            if not await self.coordinator.claim_run("daily_schedule", tomorrow_key):
+                return
+            if self.coordinator.enabled:
+                await self._refresh_shared_state(force=True)
             
-            tomorrow_schedule = schedule_manager.get_tomorrow_schedule()
-            users = db.get_all_users()
+            users = [
+                user_id for user_id in self.user_registry.get_all_users()
+                if self.user_preferences.get(user_id).digest_enabled
+            ]
             
             if not users:
                 logger.info("❌ Нет пользователей для отправки расписания")
@@ -32,114 +82,206 @@ class Notifier:
             
             logger.info(f"📤 Найдено {len(users)} пользователей для рассылки")
             
-            reply_markup = get_main_keyboard()
-            success_count = 0
-            fail_count = 0
-            
             # Отправляем сообщение о начале рассылки (первому пользователю)
-            if users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=users[0],
-                        text=f"🔄 Начинаю рассылку расписания на завтра для {len(users)} пользователей..."
-                    )
-                except:
-                    pass
-            
-            for user_id in users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=tomorrow_schedule,
-                        reply_markup=reply_markup
-                    )
-                    success_count += 1
-                    # Небольшая задержка чтобы не превысить лимиты Telegram
-                    await asyncio.sleep(0.1)
-                except TelegramError as e:
-                    logger.warning(f"❌ Не удалось отправить сообщение пользователю {user_id}: {e}")
-                    fail_count += 1
-                    if "bot was blocked" in str(e).lower():
-                        logger.info(f"🚫 Пользователь {user_id} заблокировал бота")
+            await self.broadcaster.send(
+                context.bot,
+                users[0],
+                f"🔄 Начинаю рассылку расписания на завтра для {len(users)} пользователей..."
+            )
+            
+            success_count, fail_count, elapsed = await self._send_digest(context.bot, users, tomorrow_key)
             
             # Логируем результат
-            result_msg = f"✅ Ежедневное расписание отправлено: Успешно {success_count}, Не удалось {fail_count}"
+            rate = (success_count + fail_count) / elapsed if elapsed > 0 else 0.0
+            result_msg = (
+                f"✅ Ежедневное расписание отправлено: Успешно {success_count}, Не удалось {fail_count} "
+                f"({elapsed:.1f} с, {rate:.1f} сообщ./с)"
+            )
             logger.info(result_msg)
             
             # Отправляем отчет первому пользователю
-            if users and success_count > 0:
-                try:
-                    await context.bot.send_message(
-                        chat_id=users[0],
-                        text=result_msg
-                    )
-                except:
-                    pass
+            if success_count > 0:
+                await self.broadcaster.send(context.bot, users[0], result_msg)
             
         except Exception as e:
             logger.error(f"❌ Критическая ошибка отправки ежедневного расписания: {e}")
+        finally:
+            NOTIFIER_RUN_DURATION.observe(time.perf_counter() - started, job="daily_schedule")
+    
+    async def send_digest_bucket(self, context: ContextTypes.DEFAULT_TYPE, minute: datetime, users: List[int]):
+        """Отправляет расписание на завтра получателям одной минуты доставки (вызывается DigestScheduler).
+        minute — местное время пояса получателей: «завтра» считается в нем"""
+        started = time.perf_counter()
+        try:
+            tomorrow_key = (minute.date() + timedelta(days=1)).strftime("%Y-%m-%d")
+            dedupe_suffix = minute.strftime(":%H%M")
+            if minute.tzinfo is not None and minute.tzinfo != self.clock.default_zone:
+                dedupe_suffix += f"@{minute.tzinfo}"
+            success_count, fail_count, elapsed = await self._send_digest(
+                context.bot, users, tomorrow_key, dedupe_suffix=dedupe_suffix
+            )
+            logger.info(
+                f"✅ Расписание на завтра ({minute.strftime('%H:%M')}): "
+                f"Успешно {success_count}, Не удалось {fail_count} ({elapsed:.1f} с)"
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки расписания на завтра ({minute.strftime('%H:%M')}): {e}")
+        finally:
+            NOTIFIER_RUN_DURATION.observe(time.perf_counter() - started, job="daily_schedule_bucket")
+    
+    async def _send_digest(self, bot, users: List[int], tomorrow_key: str, dedupe_suffix: str = ""):
+        """Рассылка по группам: каждая группа получает свое расписание. Возвращает (успешно, не удалось, секунды)"""
+        default_group = self.schedule_manager.default_group
+        group_map = self.user_registry.get_user_group_map()
+        users_by_group: Dict[str, List[int]] = {}
+        for user_id in users:
+            groups = group_map.get(user_id)
+            if groups is None:
+                continue
+            for group_id in groups or (default_group,):
+                if self.schedule_manager.has_group(group_id):
+                    users_by_group.setdefault(group_id, []).append(user_id)
+        
+        success_count = 0
+        fail_count = 0
+        elapsed = 0.0
+        unreachable_count = 0
+        
+        tomorrow = datetime.strptime(tomorrow_key, "%Y-%m-%d")
+        for group_id, group_users in users_by_group.items():
+            tomorrow_schedule = await self.async_db.run(
+                self.schedule_manager.format_schedule_for_day, tomorrow, True, group_id
+            )
+            # Ключ не дает разослать одно и то же расписание дважды (например, после перезапуска)
+            job_id = await self.broadcast_jobs.submit(
+                "daily",
+                tomorrow_schedule,
+                group_users,
+                dedupe_key=f"daily:{tomorrow_key}:{group_id}{dedupe_suffix}",
+                keyboard="main"
+            )
+            if job_id is None:
+                logger.error(f"❌ Не удалось создать задание рассылки для группы {group_id}")
+                continue
+            result = await self.broadcast_jobs.run(bot, job_id)
+            logger.info(f"📤 Группа {group_id}: {result}")
+            
+            success_count += result.success
+            fail_count += result.failed
+            elapsed += result.elapsed
+            unreachable_count += result.unreachable
+        
+        if unreachable_count:
+            logger.info(f"🚫 Исключены из рассылок (бот заблокирован и т. п.): {unreachable_count} пользователей")
+        return success_count, fail_count, elapsed
+    
+    async def _refresh_shared_state(self, force: bool = False):
+        """В кластере настройки и пользователей меняют и другие процессы: перечитываем их из БД.
+        Настройки — перед каждой минутой рассылки, если изменилась их версия в БД;
+        реестр — не чаще REGISTRY_REFRESH_INTERVAL"""
+        if await self.user_preferences.refresh_async():
+            self.on_preferences_changed()
+        now = time.monotonic()
+        if force or now - self._registry_refreshed_at >= REGISTRY_REFRESH_INTERVAL:
+            await self.user_registry.refresh_async()
+            self._registry_refreshed_at = now
+    
+    def on_preferences_changed(self):
+        """Перестраивает план напоминаний, если изменился набор используемых интервалов"""
+        leads = self.user_preferences.reminder_leads()
+        if leads != self._planned_leads:
+            self._planned_leads = leads
+            if self.job_queue:
+                self.reminder_planner.rebuild()
     
-    async def check_upcoming_lessons(self, context: ContextTypes.DEFAULT_TYPE):
-        """Проверяет ближайшие занятия и отправляет уведомления"""
+    def render_reminder(self, lessons: List[dict]) -> Dict[str, str]:
+        """Готовит текст напоминания для каждой группы; одинаковые занятия схлопываются"""
+        show_group = len(self.schedule_manager.groups) > 1
+        blocks_by_group = {}
+        for lesson in lessons:
+            blocks = blocks_by_group.setdefault(lesson['group'], [])
+            block = (
+                f"📚 {lesson['name']}\n"
+                f"🏫 {lesson['room']}\n"
+                f"📝 {lesson['type']}\n"
+                f"⏰ {lesson['start_time']}"
+            )
+            if block not in blocks:
+                blocks.append(block)
+        
+        rendered = {}
+        for group_id, blocks in blocks_by_group.items():
+            header = f"👥 {self.schedule_manager.groups.get(group_id, group_id)}\n" if show_group else ""
+            rendered[group_id] = header + "\n\n".join(blocks)
+        return rendered
+    
+    async def send_lesson_reminder(self, context: ContextTypes.DEFAULT_TYPE, lessons: List[dict]):
+        """Отправляет одно напоминание о занятиях, начинающихся одновременно (вызывается планировщиком).
+        Каждый получатель получает напоминания только со своим интервалом"""
+        started = time.perf_counter()
         try:
-            now_utc = datetime.utcnow()
-            now_moscow = now_utc + timedelta(hours=3)
-            current_time = now_moscow.strftime("%H:%M")
-            current_date = now_moscow.strftime("%Y-%m-%d")
+            if self.coordinator.enabled:
+                await self._refresh_shared_state(force=True)
+            default_lead = int(self.reminder_planner.lead.total_seconds() // 60)
+            lessons_by_lead: Dict[int, List[dict]] = {}
+            for lesson in lessons:
+                lessons_by_lead.setdefault(lesson.get('lead', default_lead), []).append(lesson)
+            rendered_by_lead = {lead: self.render_reminder(items) for lead, items in lessons_by_lead.items()}
+            
+            # Получатели с одинаковым интервалом и набором групп получают один и тот же текст
+            default_group = self.schedule_manager.default_group
+            recipients_by_groups: Dict[tuple, List[int]] = {}
+            for user_id, groups in self.user_registry.get_user_group_map().items():
+                preferences = self.user_preferences.get(user_id)
+                rendered = rendered_by_lead.get(preferences.reminder_lead)
+                if not preferences.reminders_enabled or rendered is None:
+                    continue
+                relevant = tuple(group for group in (groups or (default_group,)) if group in rendered)
+                if relevant:
+                    recipients_by_groups.setdefault((preferences.reminder_lead, relevant), []).append(user_id)
             
-            logger.debug(f"🔍 Проверка ближайших занятий: Moscow {current_time}")
+            logger.info(
+                f"⏰ Отправка напоминания: {', '.join(sorted({lesson['name'] for lesson in lessons}))} "
+                f"в {lessons[0]['start_time']}, вариантов текста: {len(recipients_by_groups)}"
+            )
             
-            # Используем московское время для получения расписания
-            subjects = schedule_manager.get_subjects_with_times(now_moscow)
+            results = await asyncio.gather(*(
+                self.broadcaster.broadcast(
+                    context.bot, users,
+                    f"🔔 Напоминание!\nЧерез {lead} минут начинается:\n"
+                    + "\n\n".join(rendered_by_lead[lead][group] for group in groups)
+                )
+                for (lead, groups), users in recipients_by_groups.items()
+            ))
             
-            if not subjects:
-                logger.debug("📭 На сегодня занятий нет")
-                return
+            success_count = sum(result.success for result in results)
+            fail_count = sum(result.failed for result in results)
+            logger.info(f"✅ Напоминание отправлено: Успешно {success_count}, Не удалось {fail_count}")
             
-            for subject in subjects:
-                start_time = subject['start_time']
-                subject_name = subject['name']
-                room = subject['room']
-                lesson_type = subject['type']
-                
-                # Вычисляем время за 10 минут до начала (в московском времени)
-                start_dt = datetime.strptime(start_time, "%H:%M")
-                reminder_time = (start_dt - timedelta(minutes=10)).strftime("%H:%M")
-                
-                # Если текущее время совпадает с временем напоминания
-                if current_time == reminder_time:
-                    message = (
-                        f"🔔 Напоминание!\n"
-                        f"Через 10 минут начинается:\n"
-                        f"📚 {subject_name}\n"
-                        f"🏫 {room}\n"
-                        f"📝 {lesson_type}\n"
-                        f"⏰ {start_time}"
-                    )
-                    
-                    logger.info(f"⏰ Отправка напоминания: {subject_name} в {start_time}")
-                    
-                    # Отправляем всем пользователям
-                    users = db.get_all_users()
-                    success_count = 0
-                    fail_count = 0
-                    
-                    for user_id in users:
-                        try:
-                            await context.bot.send_message(
-                                chat_id=user_id,
-                                text=message
-                            )
-                            success_count += 1
-                            await asyncio.sleep(0.1)
-                        except TelegramError as e:
-                            logger.warning(f"❌ Не удалось отправить напоминание пользователю {user_id}: {e}")
-                            fail_count += 1
-                    
-                    logger.info(f"✅ Напоминание отправлено: Успешно {success_count}, Не удалось {fail_count}")
-                    
         except Exception as e:
-            logger.error(f"❌ Ошибка проверки ближайших занятий: {e}")
+            logger.error(f"❌ Ошибка отправки напоминания: {e}")
+        finally:
+            NOTIFIER_RUN_DURATION.observe(time.perf_counter() - started, job="lesson_reminder")
+    
+    async def flush_user_registry(self, context: ContextTypes.DEFAULT_TYPE):
+        """Записывает накопленные изменения пользователей в БД"""
+        await self.user_registry.flush_async()
+    
+    async def purge_dialog_state(self, context: ContextTypes.DEFAULT_TYPE):
+        """Удаляет истекшие состояния диалогов"""
+        purged = await self.state_store.purge_expired()
+        if purged:
+            logger.info(f"🧹 Удалено истекших состояний диалогов: {purged}")
+    
+    async def purge_broadcast_jobs(self, context: ContextTypes.DEFAULT_TYPE):
+        """Удаляет завершенные рассылки старше BROADCAST_RETENTION вместе с очередью получателей"""
+        purged = await self.async_db.purge_broadcast_jobs(time.time() - BROADCAST_RETENTION)
+        if purged:
+            logger.info(f"🧹 Удалено завершенных рассылок: {purged}")
+    
+    async def reload_schedule(self, context: ContextTypes.DEFAULT_TYPE):
+        """Проверяет, изменился ли файл расписания, и перезагружает его"""
+        await self.schedule_manager.reload_if_changed()
     
     def setup_jobs(self):
         """Настраивает регулярные задания"""
@@ -154,24 +296,55 @@ class Notifier:
             for job in self.job_queue.jobs():
                 self.job_queue.scheduler.remove_job(job.id)
             
-            # Ежедневная отправка расписания в 21:00 по Москве
-            # В Docker установлена TZ=Europe/Moscow, поэтому используем локальное время
-            self.job_queue.run_daily(
-                self.send_daily_schedule,
-                time=datetime.strptime("21:00", "%H:%M").time(),  # 21:00 Moscow Time
-                name="daily_schedule",
-                days=tuple(range(7))  # Все дни недели
+            # Расписание на завтра: каждую минуту — получателям, выбравшим эту минуту
+            # (остальные распределены по окну от DIGEST_TIME) по местному времени пояса получателя
+            self.digest_scheduler.start()
+            logger.info(
+                f"✅ Задание 'daily_schedule' настроено: с {DIGEST_TIME} в течение {DIGEST_SPREAD_MINUTES} мин "
+                f"и в выбранное пользователями время"
             )
-            logger.info("✅ Задание 'daily_schedule' настроено на 21:00 Moscow Time")
             
-            # Проверка ближайших занятий каждую минуту
+            # Напоминания до занятий (интервал выбирает пользователь): одноразовые задания на точное время
+            self._planned_leads = self.user_preferences.reminder_leads()
+            self.reminder_planner.start()
+            self.schedule_manager.add_change_listener(self.reminder_planner.rebuild)
+            logger.info("✅ Задание 'lesson_reminders' настроено")
+            
+            # Горячая перезагрузка файла расписания без перезапуска бота
             self.job_queue.run_repeating(
-                self.check_upcoming_lessons,
-                interval=60,  # 60 секунд = 1 минута
-                first=5,      # Начать через 5 секунд после запуска
-                name="lesson_reminders"
+                self.reload_schedule,
+                interval=SCHEDULE_RELOAD_INTERVAL,
+                first=SCHEDULE_RELOAD_INTERVAL,
+                name="schedule_reload"
             )
-            logger.info("✅ Задание 'lesson_reminders' настроено")
+            logger.info(f"✅ Задание 'schedule_reload' настроено (каждые {SCHEDULE_RELOAD_INTERVAL} с)")
+            
+            # Пакетная запись новых пользователей и подписок
+            self.job_queue.run_repeating(
+                self.flush_user_registry,
+                interval=USER_REGISTRY_FLUSH_INTERVAL,
+                first=USER_REGISTRY_FLUSH_INTERVAL,
+                name="user_registry_flush"
+            )
+            logger.info("✅ Задание 'user_registry_flush' настроено")
+            
+            # Очистка истекших состояний диалогов
+            self.job_queue.run_repeating(
+                self.purge_dialog_state,
+                interval=STATE_PURGE_INTERVAL,
+                first=STATE_PURGE_INTERVAL,
+                name="state_store_purge"
+            )
+            logger.info("✅ Задание 'state_store_purge' настроено")
+            
+            # Очистка завершенных рассылок: очередь получателей растет с каждой рассылкой
+            self.job_queue.run_repeating(
+                self.purge_broadcast_jobs,
+                interval=BROADCAST_PURGE_INTERVAL,
+                first=BROADCAST_PURGE_INTERVAL,
+                name="broadcast_jobs_purge"
+            )
+            logger.info("✅ Задание 'broadcast_jobs_purge' настроено")
             
             # Тестовое задание - запустить через 1 минуту после старта для проверки
             self.job_queue.run_once(
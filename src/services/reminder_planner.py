@@ -0,0 +1,121 @@
+# services/reminder_planner.py
+import logging
+from datetime import datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from telegram.ext import ContextTypes
+from src.services.schedule_manager import ScheduleManager
+from src.container import container
+
+logger = logging.getLogger(__name__)
+
+REMINDER_LEAD = timedelta(minutes=10)
+REMINDER_JOB_PREFIX = "reminder_"
+
+
+class ReminderPlanner:
+    """Планировщик напоминаний о занятиях.
+
+    Вместо ежеминутного опроса заранее вычисляет моменты напоминаний на
+    сегодня и завтра для всех групп и регистрирует для каждого момента одноразовое
+    задание job_queue.run_once. План перестраивается в полночь и при изменении
+    расписания; повторная доставка одного напоминания исключена.
+
+    Интервалы напоминаний выбирают пользователи: для каждого используемого
+    интервала (leads, минуты) занятие попадает в свой момент с ключом lead.
+    Время занятий — местное время пояса группы, «сегодня» и полночь — по часам
+    менеджера расписания.
+    """
+
+    def __init__(self, job_queue, send_callback: Callable[[ContextTypes.DEFAULT_TYPE, List[Dict]], Awaitable[None]],
+                 lead: timedelta = REMINDER_LEAD,
+                 claim_run: Optional[Callable[[str, str], Awaitable[bool]]] = None,
+                 leads: Optional[Callable[[], Iterable[int]]] = None,
+                 manager: ScheduleManager = None):
+        self.job_queue = job_queue
+        self.manager = manager if manager is not None else container.schedule_manager
+        self.clock = self.manager.clock
+        self.send_callback = send_callback
+        self.lead = lead
+        # Используемые интервалы напоминаний, минуты (по умолчанию — только lead)
+        self.leads = leads
+        # В кластере напоминание отправляет процесс, первым зарегистрировавший его ключ
+        self.claim_run = claim_run
+        self._delivered: Set[str] = set()
+
+    def plan_for_date(self, date) -> List[tuple]:
+        """Возвращает список (момент напоминания, ключ, занятия) на дату.
+
+        Занятия всех групп, начинающиеся одновременно, объединяются в один момент,
+        чтобы по каждому моменту была одна рассылка, а не по рассылке на занятие.
+        """
+        day = date.date() if isinstance(date, datetime) else date
+        leads = sorted(self.leads()) if self.leads else [int(self.lead.total_seconds() // 60)]
+        lessons_by_instant: Dict[datetime, list] = {}
+        for group_id in self.manager.groups:
+            zone = self.manager.group_zone(group_id)
+            for subject in self.manager.get_subjects_with_times(day, group_id):
+                subject['group'] = group_id
+                # Местное время группы -> момент с поясом: переход на летнее время учтен,
+                # одновременные занятия групп из разных поясов попадают в один момент
+                start_at = self.clock.localize(day, subject['start'], zone)
+                for lead in leads:
+                    lessons_by_instant.setdefault(start_at - timedelta(minutes=lead), []).append(
+                        dict(subject, lead=lead)
+                    )
+
+        plan = []
+        for remind_at in sorted(lessons_by_instant):
+            # Ключ начинается с даты: по ней отбрасываются устаревшие ключи
+            key = f"{day.strftime('%Y-%m-%d')}_{remind_at.astimezone(self.clock.default_zone).strftime('%H%M')}"
+            plan.append((remind_at, key, lessons_by_instant[remind_at]))
+        return plan
+
+    def rebuild(self, now: datetime = None) -> int:
+        """Перестраивает задания напоминаний. Возвращает число запланированных"""
+        now = self.clock.now() if now is None else self.clock.aware(now)
+
+        for job in self.job_queue.jobs():
+            if job.name and job.name.startswith(REMINDER_JOB_PREFIX):
+                job.schedule_removal()
+
+        # Ключи прошедших дней больше не нужны
+        today_key = now.strftime('%Y-%m-%d')
+        self._delivered = {key for key in self._delivered if key[:10] >= today_key}
+
+        scheduled = 0
+        for offset in (0, 1):
+            day = now.date() + timedelta(days=offset)
+            for remind_at, key, lessons in self.plan_for_date(day):
+                if remind_at <= now or key in self._delivered:
+                    continue
+                self.job_queue.run_once(
+                    self._fire,
+                    when=remind_at,
+                    data={"key": key, "lessons": lessons},
+                    name=f"{REMINDER_JOB_PREFIX}{key}",
+                    # Задание выполнится, даже если цикл событий опоздал на несколько минут
+                    job_kwargs={"misfire_grace_time": int(self.lead.total_seconds())}
+                )
+                scheduled += 1
+
+        logger.info(f"🗓 План напоминаний перестроен: {scheduled} заданий")
+        return scheduled
+
+    async def _fire(self, context: ContextTypes.DEFAULT_TYPE):
+        key = context.job.data["key"]
+        if key in self._delivered:
+            logger.debug(f"Напоминание {key} уже отправлено")
+            return
+        self._delivered.add(key)
+        if self.claim_run and not await self.claim_run("lesson_reminder", key):
+            return
+        await self.send_callback(context, context.job.data["lessons"])
+
+    async def _rebuild_job(self, context: ContextTypes.DEFAULT_TYPE):
+        self.rebuild()
+
+    def start(self):
+        """Регистрирует ежедневную перестройку плана и строит план на сегодня"""
+        midnight = time(0, 0, 5, tzinfo=self.clock.default_zone)
+        self.job_queue.run_daily(self._rebuild_job, time=midnight, name="daily_reminder_plan")
+        self.rebuild()
@@ -0,0 +1,55 @@
+# services/schedule_cache.py
+import logging
+from datetime import date
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleCache:
+    """Кэш готовых текстов расписания.
+
+    Ключи имеют вид (тип, дата ГГГГ-ММ-ДД, ...). Кэш полностью сбрасывается
+    в полночь (по часам today) и точечно при изменении контрольных мероприятий.
+    """
+
+    def __init__(self, today: Callable[[], date] = date.today):
+        self._today = today
+        self._entries: Dict[tuple, str] = {}
+        self._day = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_day(self):
+        """Сбрасывает кэш при смене даты"""
+        today = self._today()
+        if today != self._day:
+            if self._entries:
+                logger.debug(f"Сброс кэша расписания ({len(self._entries)} записей) при смене даты")
+            self._entries.clear()
+            self._day = today
+
+    def get(self, key: tuple) -> Optional[str]:
+        self._check_day()
+        text = self._entries.get(key)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def set(self, key: tuple, text: str):
+        self._check_day()
+        self._entries[key] = text
+
+    def invalidate_date(self, date: str):
+        """Удаляет записи для даты и все недельные записи"""
+        stale = [key for key in list(self._entries) if key[0] == "week" or key[1] == date]
+        for key in stale:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,224 +1,287 @@
 # services/schedule_manager.py
 import logging
+import asyncio
+import os
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-from src.models.schedule_models import Subject, DaySchedule
-from src.services.database import db
+from zoneinfo import ZoneInfo
+from src.models.schedule_models import DaySchedule
+from src.services.database import Database
+from src.services.clock import Clock
+from src.services.timetable import Timetable, load_timetable, WEEKDAYS
+from src.utils.config import SCHEDULE_FILE
+from src.services.schedule_cache import ScheduleCache
+from src.container import container, legacy_attribute
 
 logger = logging.getLogger(__name__)
 
+DAY_TITLES = {
+    "понедельник": "📅 Понедельник", "вторник": "📅 Вторник", "среда": "📅 Среда",
+    "четверг": "📅 Четверг", "пятница": "📅 Пятница", "суббота": "📅 Суббота"
+}
+
 class ScheduleManager:
     """Менеджер расписания"""
     
-    def __init__(self):
-        self.numerator_schedule = self._parse_numerator_schedule()
-        self.denominator_schedule = self._parse_denominator_schedule()
-        self.semester_start = datetime(2024, 9, 1)
-    
-    def _parse_numerator_schedule(self) -> Dict[str, DaySchedule]:
-        """Парсинг расписания для числителя"""
-        return {
-            "понедельник": DaySchedule("понедельник", [
-                Subject("Практика иу5", "903", "10:10", "11:40", "семинар"),
-                Subject("Практика иу5", "903", "11:50", "13:55", "семинар"),
-                Subject("Основы программирования", "301х", "14:05", "15:35", "лекция"),
-                Subject("Основы программирования", "301х", "14:05", "15:35", "лекция")
-            ]),
-            "вторник": DaySchedule("вторник", [
-                Subject("Математический анализ", "301х", "10:10", "11:40", "лекция"),
-                Subject("Основы программирования", "524к", "12:25", "13:55", "лабораторная работа"),
-                Subject("История России", "618к", "14:05", "15:35", "семинар"),
-                Subject("Информатика", "639к", "15:55", "17:25", "семинар")
-            ]),
-            "среда": DaySchedule("среда", [
-                Subject("Начертательная геометрия", "1113л, 1111л", "8:30", "10:00", "семинар"),
-                Subject("Начертательная геометрия", "216л", "10:10", "11:40", "лекция"),
-                Subject("Социология", "216л", "11:50", "13:55", "лекция"),
-                Subject("Физическая культура", "СК", "14:30", "16:00", "семинар")
-            ]),
-            "четверг": DaySchedule("четверг", [
-                Subject("Иностранный язык", "211х, 305х", "10:10", "11:40", "семинар"),
-                Subject("Аналитическая геометрия", "114х", "11:50", "13:55", "семинар"),
-                Subject("Аналитическая геометрия", "301х", "14:05", "15:35", "лекция")
-            ]),
-            "пятница": DaySchedule("пятница", [
-                Subject("Физкультура", "СК", "13:55", "15:30", "семинар"),
-                Subject("Информатика", "601к", "15:55", "17:25", "лабораторная работа"),
-                Subject("Основы программирования", "540к", "17:35", "19:05", "семинар")
-            ]),
-            "суббота": DaySchedule("суббота", [
-                Subject("Математический анализ", "536к", "8:30", "10:00", "семинар"),
-                Subject("Социология", "537к", "10:10", "11:40", "семинар"),
-                Subject("Математический анализ", "532к", "12:25", "13:55", "семинар")
-            ])
-        }
-
-    def _parse_denominator_schedule(self) -> Dict[str, DaySchedule]:
-        """Парсинг расписания для знаменателя"""
-        return {
-            "понедельник": DaySchedule("понедельник", [
-                Subject("Основы программирования", "301х", "14:05", "15:35", "лекция"),
-                Subject("Информатика", "301х", "14:05", "15:35", "лекция")
-            ]),
-            "вторник": DaySchedule("вторник", [
-                Subject("Математический анализ", "301х", "10:10", "11:40", "лекция"),
-                Subject("Основы программирования", "524к", "12:25", "13:55", "лабораторная работа"),
-                Subject("История России", "618к", "14:05", "15:35", "семинар")
-            ]),
-            "среда": DaySchedule("среда", [
-                Subject("Начертательная геометрия", "1113л, 1111л", "8:30", "10:00", "семинар"),
-                Subject("Начертательная геометрия", "216л", "10:10", "11:40", "лекция"),
-                Subject("История России", "216л", "11:50", "13:55", "лекция"),
-                Subject("Физическая культура", "СК", "14:30", "16:00", "семинар")
-            ]),
-            "четверг": DaySchedule("четверг", [
-                Subject("Иностранный язык", "211х, 305х", "10:10", "11:40", "семинар"),
-                Subject("Аналитическая геометрия", "114х", "11:50", "13:55", "семинар"),
-                Subject("Аналитическая геометрия", "301х", "14:05", "15:35", "лекция")
-            ]),
-            "пятница": DaySchedule("пятница", [
-                Subject("Физкультура", "СК", "13:55", "15:30", "семинар"),
-                Subject("Информатика", "601к", "15:55", "17:25", "лабораторная работа"),
-                Subject("Основы программирования", "540к", "17:35", "19:05", "семинар")
-            ]),
-            "суббота": DaySchedule("суббота", [
-                Subject("Математический анализ", "536к", "8:30", "10:00", "семинар"),
-                Subject("Социология", "537к", "10:10", "11:40", "семинар"),
-                Subject("Математический анализ", "532к", "12:25", "13:55", "консультация")
-            ])
-        }
+    def __init__(self, schedule_file: str = SCHEDULE_FILE, database: Database = None, clock: Clock = None):
+        self.schedule_file = schedule_file
+        # Контрольные мероприятия и часы; без явных зависимостей используются зависимости контейнера приложения
+        self.database = database if database is not None else container.database
+        self.clock = clock if clock is not None else container.clock
+        self.cache = ScheduleCache(today=self.clock.today)
+        # Версия мероприятий, для которой собраны тексты в кэше
+        self._events_version = None
+        self._change_listeners = []
+        self._apply_timetable(load_timetable(schedule_file))
+        self.database.add_change_listener(self.cache.invalidate_date)
     
-    def is_numerator_week(self, date: datetime = None) -> bool:
-        """Определяет, является ли неделя числителем"""
-        if date is None:
-            date = datetime.now()
+    def _apply_timetable(self, timetable: Timetable):
+        """Атомарно подменяет текущее расписание"""
+        self.timetable = timetable
+        # Расписание группы по умолчанию доступно под прежними именами
+        default = timetable.group()
+        self.numerator_schedule = default.numerator
+        self.denominator_schedule = default.denominator
+        self.semester_start = default.semester_start
+        self._seen_mtime = timetable.source_mtime
+        self.cache.clear()
+    
+    def _control_events_version(self) -> int:
+        """Версия мероприятий из БД: их меняют и другие процессы кластера.
+        При смене версии тексты с прежними мероприятиями удаляются из кэша"""
+        version = self.database.control_events_version
+        if version != self._events_version:
+            self._events_version = version
+            self.cache.clear()
+        return version
+    
+    def add_change_listener(self, callback):
+        """Подписка на перезагрузку расписания (callback без аргументов)"""
+        self._change_listeners.append(callback)
+    
+    async def reload_if_changed(self) -> bool:
+        """Перечитывает файл расписания, если он изменился. Разбор выполняется вне цикла событий"""
+        try:
+            mtime = os.stat(self.schedule_file).st_mtime
+        except OSError as e:
+            logger.error(f"Файл расписания недоступен: {e}")
+            return False
+        
+        if mtime == self._seen_mtime:
+            return False
+        
+        try:
+            loop = asyncio.get_running_loop()
+            timetable = await loop.run_in_executor(
+                None, load_timetable, self.schedule_file, self.timetable.version + 1
+            )
+        except Exception as e:
+            # Ошибочный файл не должен ломать работающего бота: остаемся на прежней версии
+            logger.error(f"Ошибка перезагрузки расписания, используется прежняя версия: {e}")
+            self._seen_mtime = mtime
+            return False
         
-        delta = date - self.semester_start
-        week_number = delta.days // 7
-        return week_number % 2 == 0
+        self._apply_timetable(timetable)
+        logger.info(f"🔄 Расписание перезагружено (версия {timetable.version})")
+        
+        for callback in self._change_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка обработчика перезагрузки расписания: {e}")
+        return True
+    
+    @property
+    def default_group(self) -> str:
+        return self.timetable.default_group
+    
+    @property
+    def groups(self) -> Dict[str, str]:
+        """Группы в виде {идентификатор: название}"""
+        return {group_id: group.title for group_id, group in self.timetable.groups.items()}
+    
+    def has_group(self, group_id: str) -> bool:
+        return group_id in self.timetable.groups
+    
+    def group_zone(self, group: str = None) -> ZoneInfo:
+        """Часовой пояс группы: свой из файла расписания или пояс по умолчанию"""
+        return self.clock.zone(self.timetable.group(group).timezone)
+    
+    def now(self, group: str = None) -> datetime:
+        """Текущее время в поясе группы"""
+        return self.clock.now(self.group_zone(group))
+    
+    def is_numerator_week(self, date: datetime = None, group: str = None) -> bool:
+        """Определяет, является ли неделя числителем"""
+        return self.timetable.group(group).calendar.is_numerator(date or self.now(group))
+    
+    def get_day_schedule(self, date: datetime = None, group: str = None) -> Optional[DaySchedule]:
+        """Получает расписание на указанную дату с учетом праздников и переносов"""
+        return self.timetable.group(group).calendar.day_schedule(date or self.now(group))
     
-    def get_day_schedule(self, date: datetime = None) -> Optional[DaySchedule]:
-        """Получает расписание на указанную дату"""
+    def format_schedule_for_day(self, date: datetime = None, include_control_events: bool = True,
+                                group: str = None) -> str:
+        """Форматирует расписание на день в красивый текст"""
         if date is None:
-            date = datetime.now()
+            date = self.now(group)
         
-        days_russian = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
-        day_name = days_russian[date.weekday()]
+        group = self.timetable.group(group).group_id
+        date_str = date.strftime("%Y-%m-%d")
+        cache_key = (
+            "day", date_str, group, include_control_events,
+            self._control_events_version(), self.timetable.version
+        )
         
-        if self.is_numerator_week(date):
-            schedule = self.numerator_schedule
-        else:
-            schedule = self.denominator_schedule
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        return schedule.get(day_name)
+        result = self._render_day(date, date_str, group, include_control_events)
+        self.cache.set(cache_key, result)
+        return result
     
-    def format_schedule_for_day(self, date: datetime = None, include_control_events: bool = True) -> str:
-        """Форматирует расписание на день в красивый текст"""
-        day_schedule = self.get_day_schedule(date)
+    def _group_header(self, group: str) -> str:
+        """Заголовок группы: нужен, только когда групп несколько"""
+        if len(self.timetable.groups) < 2:
+            return ""
+        return f"👥 {self.timetable.group(group).title}\n"
+    
+    def _render_day(self, date: datetime, date_str: str, group: str, include_control_events: bool) -> str:
+        """Формирует текст расписания на день"""
+        calendar_day = self.timetable.group(group).calendar.day(date)
+        day_schedule = calendar_day.day_schedule
         if not day_schedule:
-            return "🎉 В этот день занятий нет"
+            if calendar_day.holiday:
+                return self._group_header(group) + "🎉 Выходной день, занятий нет"
+            return self._group_header(group) + "🎉 В этот день занятий нет"
         
         control_events = {}
         if include_control_events:
-            date_str = date.strftime("%Y-%m-%d")
-            events = db.get_control_events_by_date(date_str)
+            events = self.database.get_control_events_by_date(date_str, group)
             for subject_name, event_type in events:
                 control_events[subject_name] = event_type
         
-        day_emojis = {
-            "понедельник": "📅 Понедельник", "вторник": "📅 Вторник", "среда": "📅 Среда",
-            "четверг": "📅 Четверг", "пятница": "📅 Пятница", "суббота": "📅 Суббота"
-        }
-        
-        day_display = day_emojis.get(day_schedule.day_name, day_schedule.day_name)
-        week_type = "Числитель" if self.is_numerator_week(date) else "Знаменатель"
+        week_type = "Числитель" if calendar_day.is_numerator else "Знаменатель"
+        if calendar_day.swapped:
+            day_name = WEEKDAYS[date.weekday()]
+            day_display = f"{DAY_TITLES.get(day_name, day_name)} (по расписанию {calendar_day.source_date.strftime('%d.%m')})"
+        else:
+            day_display = DAY_TITLES.get(day_schedule.day_name, day_schedule.day_name)
         
-        result = f"{day_display} ({week_type})\n\n"
+        parts = [f"{self._group_header(group)}{day_display} ({week_type})\n\n"]
         
         for i, subject in enumerate(day_schedule.subjects, 1):
             event_mark = ""
             if subject.name in control_events:
                 event_mark = f" 🚨 {control_events[subject.name]}"
             
-            result += f"🕒 {subject.start_time}-{subject.end_time}\n"
-            result += f"📚 {subject.name}\n"
-            result += f"🏫 {subject.room}\n"
-            result += f"📝 {subject.lesson_type}{event_mark}\n"
+            parts.append(
+                f"🕒 {subject.start_time}-{subject.end_time}\n"
+                f"📚 {subject.name}\n"
+                f"🏫 {subject.room}\n"
+                f"📝 {subject.lesson_type}{event_mark}\n"
+            )
             
             if i < len(day_schedule.subjects):
-                result += "───────\n"
+                parts.append("───────\n")
         
-        return result
+        return "".join(parts)
     
-    def get_week_schedule(self) -> str:
+    def get_week_schedule(self, group: str = None) -> str:
         """Получает расписание на всю неделю"""
         try:
-            current_date = datetime.now()
-            is_numerator = self.is_numerator_week(current_date)
-            week_type = "Числитель" if is_numerator else "Знаменатель"
+            current_date = self.now(group)
+            group = self.timetable.group(group).group_id
+            is_numerator = self.is_numerator_week(current_date, group)
+            cache_key = (
+                "week", current_date.strftime("%Y-%m-%d"), group, is_numerator,
+                self._control_events_version(), self.timetable.version
+            )
             
-            schedule = self.numerator_schedule if is_numerator else self.denominator_schedule
-            days_order = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
-            
-            result = f"📅 Расписание на неделю ({week_type})\n\n"
-            
-            for day_name in days_order:
-                day_schedule = schedule.get(day_name)
-                if not day_schedule or not day_schedule.subjects:
-                    continue
-                
-                day_emojis = {
-                    "понедельник": "📅 Понедельник", "вторник": "📅 Вторник", "среда": "📅 Среда",
-                    "четверг": "📅 Четверг", "пятница": "📅 Пятница", "суббота": "📅 Суббота"
-                }
-                
-                day_display = day_emojis.get(day_name, day_name)
-                result += f"{day_display}:\n"
-                
-                from src.utils.helpers import get_date_for_weekday
-                day_date = get_date_for_weekday(day_name, current_date)
-                
-                control_events = {}
-                date_str = day_date.strftime("%Y-%m-%d")
-                events = db.get_control_events_by_date(date_str)
-                for subject_name, event_type in events:
-                    control_events[subject_name] = event_type
-                
-                for i, subject in enumerate(day_schedule.subjects, 1):
-                    event_mark = ""
-                    if subject.name in control_events:
-                        event_mark = f" 🚨 {control_events[subject.name]}"
-                    
-                    result += f"  {i}. {subject.name}\n"
-                    result += f"     ⏰ {subject.start_time}-{subject.end_time}\n"
-                    result += f"     🏫 {subject.room} ({subject.lesson_type}){event_mark}\n"
-                
-                result += "\n"
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            if result == f"📅 Расписание на неделю ({week_type})\n\n":
-                result = "🎉 На этой неделе занятий нет"
-                
+            result = self._render_week(current_date, group, is_numerator)
+            self.cache.set(cache_key, result)
             return result
             
         except Exception as e:
             logger.error(f"Ошибка получения расписания на неделю: {e}")
             return "❌ Не удалось получить расписание на неделю"
     
-    def get_tomorrow_schedule(self) -> str:
+    def _render_week(self, current_date: datetime, group: str, is_numerator: bool) -> str:
+        """Формирует текст расписания на неделю"""
+        week_type = "Числитель" if is_numerator else "Знаменатель"
+        calendar = self.timetable.group(group).calendar
+        days_order = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
+        
+        # Дни текущей недели (с понедельника): у всех одна четность, указанная в заголовке.
+        # Все мероприятия недели — одним запросом по диапазону дат
+        monday = current_date - timedelta(days=current_date.weekday())
+        day_dates = {
+            day_name: (monday + timedelta(days=index)).strftime("%Y-%m-%d")
+            for index, day_name in enumerate(days_order)
+        }
+        events_by_date = self.get_control_events_map(min(day_dates.values()), max(day_dates.values()), group)
+        
+        parts = []
+        
+        for day_name in days_order:
+            # Расписание берется по той же дате, что и мероприятия: праздники и переносы учтены
+            day_schedule = calendar.day_schedule(day_dates[day_name])
+            if not day_schedule or not day_schedule.subjects:
+                continue
+            
+            day_display = DAY_TITLES.get(day_name, day_name)
+            parts.append(f"{day_display}:\n")
+            
+            control_events = events_by_date.get(day_dates[day_name], {})
+            
+            for i, subject in enumerate(day_schedule.subjects, 1):
+                event_mark = ""
+                if subject.name in control_events:
+                    event_mark = f" 🚨 {control_events[subject.name]}"
+                
+                parts.append(
+                    f"  {i}. {subject.name}\n"
+                    f"     ⏰ {subject.start_time}-{subject.end_time}\n"
+                    f"     🏫 {subject.room} ({subject.lesson_type}){event_mark}\n"
+                )
+            
+            parts.append("\n")
+        
+        if not parts:
+            return self._group_header(group) + "🎉 На этой неделе занятий нет"
+        
+        return f"{self._group_header(group)}📅 Расписание на неделю ({week_type})\n\n" + "".join(parts)
+    
+    def get_control_events_map(self, start_date: str, end_date: str, group: str = None) -> Dict[str, Dict[str, str]]:
+        """Мероприятия за период в виде {дата: {предмет: тип мероприятия}}"""
+        events_by_date = {}
+        for date_str, subject_name, event_type in self.database.get_control_events_between(start_date, end_date, group):
+            events_by_date.setdefault(date_str, {})[subject_name] = event_type
+        return events_by_date
+    
+    def get_tomorrow_schedule(self, group: str = None) -> str:
         """Получает расписание на завтра"""
-        tomorrow = datetime.now() + timedelta(days=1)
-        return self.format_schedule_for_day(tomorrow)
+        tomorrow = self.now(group) + timedelta(days=1)
+        return self.format_schedule_for_day(tomorrow, group=group)
     
-    def get_today_schedule(self) -> str:
+    def get_today_schedule(self, group: str = None) -> str:
         """Получает расписание на сегодня"""
-        return self.format_schedule_for_day(datetime.now())
+        return self.format_schedule_for_day(self.now(group), group=group)
+    
+    def get_schedules_for_groups(self, getter, groups: List[str]) -> str:
+        """Объединяет тексты расписания нескольких групп (getter — например get_today_schedule)"""
+        return "\n\n".join(getter(group=group) for group in groups)
     
-    def get_subjects_with_times(self, date: datetime = None) -> List[Dict]:
+    def get_subjects_with_times(self, date: datetime = None, group: str = None) -> List[Dict]:
         """Возвращает список предметов с временами для напоминаний"""
         if date is None:
-            date = datetime.now()
+            date = self.now(group)
             
-        day_schedule = self.get_day_schedule(date)
+        day_schedule = self.get_day_schedule(date, group)
         if not day_schedule:
             return []
         
@@ -227,6 +290,7 @@ class ScheduleManager:
             subjects_with_times.append({
                 'name': subject.name,
                 'start_time': subject.start_time,
+                'start': subject.start,
                 'end_time': subject.end_time,
                 'room': subject.room,
                 'type': subject.lesson_type
@@ -234,5 +298,5 @@ class ScheduleManager:
         
         return subjects_with_times
 
-# Глобальный экземпляр менеджера расписания
-schedule_manager = ScheduleManager()
\ No newline at end of file
+# Глобальный менеджер расписания создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"schedule_manager": "schedule_manager"})
@@ -0,0 +1,157 @@
+# services/semester_calendar.py
+from datetime import date as Date, datetime, timedelta
+from typing import Iterable, List, Mapping, Optional
+from src.models.schedule_models import DaySchedule
+
+WEEKDAYS = ("понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье")
+
+# Длительность семестра без явной даты окончания, дни
+DEFAULT_SEMESTER_DAYS = 26 * 7
+
+
+def _to_date(value) -> Date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, Date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _week_anchor(start: Date) -> Date:
+    """Воскресенье перед началом семестра (или сам день начала, если это воскресенье).
+
+    Неделя считается с воскресенья: в воскресенье уже действует четность
+    наступающей недели, как и в прежнем расчете от 1 сентября.
+    """
+    return start - timedelta(days=(start.weekday() + 1) % 7)
+
+
+class Semester:
+    """Семестр: даты, праздники, переносы дней и четность первой недели"""
+    __slots__ = ("start", "end", "holidays", "swaps", "first_numerator")
+
+    def __init__(self, start, end=None, holidays: Iterable = (), swaps: Mapping = None,
+                 first_numerator: bool = True):
+        self.start = _to_date(start)
+        self.end = _to_date(end) if end else self.start + timedelta(days=DEFAULT_SEMESTER_DAYS - 1)
+        if self.end < self.start:
+            raise ValueError(f"Семестр {self.start} заканчивается раньше, чем начинается")
+        self.holidays = frozenset(_to_date(day) for day in holidays)
+        # {дата: дата-источник}: в этот день занятия идут по расписанию дня-источника
+        self.swaps = {_to_date(day): _to_date(source) for day, source in (swaps or {}).items()}
+        self.first_numerator = first_numerator
+
+    def is_numerator(self, day: Date) -> bool:
+        week_number = (day - _week_anchor(self.start)).days // 7
+        return (week_number % 2 == 0) == self.first_numerator
+
+
+class CalendarDay:
+    """Вычисленный день календаря"""
+    __slots__ = ("date", "is_numerator", "day_schedule", "holiday", "source_date")
+
+    def __init__(self, date: Date, is_numerator: bool, day_schedule: Optional[DaySchedule],
+                 holiday: bool = False, source_date: Date = None):
+        self.date = date
+        self.is_numerator = is_numerator
+        self.day_schedule = day_schedule
+        self.holiday = holiday
+        # Дата, по расписанию которой идут занятия (при переносе отличается от date)
+        self.source_date = source_date or date
+
+    @property
+    def swapped(self) -> bool:
+        return self.source_date != self.date
+
+
+class SemesterCalendar:
+    """Календарь группы, заранее вычисленный на все семестры.
+
+    Для каждой даты от начала первого до конца последнего семестра хранится
+    CalendarDay (четность недели и расписание дня с учетом праздников, переносов
+    и каникул между семестрами), поэтому поиск — индекс в списке. Даты вне
+    семестров вычисляются по ближайшему семестру без праздников и переносов.
+    """
+
+    def __init__(self, numerator: Mapping[str, DaySchedule], denominator: Mapping[str, DaySchedule],
+                 semesters: List[Semester]):
+        if not semesters:
+            raise ValueError("Не задан ни один семестр")
+        self.numerator = numerator
+        self.denominator = denominator
+        self.semesters = sorted(semesters, key=lambda semester: semester.start)
+        for previous, current in zip(self.semesters, self.semesters[1:]):
+            if current.start <= previous.end:
+                raise ValueError(f"Семестры {previous.start} и {current.start} пересекаются")
+
+        self.first_day = self.semesters[0].start
+        self.last_day = self.semesters[-1].end
+        self._first_ordinal = self.first_day.toordinal()
+        self._days: List[CalendarDay] = self._build()
+
+    def _template(self, day: Date, is_numerator: bool) -> Optional[DaySchedule]:
+        week = self.numerator if is_numerator else self.denominator
+        return week.get(WEEKDAYS[day.weekday()])
+
+    def _build(self) -> List[CalendarDay]:
+        days = []
+        semesters = iter(self.semesters)
+        semester = next(semesters)
+        following = next(semesters, None)
+        day = self.first_day
+        while day <= self.last_day:
+            if following and day >= following.start:
+                semester, following = following, next(semesters, None)
+            is_numerator = semester.is_numerator(day)
+            if day > semester.end:
+                # Каникулы между семестрами
+                days.append(CalendarDay(day, is_numerator, None, holiday=True))
+            elif day in semester.holidays:
+                days.append(CalendarDay(day, is_numerator, None, holiday=True))
+            elif day in semester.swaps:
+                source = semester.swaps[day]
+                days.append(CalendarDay(
+                    day, is_numerator, self._template(source, semester.is_numerator(source)), source_date=source
+                ))
+            else:
+                days.append(CalendarDay(day, is_numerator, self._template(day, is_numerator)))
+            day += timedelta(days=1)
+        return days
+
+    def day(self, value=None) -> CalendarDay:
+        """День календаря для даты (datetime, date или ГГГГ-ММ-ДД)"""
+        day = _to_date(value if value is not None else datetime.now())
+        index = day.toordinal() - self._first_ordinal
+        if 0 <= index < len(self._days):
+            return self._days[index]
+        semester = self.semesters[0] if index < 0 else self.semesters[-1]
+        is_numerator = semester.is_numerator(day)
+        return CalendarDay(day, is_numerator, self._template(day, is_numerator))
+
+    def is_numerator(self, value=None) -> bool:
+        return self.day(value).is_numerator
+
+    def day_schedule(self, value=None) -> Optional[DaySchedule]:
+        return self.day(value).day_schedule
+
+
+def compile_semesters(raw_semesters: Optional[list], semester_start: Optional[str]) -> List[Semester]:
+    """Семестры из описания расписания; без списка semesters — один семестр от semester_start"""
+    if not raw_semesters:
+        if not semester_start:
+            return []
+        return [Semester(semester_start)]
+
+    semesters = []
+    for raw in raw_semesters:
+        first_week = raw.get("first_week", "numerator")
+        if first_week not in ("numerator", "denominator"):
+            raise ValueError(f"first_week должен быть numerator или denominator, а не {first_week}")
+        semesters.append(Semester(
+            raw["start"],
+            raw.get("end"),
+            holidays=raw.get("holidays", ()),
+            swaps=raw.get("swaps"),
+            first_numerator=first_week == "numerator"
+        ))
+    return semesters
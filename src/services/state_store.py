@@ -0,0 +1,110 @@
+# services/state_store.py
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+from src.services.database import AsyncDatabase
+from src.utils.config import STATE_STORE, STATE_TTL
+from src.container import container, legacy_attribute
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(ABC):
+    """Хранилище состояния диалогов: {(пространство, user_id): словарь} с временем жизни"""
+
+    def __init__(self, default_ttl: float = STATE_TTL):
+        self.default_ttl = default_ttl
+
+    @abstractmethod
+    async def get(self, namespace: str, user_id: int) -> Optional[dict]:
+        """Значение или None, если записи нет или она истекла"""
+
+    @abstractmethod
+    async def set(self, namespace: str, user_id: int, value: dict, ttl: float = None):
+        """Сохраняет значение на ttl секунд (по умолчанию default_ttl)"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, user_id: int):
+        """Удаляет запись, если она есть"""
+
+    @abstractmethod
+    async def purge_expired(self) -> int:
+        """Удаляет истекшие записи. Возвращает их число"""
+
+
+class MemoryStateStore(StateStore):
+    """Состояние в памяти процесса; истекшие записи удаляются при обращении и периодической очистке"""
+
+    def __init__(self, default_ttl: float = STATE_TTL):
+        super().__init__(default_ttl)
+        self._items: Dict[Tuple[str, int], Tuple[float, dict]] = {}
+
+    async def get(self, namespace: str, user_id: int) -> Optional[dict]:
+        item = self._items.get((namespace, user_id))
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.time():
+            del self._items[(namespace, user_id)]
+            return None
+        # Копия: изменения вступают в силу только через set, как и в SQLite
+        return dict(value)
+
+    async def set(self, namespace: str, user_id: int, value: dict, ttl: float = None):
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        self._items[(namespace, user_id)] = (expires_at, dict(value))
+
+    async def delete(self, namespace: str, user_id: int):
+        self._items.pop((namespace, user_id), None)
+
+    async def purge_expired(self) -> int:
+        now = time.time()
+        expired = [key for key, (expires_at, _) in self._items.items() if expires_at <= now]
+        for key in expired:
+            del self._items[key]
+        return len(expired)
+
+
+class SQLiteStateStore(StateStore):
+    """Состояние в SQLite: переживает перезапуск и видно всем процессам, работающим с одной БД"""
+
+    def __init__(self, async_database: AsyncDatabase, default_ttl: float = STATE_TTL):
+        super().__init__(default_ttl)
+        self.async_database = async_database
+
+    async def get(self, namespace: str, user_id: int) -> Optional[dict]:
+        raw = await self.async_database.get_conversation_state(namespace, user_id, time.time())
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            logger.warning(f"Поврежденное состояние диалога {namespace}/{user_id} удалено")
+            await self.delete(namespace, user_id)
+            return None
+
+    async def set(self, namespace: str, user_id: int, value: dict, ttl: float = None):
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        await self.async_database.set_conversation_state(
+            namespace, user_id, json.dumps(value, ensure_ascii=False), expires_at
+        )
+
+    async def delete(self, namespace: str, user_id: int):
+        await self.async_database.delete_conversation_state(namespace, user_id)
+
+    async def purge_expired(self) -> int:
+        return await self.async_database.purge_conversation_state(time.time())
+
+
+def create_state_store(kind: str = STATE_STORE, async_database: AsyncDatabase = None) -> StateStore:
+    """Хранилище по имени из конфигурации: memory или sqlite"""
+    if kind == "memory":
+        return MemoryStateStore()
+    if kind == "sqlite":
+        return SQLiteStateStore(async_database if async_database is not None else container.async_database)
+    raise ValueError(f"Неизвестное хранилище состояния: {kind} (ожидается memory или sqlite)")
+
+# Глобальное хранилище состояния диалогов создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"state_store": "state_store"})
@@ -0,0 +1,130 @@
+# services/timetable.py
+import json
+import logging
+import os
+import re
+import tomllib
+from datetime import datetime
+from types import MappingProxyType
+from typing import List, Mapping
+from src.models.schedule_models import Subject, DaySchedule
+from src.services.semester_calendar import WEEKDAYS, Semester, SemesterCalendar, compile_semesters
+from src.services.clock import get_zone
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор группы попадает в callback_data, поэтому он короткий и без пробелов
+GROUP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,32}$")
+LEGACY_GROUP_ID = "main"
+
+
+class GroupTimetable:
+    """Расписание одной группы"""
+    __slots__ = ("group_id", "title", "numerator", "denominator", "semester_start", "calendar", "timezone")
+
+    def __init__(self, group_id: str, title: str, numerator: Mapping[str, DaySchedule],
+                 denominator: Mapping[str, DaySchedule], semesters: List[Semester], timezone: str = None):
+        self.group_id = group_id
+        self.title = title
+        # Часовой пояс группы (IANA); None — пояс по умолчанию (TIMEZONE)
+        self.timezone = timezone
+        self.numerator = MappingProxyType(dict(numerator))
+        self.denominator = MappingProxyType(dict(denominator))
+        # Четность недель и расписание по датам вычисляются один раз при загрузке
+        self.calendar = SemesterCalendar(self.numerator, self.denominator, semesters)
+        self.semester_start = datetime.combine(self.calendar.first_day, datetime.min.time())
+
+
+class Timetable:
+    """Скомпилированное неизменяемое расписание всех групп, загруженное из файла"""
+    __slots__ = ("groups", "default_group", "source_path", "source_mtime", "version")
+
+    def __init__(self, groups: Mapping[str, GroupTimetable], default_group: str,
+                 source_path: str = None, source_mtime: float = None, version: int = 1):
+        if default_group not in groups:
+            raise ValueError(f"Группа по умолчанию {default_group} не описана в расписании")
+        self.groups = MappingProxyType(dict(groups))
+        self.default_group = default_group
+        self.source_path = source_path
+        self.source_mtime = source_mtime
+        self.version = version
+
+    def group(self, group_id: str = None) -> GroupTimetable:
+        """Расписание группы; неизвестная или пустая группа — группа по умолчанию"""
+        return self.groups.get(group_id) or self.groups[self.default_group]
+
+
+def _read_file(path: str) -> dict:
+    if path.endswith(".toml"):
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _compile_week(raw_week: dict, week_name: str) -> dict:
+    week = {}
+    for day_name, raw_subjects in raw_week.items():
+        day_name = day_name.lower()
+        if day_name not in WEEKDAYS:
+            raise ValueError(f"Неизвестный день недели в {week_name}: {day_name}")
+        subjects = [
+            Subject(item["name"], item["room"], item["start"], item["end"], item["type"])
+            for item in raw_subjects
+        ]
+        week[day_name] = DaySchedule(day_name, subjects)
+    return week
+
+
+def _compile_group(group_id: str, raw: dict, fallback_start: str = None,
+                   fallback_semesters: list = None, fallback_timezone: str = None) -> GroupTimetable:
+    if not GROUP_ID_PATTERN.match(group_id):
+        raise ValueError(f"Недопустимый идентификатор группы: {group_id}")
+    timezone = raw.get("timezone", fallback_timezone)
+    if timezone:
+        get_zone(timezone)
+    semesters = compile_semesters(
+        raw.get("semesters", fallback_semesters), raw.get("semester_start", fallback_start)
+    )
+    if not semesters:
+        raise ValueError(f"Не указана дата начала семестра для группы {group_id}")
+    return GroupTimetable(
+        group_id=group_id,
+        title=raw.get("title", group_id),
+        numerator=_compile_week(raw.get("numerator", {}), f"{group_id}.numerator"),
+        denominator=_compile_week(raw.get("denominator", {}), f"{group_id}.denominator"),
+        semesters=semesters,
+        timezone=timezone or None
+    )
+
+
+def compile_timetable(raw: dict, source_path: str = None, source_mtime: float = None,
+                      version: int = 1) -> Timetable:
+    """Проверяет и компилирует описание расписания.
+
+    Поддерживается формат с несколькими группами ({"groups": {...}}) и прежний
+    формат с одной группой (numerator/denominator на верхнем уровне). Вместо
+    semester_start можно задать список semesters с праздниками и переносами
+    (общий на верхнем уровне или свой у группы), как и часовой пояс timezone.
+    """
+    if "groups" in raw:
+        groups = {
+            group_id: _compile_group(
+                group_id, raw_group, raw.get("semester_start"), raw.get("semesters"), raw.get("timezone")
+            )
+            for group_id, raw_group in raw["groups"].items()
+        }
+        default_group = raw.get("default_group") or next(iter(groups), None)
+    else:
+        groups = {LEGACY_GROUP_ID: _compile_group(LEGACY_GROUP_ID, raw)}
+        default_group = LEGACY_GROUP_ID
+
+    return Timetable(groups, default_group, source_path, source_mtime, version)
+
+
+def load_timetable(path: str, version: int = 1) -> Timetable:
+    """Загружает расписание из JSON- или TOML-файла"""
+    mtime = os.stat(path).st_mtime
+    timetable = compile_timetable(_read_file(path), path, mtime, version)
+    logger.info(f"Расписание загружено из {path}: групп {len(timetable.groups)}")
+    return timetable
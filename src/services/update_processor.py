@@ -0,0 +1,85 @@
+# services/update_processor.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from src.utils.config import UPDATE_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+class _Unlimited:
+    """Заглушка семафора базового класса: ограничение применяется после очереди чата"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def update_chat_key(update: object) -> Optional[int]:
+    """Чат, в порядке которого обрабатывается обновление (None — без упорядочивания)"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+    Обновления разных чатов обрабатываются одновременно (не более
+    max_concurrent_updates), обновления одного чата — строго по очереди.
+    Слот параллельности занимается только после того, как подошла очередь чата:
+    иначе один чат, присылающий много обновлений, занимал бы все слоты ожиданием.
+    """
+
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY):
+        super().__init__(max_concurrent_updates)
+        # Семафор базового класса — внутренняя деталь PTB (версия закреплена в requirements.txt):
+        # если после обновления PTB его нет, ошибка видна при запуске, а не потерей порядка чатов
+        if not isinstance(getattr(self, "_semaphore", None), asyncio.BoundedSemaphore):
+            raise RuntimeError(
+                "BaseUpdateProcessor._semaphore не найден: проверьте ChatOrderedUpdateProcessor "
+                "с установленной версией python-telegram-bot"
+            )
+        self._limit = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._semaphore = _Unlimited()
+        # {чат: (блокировка, число обновлений в очереди чата)}
+        self._chats: Dict[int, list] = {}
+
+    @property
+    def pending_chats(self) -> int:
+        """Число чатов, у которых есть обрабатываемые или ожидающие обновления"""
+        return len(self._chats)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_chat_key(update)
+        if key is None:
+            async with self._limit:
+                await coroutine
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._limit:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,170 @@
+# services/user_preferences.py
+import logging
+from typing import Dict, Optional, Set
+from src.services.database import Database, AsyncDatabase, USER_PREFERENCES_VERSION
+from src.services.reminder_planner import REMINDER_LEAD
+from src.utils.config import DIGEST_TIME, DIGEST_SPREAD_MINUTES
+from src.container import legacy_attribute
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+DEFAULT_REMINDER_LEAD = int(REMINDER_LEAD.total_seconds() // 60)
+
+# Варианты в настройках пользователя
+DIGEST_TIME_CHOICES = ("19:00", "20:00", "21:00", "22:00", "23:00")
+REMINDER_LEAD_CHOICES = (5, 10, 15, 30, 60)
+# Часовые пояса на выбор: {имя IANA: подпись}
+TIMEZONE_CHOICES = {
+    "Europe/Kaliningrad": "МСК−1",
+    "Europe/Moscow": "МСК",
+    "Europe/Samara": "МСК+1",
+    "Asia/Yekaterinburg": "МСК+2",
+    "Asia/Omsk": "МСК+3",
+    "Asia/Novosibirsk": "МСК+4",
+}
+
+
+def parse_minute(value: str) -> int:
+    """ЧЧ:ММ -> минута суток"""
+    hours, minutes = value.split(":")
+    minute = int(hours) * 60 + int(minutes)
+    if not 0 <= minute < MINUTES_PER_DAY:
+        raise ValueError(f"Некорректное время: {value}")
+    return minute
+
+
+def format_minute(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class UserPreferences:
+    """Настройки рассылок пользователя (неизменяемые: изменение создает новый объект)"""
+    __slots__ = ("digest_minute", "digest_enabled", "reminders_enabled", "reminder_lead", "timezone")
+
+    def __init__(self, digest_minute: Optional[int] = None, digest_enabled: bool = True,
+                 reminders_enabled: bool = True, reminder_lead: int = DEFAULT_REMINDER_LEAD,
+                 timezone: Optional[str] = None):
+        # None — время доставки назначается автоматически (см. PreferenceStore.digest_minute)
+        self.digest_minute = digest_minute
+        self.digest_enabled = digest_enabled
+        self.reminders_enabled = reminders_enabled
+        self.reminder_lead = reminder_lead
+        # Пояс, в котором задано время доставки; None — пояс по умолчанию (TIMEZONE)
+        self.timezone = timezone
+
+    def as_row(self) -> tuple:
+        return (self.digest_minute, self.digest_enabled, self.reminders_enabled, self.reminder_lead, self.timezone)
+
+    def replace(self, **changes) -> "UserPreferences":
+        values = dict(zip(self.__slots__, self.as_row()))
+        values.update(changes)
+        return UserPreferences(**values)
+
+    def __eq__(self, other):
+        return isinstance(other, UserPreferences) and self.as_row() == other.as_row()
+
+    def __hash__(self):
+        return hash(self.as_row())
+
+
+DEFAULT_PREFERENCES = UserPreferences()
+
+
+class PreferenceStore:
+    """Настройки рассылок в памяти.
+
+    В памяти и в БД хранятся только настройки, отличные от значений по умолчанию,
+    поэтому загрузка и обход не зависят от общего числа пользователей. Настройки
+    меняются редко и записываются в БД сразу. version увеличивается при каждом
+    изменении: по ней планировщик рассылки понимает, что группы по минутам устарели.
+    Изменения других процессов кластера видны по общей версии настроек в БД
+    (см. refresh_async).
+    """
+
+    def __init__(self, database: Database, async_database: AsyncDatabase,
+                 digest_time: str = DIGEST_TIME, spread_minutes: int = DIGEST_SPREAD_MINUTES):
+        self.database = database
+        self.async_database = async_database
+        self.digest_start = parse_minute(digest_time)
+        self.spread_minutes = max(1, spread_minutes)
+        self.version = 0
+        self._preferences: Dict[int, UserPreferences] = {}
+        self._loaded = False
+        # Версия настроек в БД на момент загрузки
+        self._data_version = None
+
+    def _load_snapshot(self, rows: Dict[int, tuple], data_version: int):
+        self._preferences = {user_id: UserPreferences(*row) for user_id, row in rows.items()}
+        self._loaded = True
+        self._data_version = data_version
+        self.version += 1
+        logger.info(f"⚙️ Настройки рассылок загружены: {len(self._preferences)} пользователей")
+
+    def load(self):
+        # Версия читается до настроек: изменение между двумя запросами подхватит следующая проверка
+        data_version = self.database.get_data_version(USER_PREFERENCES_VERSION)
+        self._load_snapshot(self.database.get_user_preferences(), data_version)
+
+    async def load_async(self):
+        data_version = await self.async_database.get_data_version(USER_PREFERENCES_VERSION)
+        self._load_snapshot(await self.async_database.get_user_preferences(), data_version)
+
+    async def refresh_async(self) -> bool:
+        """Перечитывает настройки, если их версия в БД изменилась (в кластере их меняют
+        и другие процессы). Возвращает True, если настройки перечитаны"""
+        data_version = await self.async_database.get_data_version(USER_PREFERENCES_VERSION)
+        if self._loaded and data_version == self._data_version:
+            return False
+        await self.load_async()
+        return True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get(self, user_id: int) -> UserPreferences:
+        self._ensure_loaded()
+        return self._preferences.get(user_id, DEFAULT_PREFERENCES)
+
+    async def update(self, user_id: int, **changes) -> UserPreferences:
+        """Меняет настройки пользователя и сразу записывает их в БД"""
+        current = self.get(user_id)
+        updated = current.replace(**changes)
+        if updated == current:
+            return current
+        if not await self.async_database.set_user_preferences(user_id, *updated.as_row()):
+            raise RuntimeError(f"Не удалось сохранить настройки пользователя {user_id}")
+        self._preferences[user_id] = updated
+        self.version += 1
+        return updated
+
+    def digest_minute(self, user_id: int) -> int:
+        """Минута суток доставки расписания на завтра.
+
+        Пользователи без выбранного времени равномерно распределяются по окну
+        spread_minutes от digest_start: минута постоянна для пользователя и
+        не зависит от остальных, поэтому не меняется при добавлении новых.
+        Минута — местное время пояса пользователя (см. timezone).
+        """
+        minute = self.get(user_id).digest_minute
+        if minute is not None:
+            return minute
+        return (self.digest_start + user_id % self.spread_minutes) % MINUTES_PER_DAY
+
+    def timezone(self, user_id: int) -> Optional[str]:
+        """Пояс времени доставки пользователя (None — пояс по умолчанию)"""
+        return self.get(user_id).timezone
+
+    def reminder_leads(self) -> Set[int]:
+        """Используемые интервалы напоминаний, минуты"""
+        self._ensure_loaded()
+        leads = {DEFAULT_REMINDER_LEAD}
+        leads.update(
+            preferences.reminder_lead for preferences in self._preferences.values()
+            if preferences.reminders_enabled
+        )
+        return leads
+
+# Глобальное хранилище настроек рассылок создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"user_preferences": "user_preferences"})
@@ -0,0 +1,269 @@
+# services/user_registry.py
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from telegram.error import TelegramError
+from src.services.broadcaster import delivery_status_for_error
+from src.services.database import Database, AsyncDatabase, USER_STATUS_ACTIVE
+from src.utils.config import USER_REGISTRY_FLUSH_INTERVAL
+from src.container import legacy_attribute
+
+logger = logging.getLogger(__name__)
+
+
+class UserRegistry:
+    """Реестр подписчиков в памяти с отложенной записью в БД.
+
+    При запуске реестр загружается из БД (она остается источником истины),
+    дальше чтение идет только из памяти, а изменения копятся и периодически
+    записываются в БД одной транзакцией.
+
+    Реестр также ведет состояние доставки: пользователи, заблокировавшие бота
+    или удалившие аккаунт, исключаются из рассылок до следующего /start.
+    """
+
+    def __init__(self, database: Database, async_database: AsyncDatabase):
+        self.database = database
+        self.async_database = async_database
+        self.flush_interval = USER_REGISTRY_FLUSH_INTERVAL
+        # Снимок активных получателей для рассылок; None — пересобрать при следующем обращении
+        self._ids: Optional[Tuple[int, ...]] = ()
+        self._profiles: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]] = {}
+        # Группы активных пользователей — именно по ним идут рассылки
+        self._groups: Dict[int, tuple] = {}
+        # Неактивные пользователи: {user_id: (состояние, группы)}
+        self._inactive: Dict[int, Tuple[str, tuple]] = {}
+        self._fail_counts: Dict[int, int] = {}
+        self._pending_users: Dict[int, tuple] = {}
+        self._pending_groups: Dict[Tuple[int, str], bool] = {}
+        self._pending_delivery: Dict[int, tuple] = {}
+        self._loaded = False
+        # Увеличивается при изменении состава получателей или их групп
+        self.version = 0
+
+    def _load_snapshot(self, profiles: Dict[int, tuple], groups: Dict[int, tuple],
+                       delivery_states: Dict[int, tuple]):
+        self._profiles = profiles
+        self._groups = {}
+        self._inactive = {}
+        self._fail_counts = {}
+        for user_id in profiles:
+            status, fail_count = delivery_states.get(user_id, (USER_STATUS_ACTIVE, 0))
+            user_groups = groups.get(user_id, ())
+            if status == USER_STATUS_ACTIVE:
+                self._groups[user_id] = user_groups
+            else:
+                self._inactive[user_id] = (status, user_groups)
+            if fail_count:
+                self._fail_counts[user_id] = fail_count
+        self._ids = None
+        self._loaded = True
+        self.version += 1
+        logger.info(
+            f"👥 Реестр пользователей загружен: {len(self._groups)} активных, "
+            f"{len(self._inactive)} исключены из рассылок"
+        )
+
+    def load(self):
+        """Синхронная загрузка из БД"""
+        self._load_snapshot(
+            self.database.get_user_profiles(),
+            self.database.get_user_group_map(include_inactive=True),
+            self.database.get_user_delivery_states()
+        )
+
+    async def load_async(self):
+        """Загрузка из БД в потоке БД, не блокируя цикл событий"""
+        profiles = await self.async_database.run(self.database.get_user_profiles)
+        groups = await self.async_database.get_user_group_map(include_inactive=True)
+        delivery_states = await self.async_database.run(self.database.get_user_delivery_states)
+        self._load_snapshot(profiles, groups, delivery_states)
+
+    async def refresh_async(self):
+        """Записывает свои изменения и перечитывает реестр: в кластере пользователей добавляют и другие процессы"""
+        await self.flush_async()
+        await self.load_async()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None) -> bool:
+        """Добавление/обновление пользователя. Запись в БД откладывается.
+        Повторный /start возвращает пользователя в рассылки"""
+        self._ensure_loaded()
+        if user_id in self._inactive:
+            self.set_delivery_status(user_id, USER_STATUS_ACTIVE)
+
+        profile = (username, first_name, last_name)
+        current = self._profiles.get(user_id)
+        if current == profile:
+            return True
+
+        if current is None:
+            self._groups[user_id] = ()
+            self._ids = None
+            self.version += 1
+        self._profiles[user_id] = profile
+        self._pending_users[user_id] = profile
+        return True
+
+    def user_exists(self, user_id: int) -> bool:
+        self._ensure_loaded()
+        return user_id in self._profiles
+
+    def is_active(self, user_id: int) -> bool:
+        self._ensure_loaded()
+        return user_id in self._groups
+
+    def get_all_users(self) -> Tuple[int, ...]:
+        """Активные пользователи: неизменяемый снимок, пересобирается только после изменения состава"""
+        self._ensure_loaded()
+        if self._ids is None:
+            self._ids = tuple(self._groups)
+        return self._ids
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._groups)
+
+    def get_user_groups(self, user_id: int) -> List[str]:
+        self._ensure_loaded()
+        if user_id in self._inactive:
+            return list(self._inactive[user_id][1])
+        return list(self._groups.get(user_id, ()))
+
+    def set_user_group(self, user_id: int, group_id: str, subscribed: bool) -> bool:
+        """Подписка пользователя на группу или отписка от нее"""
+        self._ensure_loaded()
+        groups = tuple(self.get_user_groups(user_id))
+        if subscribed and group_id not in groups:
+            groups = groups + (group_id,)
+        elif not subscribed and group_id in groups:
+            groups = tuple(group for group in groups if group != group_id)
+        else:
+            return True
+
+        if user_id in self._inactive:
+            self._inactive[user_id] = (self._inactive[user_id][0], groups)
+        else:
+            self._groups[user_id] = groups
+        self._pending_groups[(user_id, group_id)] = subscribed
+        self.version += 1
+        return True
+
+    def get_user_group_map(self) -> Dict[int, tuple]:
+        """Снимок активных получателей {user_id: кортеж групп}. Возвращается без копирования, только для чтения"""
+        self._ensure_loaded()
+        return self._groups
+
+    def get_group_users(self, group_id: str, include_unsubscribed: bool = False) -> List[int]:
+        """Активные пользователи группы; include_unsubscribed добавляет тех, кто не выбрал группу"""
+        self._ensure_loaded()
+        return [
+            user_id for user_id, groups in self._groups.items()
+            if group_id in groups or (include_unsubscribed and not groups)
+        ]
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """Число пользователей в каждом состоянии доставки"""
+        self._ensure_loaded()
+        counts = {USER_STATUS_ACTIVE: len(self._groups)}
+        for status, _ in self._inactive.values():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def set_delivery_status(self, user_id: int, status: str):
+        """Переводит пользователя в состояние доставки; неактивные исключаются из рассылок"""
+        self._ensure_loaded()
+        if user_id not in self._profiles:
+            return
+
+        if status == USER_STATUS_ACTIVE:
+            if user_id in self._inactive:
+                self._groups[user_id] = self._inactive.pop(user_id)[1]
+                self._ids = None
+                self.version += 1
+                logger.info(
+                    "✅ Пользователь %s снова получает рассылки", user_id,
+                    extra={"event": "delivery_status", "user_id": user_id}
+                )
+            self._fail_counts.pop(user_id, None)
+        else:
+            if user_id in self._groups:
+                self._inactive[user_id] = (status, self._groups.pop(user_id))
+                self._ids = None
+                self.version += 1
+                logger.info(
+                    "🚫 Пользователь %s исключен из рассылок: %s", user_id, status,
+                    extra={"event": "delivery_status", "user_id": user_id}
+                )
+            else:
+                self._inactive[user_id] = (status, self._inactive[user_id][1])
+
+        self._pending_delivery[user_id] = (status, self._fail_counts.get(user_id, 0), None)
+
+    def record_delivery(self, chat_id: int, error: Optional[TelegramError]):
+        """Учитывает итог доставки сообщения (обработчик итогов Broadcaster)"""
+        if not self._loaded or chat_id not in self._profiles:
+            return
+
+        if error is None:
+            if chat_id in self._inactive:
+                self.set_delivery_status(chat_id, USER_STATUS_ACTIVE)
+            self._fail_counts.pop(chat_id, None)
+            now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            self._pending_delivery[chat_id] = (USER_STATUS_ACTIVE, 0, now)
+            return
+
+        self._fail_counts[chat_id] = self._fail_counts.get(chat_id, 0) + 1
+        status = delivery_status_for_error(error)
+        if status:
+            self.set_delivery_status(chat_id, status)
+        else:
+            current = self._inactive[chat_id][0] if chat_id in self._inactive else USER_STATUS_ACTIVE
+            self._pending_delivery[chat_id] = (current, self._fail_counts[chat_id], None)
+
+    @property
+    def has_pending_writes(self) -> bool:
+        return bool(self._pending_users or self._pending_groups or self._pending_delivery)
+
+    def _take_pending(self):
+        pending = (self._pending_users, self._pending_groups, self._pending_delivery)
+        self._pending_users, self._pending_groups, self._pending_delivery = {}, {}, {}
+        return pending
+
+    def _restore_pending(self, users: dict, groups: dict, delivery: dict):
+        """Возвращает незаписанные изменения, не затирая более новые"""
+        for user_id, profile in users.items():
+            self._pending_users.setdefault(user_id, profile)
+        for key, subscribed in groups.items():
+            self._pending_groups.setdefault(key, subscribed)
+        for user_id, state in delivery.items():
+            self._pending_delivery.setdefault(user_id, state)
+
+    def flush(self) -> int:
+        """Синхронная запись накопленных изменений"""
+        pending = self._take_pending()
+        if not any(pending):
+            return 0
+        if not self.database.save_users_batch(*pending):
+            self._restore_pending(*pending)
+            return 0
+        return sum(len(changes) for changes in pending)
+
+    async def flush_async(self) -> int:
+        """Запись накопленных изменений одной транзакцией в потоке БД"""
+        pending = self._take_pending()
+        if not any(pending):
+            return 0
+        saved = await self.async_database.run(self.database.save_users_batch, *pending)
+        if not saved:
+            self._restore_pending(*pending)
+            return 0
+        written = sum(len(changes) for changes in pending)
+        logger.debug(f"Реестр пользователей: записано изменений {written}")
+        return written
+
+# Глобальный реестр пользователей создается контейнером при первом обращении
+__getattr__ = legacy_attribute(__name__, {"user_registry": "user_registry"})
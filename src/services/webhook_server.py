@@ -0,0 +1,76 @@
+# services/webhook_server.py
+import logging
+import hmac
+import json
+import secrets
+from typing import Awaitable, Callable
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Локальный HTTP-сервер, принимающий обновления от Telegram.
+
+    Проверяет секретный токен из заголовка и передает обновления
+    в update_queue приложения PTB, где их разбирают обычные обработчики,
+    либо в on_update (например, в общую очередь кластера).
+    """
+
+    def __init__(self, application, listen: str, port: int, path: str, secret_token: str = None,
+                 on_update: Callable[[Update], Awaitable[object]] = None):
+        self.application = application
+        self.on_update = on_update
+        self.listen = listen
+        self.port = port
+        self.path = path
+        # Telegram допускает символы A-Z, a-z, 0-9, _ и -; token_urlsafe им соответствует
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        # aiohttp нужен только в режиме webhook: импортируется при создании сервера
+        from aiohttp import web
+        self.web_app = web.Application()
+        self.web_app.router.add_post(self.path, self._handle_update)
+        self._runner = None
+
+    @property
+    def bound_port(self) -> int:
+        """Фактический порт (полезно при port=0 в тестах)"""
+        if self._runner and self._runner.addresses:
+            return self._runner.addresses[0][1]
+        return self.port
+
+    async def _handle_update(self, request):
+        from aiohttp import web
+        token = request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token, self.secret_token):
+            logger.warning(f"Отклонен запрос webhook с неверным секретным токеном от {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            logger.warning(f"Некорректное обновление в webhook: {e}")
+            return web.Response(status=400)
+
+        if self.on_update:
+            await self.on_update(update)
+        else:
+            await self.application.update_queue.put(update)
+        return web.Response(status=200)
+
+    async def start(self):
+        from aiohttp import web
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"🌐 Webhook-сервер слушает {self.listen}:{self.bound_port}{self.path}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("🌐 Webhook-сервер остановлен")
@@ -1,10 +1,19 @@
 # utils/__init__.py
-from .config import BOT_TOKEN, ADMIN_USERNAME_LIST, get_admin_usernames
-from .keyboards import get_main_keyboard, get_admin_keyboard, get_admin_menu_keyboard
-from .helpers import setup_logging, validate_date, get_date_for_weekday
+# Имена подгружаются из модулей при первом обращении: импорт src.utils.config
+# не должен тянуть telegram ради клавиатур
+import importlib
 
-__all__ = [
-    'BOT_TOKEN', 'ADMIN_USERNAME_LIST', 'get_admin_usernames',
-    'get_main_keyboard', 'get_admin_keyboard', 'get_admin_menu_keyboard',
-    'setup_logging', 'validate_date', 'get_date_for_weekday'
-]
\ No newline at end of file
+_EXPORTS = {
+    'BOT_TOKEN': 'config', 'ADMIN_USERNAME_LIST': 'config', 'get_admin_usernames': 'config',
+    'validate_config': 'config',
+    'get_main_keyboard': 'keyboards', 'get_admin_keyboard': 'keyboards', 'get_admin_menu_keyboard': 'keyboards',
+    'reply_keyboard_for': 'markups', 'is_admin': 'roles',
+    'setup_logging': 'logging_setup', 'shutdown_logging': 'logging_setup', 'validate_date': 'helpers', 'get_date_for_weekday': 'helpers',
+}
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = list(_EXPORTS)
@@ -1,15 +1,84 @@
 # utils/config.py
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')
 ADMIN_USERNAMES = os.getenv('ADMIN_USERNAMES', '')
 
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в .env файле")
+# Параметры массовых рассылок (лимиты Telegram: ~30 сообщений/с глобально, ~1 сообщение/с в один чат)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+BROADCAST_RATE_LIMIT = float(os.getenv('BROADCAST_RATE_LIMIT', '25'))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1.0'))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+BROADCAST_CHECKPOINT_SIZE = int(os.getenv('BROADCAST_CHECKPOINT_SIZE', '100'))
+
+# Часовой пояс расписания (IANA, например Europe/Moscow): в нем считаются «сегодня», время занятий
+# и рассылок. Группа может задать свой пояс в файле расписания, пользователь — в /settings
+TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow').strip()
+
+# Расписание на завтра: время по умолчанию и окно (минуты), по которому равномерно распределяются
+# пользователи, не выбравшие время сами, — вместо одного пика нагрузки в DIGEST_TIME
+DIGEST_TIME = os.getenv('DIGEST_TIME', '21:00')
+DIGEST_SPREAD_MINUTES = int(os.getenv('DIGEST_SPREAD_MINUTES', '60'))
+
+# Число одновременно обрабатываемых обновлений (обновления одного чата — всегда по очереди)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+
+# Период записи накопленных изменений реестра пользователей в БД, секунды
+USER_REGISTRY_FLUSH_INTERVAL = float(os.getenv('USER_REGISTRY_FLUSH_INTERVAL', '5'))
+
+# Хранилище состояния диалогов админ-панели: sqlite (переживает перезапуск) или memory; время жизни, секунды
+STATE_STORE = os.getenv('STATE_STORE', 'sqlite').strip().lower()
+STATE_TTL = float(os.getenv('STATE_TTL', '1800'))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = '/' + os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Файл расписания (JSON или TOML) и период проверки его изменений в секундах
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCHEDULE_FILE = os.getenv('SCHEDULE_FILE', os.path.join(PROJECT_ROOT, 'config', 'timetable.json'))
+SCHEDULE_RELOAD_INTERVAL = int(os.getenv('SCHEDULE_RELOAD_INTERVAL', '30'))
+
+# Эндпоинт метрик в формате Prometheus (по умолчанию только локальный)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
+# Лента календаря (iCalendar): локальный HTTP-сервер и его публичный адрес для команды /calendar
+CALENDAR_ENABLED = os.getenv('CALENDAR_ENABLED', 'false').strip().lower() in ('1', 'true', 'yes')
+CALENDAR_LISTEN = os.getenv('CALENDAR_LISTEN', '127.0.0.1')
+CALENDAR_PORT = int(os.getenv('CALENDAR_PORT', '8081'))
+CALENDAR_URL = os.getenv('CALENDAR_URL', '').rstrip('/')
+
+# Логирование: общий уровень, уровни подсистем (логгер=уровень через запятую), формат вывода
+# в консоль (json или text), каталог файлов с ротацией (пусто — без файлов) и выборка частых событий:
+# событие=N — в журнал попадает каждая N-я запись события (ошибки пишутся всегда)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').strip().upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').strip().lower()
+LOG_DIR = os.getenv('LOG_DIR', os.path.join(PROJECT_ROOT, 'logs'))
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.getenv('LOG_FILE_BACKUPS', '5'))
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', 'message_received=10,today_request=10,send_failed=10,flood_wait=10,delivery_status=10')
+
+# Несколько процессов бота с общей БД: аренды вместо единственного процесса
+CLUSTER_ENABLED = os.getenv('CLUSTER_ENABLED', 'false').strip().lower() in ('1', 'true', 'yes')
+WORKER_ID = os.getenv('WORKER_ID', '')
+CLUSTER_PARTITIONS = int(os.getenv('CLUSTER_PARTITIONS', '16'))
+CLUSTER_LEASE_TTL = float(os.getenv('CLUSTER_LEASE_TTL', '15'))
+CLUSTER_POLL_INTERVAL = float(os.getenv('CLUSTER_POLL_INTERVAL', '0.2'))
 
 def get_admin_usernames():
     """Получает список username администраторов"""
@@ -29,7 +98,19 @@ def get_admin_usernames():
 
 ADMIN_USERNAME_LIST = get_admin_usernames()
 
-if ADMIN_USERNAME_LIST:
-    print(f"Загружены username администраторов: {ADMIN_USERNAME_LIST}")
-else:
-    print("⚠️  Предупреждение: не заданы username администраторов")
\ No newline at end of file
+def validate_config():
+    """Проверка настроек перед запуском бота.
+
+    Импорт модуля ничего не проверяет и не выводит: его используют тесты,
+    утилиты и процессы кластера, которым токен может быть не нужен.
+    """
+    if BOT_MODE not in ('polling', 'webhook'):
+        raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE} (ожидается polling или webhook)")
+    
+    if not BOT_TOKEN:
+        raise ValueError("BOT_TOKEN не найден в .env файле")
+    
+    if ADMIN_USERNAME_LIST:
+        logger.info(f"Загружены username администраторов: {ADMIN_USERNAME_LIST}")
+    else:
+        logger.warning("⚠️  Предупреждение: не заданы username администраторов")
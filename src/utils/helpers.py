@@ -1,16 +1,11 @@
 # utils/helpers.py
 import logging
 from datetime import datetime, timedelta
+# Настройка журнала живет в logging_setup; имя оставлено здесь для прежних импортов
+from src.utils.logging_setup import setup_logging, shutdown_logging
 
 logger = logging.getLogger(__name__)
 
-def setup_logging():
-    """Настройка логирования"""
-    logging.basicConfig(
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        level=logging.INFO
-    )
-
 def validate_date(date_string: str) -> bool:
     """Проверяет корректность даты"""
     try:
@@ -1,31 +1,30 @@
 # utils/keyboards.py
-from telegram import KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from src.utils.markups import (
+    MAIN_KEYBOARD, ADMIN_KEYBOARD, ADMIN_MENU_MARKUP, groups_markup, settings_markup
+)
 
 def get_main_keyboard():
     """Возвращает основную клавиатуру с кнопками"""
-    keyboard = [
-        [KeyboardButton("📅 Сегодня"), KeyboardButton("📆 Завтра")],
-        [KeyboardButton("📅 Неделя"), KeyboardButton("❓ Помощь")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    return MAIN_KEYBOARD
 
 def get_admin_keyboard():
     """Возвращает клавиатуру для администратора"""
-    keyboard = [
-        [KeyboardButton("📅 Сегодня"), KeyboardButton("📆 Завтра")],
-        [KeyboardButton("📅 Неделя"), KeyboardButton("❓ Помощь")],
-        [KeyboardButton("⚙️ Админ-панель")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    return ADMIN_KEYBOARD
 
 def get_admin_menu_keyboard():
     """Клавиатура для админ-панели"""
-    keyboard = [
-        [InlineKeyboardButton("📋 Список мероприятий", callback_data="admin_list_events")],
-        [InlineKeyboardButton("➕ Добавить мероприятие", callback_data="admin_add_event")],
-        [InlineKeyboardButton("❌ Удалить мероприятие", callback_data="admin_delete_event")],
-        [InlineKeyboardButton("📢 Сообщение всем", callback_data="admin_broadcast_message")],
-        [InlineKeyboardButton("👥 Список админов", callback_data="admin_list_admins")],
-        [InlineKeyboardButton("⬅️ Назад к расписанию", callback_data="admin_back_to_schedule")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
+    return ADMIN_MENU_MARKUP
+
+def get_groups_keyboard(groups: dict, subscribed: set):
+    """Клавиатура выбора групп: отмеченные группы — текущие подписки"""
+    return groups_markup(groups, subscribed)
+
+def get_settings_keyboard(preferences, time_choices: tuple, lead_choices: tuple,
+                          timezone: str = "", timezone_choices: dict = None):
+    """Клавиатура настроек рассылок пользователя; timezone — действующий пояс пользователя"""
+    minute = preferences.digest_minute
+    digest_time = f"{minute // 60:02d}:{minute % 60:02d}" if minute is not None else ""
+    return settings_markup(
+        digest_time, preferences.digest_enabled, preferences.reminders_enabled, preferences.reminder_lead,
+        tuple(time_choices), tuple(lead_choices), timezone, tuple((timezone_choices or {}).items())
+    )
@@ -0,0 +1,170 @@
+# utils/logging_setup.py
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict
+from src.utils.config import (
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_DIR, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS, LOG_SAMPLE
+)
+
+LOG_FILE_NAME = "bot.log"
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Атрибуты, которые есть у любой записи: остальные пришли через extra и попадают в JSON отдельными полями
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Глобальный обработчик очереди: (параметры, слушатель очереди)
+_pipeline = None
+
+
+def parse_pairs(value: str) -> Dict[str, str]:
+    """'a=1,b=2' -> {'a': '1', 'b': '2'}"""
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, _, item_value = item.partition("=")
+            if key.strip():
+                pairs[key.strip()] = item_value.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; поля из extra (event, user_id, ...) выводятся отдельно"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка частых событий: из записей с extra={'event': ...} пропускается каждая N-я.
+
+    Ошибки проходят всегда. Прошедшая выборку запись получает поле sample_rate,
+    чтобы по журналу можно было оценить исходное число событий.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {event: every for event, every in rates.items() if every > 1}
+        self._counters: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        every = self.rates.get(event)
+        if every is None or record.levelno >= logging.ERROR:
+            return True
+        count = self._counters.get(event, 0)
+        self._counters[event] = count + 1
+        if count % every:
+            return False
+        record.sample_rate = every
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Кладет запись в очередь, не форматируя ее.
+
+    Стандартный QueueHandler форматирует запись целиком (включая трассировку) в
+    потоке, который пишет в журнал, — то есть в цикле событий. Здесь в вызывающем
+    потоке только подставляются аргументы сообщения (они могут измениться позже),
+    а форматирование, JSON и запись в файлы выполняет поток QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _build_handlers(log_format: str, log_dir: str, max_bytes: int, backups: int) -> list:
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+
+    if log_dir:
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                os.path.join(log_dir, LOG_FILE_NAME), maxBytes=max_bytes, backupCount=backups,
+                encoding="utf-8", delay=True
+            )
+            # Файлы всегда в JSON: их читают программы сбора журналов
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"⚠️ Журнал в файл отключен, каталог {log_dir} недоступен: {e}", file=sys.stderr)
+    return handlers
+
+
+def setup_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, log_format: str = LOG_FORMAT,
+                  log_dir: str = LOG_DIR, sample: str = LOG_SAMPLE,
+                  max_bytes: int = LOG_FILE_MAX_BYTES, backups: int = LOG_FILE_BACKUPS) -> QueueListener:
+    """Настраивает журнал: записи уходят в очередь, вывод выполняет отдельный поток.
+
+    Повторный вызов с теми же параметрами ничего не меняет, с другими —
+    останавливает прежний конвейер и запускает новый.
+    """
+    global _pipeline
+    settings = (level, levels, log_format, log_dir, sample, max_bytes, backups)
+    if _pipeline is not None:
+        if _pipeline[0] == settings:
+            return _pipeline[1]
+        shutdown_logging()
+
+    listener = QueueListener(
+        queue.SimpleQueue(), *_build_handlers(log_format, log_dir, max_bytes, backups),
+        respect_handler_level=True
+    )
+    queue_handler = DeferredQueueHandler(listener.queue)
+    queue_handler.addFilter(SamplingFilter({event: int(every) for event, every in parse_pairs(sample).items()}))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Уровни подсистем: отключенные записи отбрасываются до форматирования
+    for name, name_level in parse_pairs(levels).items():
+        logging.getLogger(name).setLevel(name_level.upper())
+
+    listener.start()
+    _pipeline = (settings, listener)
+    return listener
+
+
+def shutdown_logging():
+    """Дописывает записи из очереди и закрывает файлы журнала"""
+    global _pipeline
+    if _pipeline is None:
+        return
+    _, listener = _pipeline
+    _pipeline = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,97 @@
+# utils/markups.py
+from functools import lru_cache
+from telegram import KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+
+# Разметка создается один раз при импорте: объекты PTB неизменяемы, их можно отдавать всем обработчикам.
+# Модуль зависит только от telegram, поэтому его можно импортировать откуда угодно без циклов
+
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📅 Сегодня"), KeyboardButton("📆 Завтра")],
+        [KeyboardButton("📅 Неделя"), KeyboardButton("❓ Помощь")]
+    ],
+    resize_keyboard=True
+)
+
+ADMIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📅 Сегодня"), KeyboardButton("📆 Завтра")],
+        [KeyboardButton("📅 Неделя"), KeyboardButton("❓ Помощь")],
+        [KeyboardButton("⚙️ Админ-панель")]
+    ],
+    resize_keyboard=True
+)
+
+ADMIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 Список мероприятий", callback_data="admin_list_events")],
+    [InlineKeyboardButton("➕ Добавить мероприятие", callback_data="admin_add_event")],
+    [InlineKeyboardButton("❌ Удалить мероприятие", callback_data="admin_delete_event")],
+    [InlineKeyboardButton("📢 Сообщение всем", callback_data="admin_broadcast_message")],
+    [InlineKeyboardButton("📤 Ход рассылок", callback_data="admin_broadcast_jobs")],
+    [InlineKeyboardButton("👥 Список админов", callback_data="admin_list_admins")],
+    [InlineKeyboardButton("⬅️ Назад к расписанию", callback_data="admin_back_to_schedule")]
+])
+
+BACK_BUTTON = InlineKeyboardButton("⬅️ Назад", callback_data="admin_back_to_menu")
+BACK_TO_MENU_MARKUP = InlineKeyboardMarkup([[BACK_BUTTON]])
+CANCEL_TO_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Отмена", callback_data="admin_back_to_menu")]])
+TO_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ В меню", callback_data="admin_back_to_menu")]])
+
+
+def reply_keyboard_for(is_admin: bool) -> ReplyKeyboardMarkup:
+    """Основная клавиатура для роли пользователя"""
+    return ADMIN_KEYBOARD if is_admin else MAIN_KEYBOARD
+
+
+@lru_cache(maxsize=256)
+def _groups_markup(groups: tuple, subscribed: frozenset) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            f"{'✅' if group_id in subscribed else '▫️'} {title}",
+            callback_data=f"group_toggle_{group_id}"
+        )]
+        for group_id, title in groups
+    ])
+
+
+def groups_markup(groups: dict, subscribed) -> InlineKeyboardMarkup:
+    """Клавиатура выбора групп; одинаковые наборы подписок используют один объект"""
+    return _groups_markup(tuple(groups.items()), frozenset(subscribed))
+
+
+@lru_cache(maxsize=256)
+def settings_markup(digest_time: str, digest_enabled: bool, reminders_enabled: bool, reminder_lead: int,
+                    time_choices: tuple, lead_choices: tuple, timezone: str = "",
+                    timezone_choices: tuple = ()) -> InlineKeyboardMarkup:
+    """Клавиатура настроек рассылок; digest_time — выбранное время ЧЧ:ММ или пустая строка (автоматически),
+    timezone_choices — пары (пояс IANA, подпись)"""
+    def mark(selected: bool, text: str) -> str:
+        return f"• {text} •" if selected else text
+
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            f"{'✅' if digest_enabled else '▫️'} Расписание на завтра", callback_data="pref_digest_toggle"
+        )],
+        [InlineKeyboardButton(mark(not digest_time, "Авто"), callback_data="pref_digest_time_auto")]
+        + [
+            InlineKeyboardButton(mark(choice == digest_time, choice), callback_data=f"pref_digest_time_{choice}")
+            for choice in time_choices[:2]
+        ],
+        [
+            InlineKeyboardButton(mark(choice == digest_time, choice), callback_data=f"pref_digest_time_{choice}")
+            for choice in time_choices[2:]
+        ],
+        [InlineKeyboardButton(
+            f"{'✅' if reminders_enabled else '▫️'} Напоминания о занятиях", callback_data="pref_reminders_toggle"
+        )],
+        [
+            InlineKeyboardButton(mark(lead == reminder_lead, f"{lead} мин"), callback_data=f"pref_lead_{lead}")
+            for lead in lead_choices
+        ],
+    ] + [
+        [
+            InlineKeyboardButton(mark(zone == timezone, title), callback_data=f"pref_tz_{zone}")
+            for zone, title in timezone_choices[start:start + 3]
+        ]
+        for start in range(0, len(timezone_choices), 3)
+    ])
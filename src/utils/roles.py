@@ -0,0 +1,12 @@
+# utils/roles.py
+from src.utils.config import ADMIN_USERNAME_LIST
+
+# Множество для проверки за O(1); username сравниваются без @
+ADMIN_USERNAMES = frozenset(ADMIN_USERNAME_LIST)
+
+
+def is_admin(username: str) -> bool:
+    """Проверяет, является ли пользователь администратором"""
+    if not username:
+        return False
+    return username.lstrip('@') in ADMIN_USERNAMES
@@ -1,15 +1,45 @@
 # tests/test_bot.py
 import asyncio
+import json
 import logging
 import sys
 import os
+import tempfile
+import time
 
 # Добавляем корневую директорию в путь для импортов
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.services.database import db
-from src.services.schedule_manager import schedule_manager
-from datetime import datetime, timedelta
+from src.services.database import Database, AsyncDatabase, db, async_db, MIGRATIONS, USER_STATUS_BLOCKED, USER_STATUS_CHAT_NOT_FOUND
+from src.services.schedule_manager import schedule_manager, ScheduleManager
+from src.services.broadcaster import Broadcaster, TokenBucket
+from src.services.broadcast_jobs import BroadcastJobManager
+from src.services.reminder_planner import ReminderPlanner
+from src.services.notifier import Notifier
+from src.services.user_registry import UserRegistry, user_registry
+from src.services.webhook_server import WebhookServer, SECRET_TOKEN_HEADER
+from src.services.state_store import StateStore, MemoryStateStore, SQLiteStateStore
+from src.services.admin_panel import AdminPanel, EVENT_FILTER_NAMESPACE, EVENTS_VIEW, EVENTS_DELETE, parse_event_filter
+from src.services.timetable import compile_timetable
+from src.services.update_processor import ChatOrderedUpdateProcessor
+from src.services.cluster import ClusterCoordinator, ClusterWorker, partition_for
+from src.services.ical_export import ICalExporter, CalendarFeedServer, is_not_modified
+from src.services.user_preferences import PreferenceStore, user_preferences, parse_minute
+from src.services.digest_scheduler import DigestScheduler
+from src.container import AppContainer
+from benchmarks.import_time import measure
+from src.utils.logging_setup import setup_logging, shutdown_logging
+from src.services.clock import FakeClock
+from src.utils.keyboards import get_main_keyboard, get_groups_keyboard
+from src.utils.markups import MAIN_KEYBOARD, ADMIN_KEYBOARD, reply_keyboard_for
+from src.utils.roles import is_admin
+from src.utils.config import ADMIN_USERNAME_LIST
+from src.services.metrics import metrics, MetricsServer, instrument_handler, DB_QUERY_DURATION, MESSAGES_SENT
+from telegram.ext import Application, BaseUpdateProcessor
+from telegram import Update
+import aiohttp
+from telegram.error import RetryAfter, TimedOut, Forbidden, BadRequest
+from datetime import date, datetime, time as dtime, timedelta, timezone
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -71,6 +101,1157 @@ async def test_all_functionality():
     except Exception as e:
         print(f"❌ Ошибка получения предметов: {e}")
     
+    # 5. Тест движка рассылок
+    print("\n5. Тестируем движок рассылок...")
+    try:
+        class FakeBot:
+            def __init__(self):
+                self.sent = []
+                self.failures = {2: [RetryAfter(0)], 3: [TimedOut()], 4: [Forbidden("bot was blocked by the user")] * 5,
+                                 5: [BadRequest("Chat not found")] * 5}
+            
+            async def send_message(self, chat_id, text, **kwargs):
+                errors = self.failures.get(chat_id)
+                if errors:
+                    raise errors.pop(0)
+                self.sent.append(chat_id)
+        
+        fake_bot = FakeBot()
+        engine = Broadcaster(concurrency=4, rate_limit=1000, per_chat_interval=0, retry_backoff=0)
+        result = await engine.broadcast(fake_bot, range(1, 51), "test")
+        
+        # BadRequest окончательная: без повторов, одна попытка
+        bad_request_once = len(fake_bot.failures[5]) == 4
+        
+        # После паузы RetryAfter воркеры выходят из нее по очереди, с интервалом 1/rate
+        bucket = TokenBucket(rate=10)
+        bucket.pause(1.0)
+        delays = [bucket._reserve() for _ in range(3)]
+        # Повторный RetryAfter не сбрасывает уже зарезервированные слоты: новые встают после них
+        bucket.pause(1.0)
+        delays += [bucket._reserve() for _ in range(2)]
+        staggered = delays[0] >= 0.99 and all(abs(b - a - 0.1) < 0.01 for a, b in zip(delays, delays[1:]))
+        
+        if (sorted(fake_bot.sent) == [i for i in range(1, 51) if i not in (4, 5)] and result.failed == 2
+                and result.retry_after_count == 1 and bad_request_once and staggered):
+            print(f"✅ Движок рассылок работает корректно: {result}")
+        else:
+            print(f"❌ Ошибка в движке рассылок: {result}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования рассылок: {e}")
+    
+    # 6. Тест кэша расписания
+    print("\n6. Тестируем кэш расписания...")
+    try:
+        tomorrow = datetime.now() + timedelta(days=1)
+        tomorrow_str = tomorrow.strftime("%Y-%m-%d")
+        before = schedule_manager.format_schedule_for_day(tomorrow)
+        hits = schedule_manager.cache.hits
+        cached = schedule_manager.format_schedule_for_day(tomorrow)
+        
+        day_schedule = schedule_manager.get_day_schedule(tomorrow)
+        subject_name = day_schedule.subjects[0].name if day_schedule else "Математический анализ"
+        event_id = db.add_control_event(tomorrow_str, subject_name, "Тестовая контрольная", "test")
+        after_add = schedule_manager.format_schedule_for_day(tomorrow)
+        db.delete_control_event(event_id)
+        after_delete = schedule_manager.format_schedule_for_day(tomorrow)
+        
+        hit_ok = cached == before and schedule_manager.cache.hits == hits + 1
+        invalidation_ok = after_delete == before and (not day_schedule or "Тестовая контрольная" in after_add)
+        if hit_ok and invalidation_ok:
+            print("✅ Кэш расписания работает корректно")
+        else:
+            print("❌ Ошибка в кэше расписания")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования кэша: {e}")
+    
+    # 7. Тест асинхронного слоя БД
+    print("\n7. Тестируем асинхронный слой БД...")
+    try:
+        await asyncio.gather(*(
+            async_db.add_user(-1000 - i, f"test_user_{i}", "Test") for i in range(10)
+        ))
+        users = await async_db.get_all_users()
+        exists = await async_db.user_exists(-1000)
+        journal_mode = await async_db.run(
+            lambda: db.get_connection().execute("PRAGMA journal_mode").fetchone()[0]
+        )
+        
+        if exists and all(-1000 - i in users for i in range(10)) and journal_mode == "wal":
+            print("✅ Асинхронный слой БД работает корректно")
+        else:
+            print("❌ Ошибка в асинхронном слое БД")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования асинхронного слоя БД: {e}")
+    
+    # 8. Тест планировщика напоминаний
+    print("\n8. Тестируем планировщик напоминаний...")
+    try:
+        class FakeJob:
+            def __init__(self, callback, when, data, name):
+                self.callback, self.when, self.data, self.name = callback, when, data, name
+                self.removed = False
+            
+            def schedule_removal(self):
+                self.removed = True
+        
+        class FakeJobQueue:
+            def __init__(self):
+                self.scheduled = []
+            
+            def jobs(self):
+                return [job for job in self.scheduled if not job.removed]
+            
+            def run_once(self, callback, when, data=None, name=None, job_kwargs=None):
+                self.scheduled.append(FakeJob(callback, when, data, name))
+        
+        class FakeContext:
+            def __init__(self, job):
+                self.job = job
+        
+        sent = []
+        
+        async def record_reminder(context, lessons):
+            sent.append([lesson['name'] for lesson in lessons])
+        
+        job_queue = FakeJobQueue()
+        planner = ReminderPlanner(job_queue, record_reminder)
+        # Воскресенье перед учебным понедельником: весь план на завтра
+        sunday = datetime(2024, 9, 8, 12, 0).astimezone()
+        scheduled = planner.rebuild(now=sunday)
+        jobs = job_queue.jobs()
+        
+        await jobs[0].callback(FakeContext(jobs[0]))
+        await jobs[0].callback(FakeContext(jobs[0]))
+        planner.rebuild(now=sunday)
+        
+        monday_subjects = schedule_manager.get_subjects_with_times(datetime(2024, 9, 9))
+        first_start = datetime.strptime(monday_subjects[0]['start_time'], "%H:%M")
+        first_ok = jobs[0].when.strftime("%H:%M") == (first_start - timedelta(minutes=10)).strftime("%H:%M")
+        start_times = {subject['start_time'] for subject in monday_subjects}
+        if scheduled == len(start_times) and len(sent) == 1 and len(sent[0]) == len(jobs[0].data["lessons"]) \
+                and len(job_queue.jobs()) == scheduled - 1 and first_ok:
+            print(f"✅ Планировщик напоминаний работает корректно: {scheduled} напоминаний")
+        else:
+            print("❌ Ошибка в планировщике напоминаний")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования планировщика напоминаний: {e}")
+    
+    # 9. Тест webhook-сервера (локальный «Telegram» отправляет обновления)
+    print("\n9. Тестируем webhook-сервер...")
+    try:
+        application = Application.builder().token("123456:TEST").build()
+        server = WebhookServer(application, "127.0.0.1", 0, "/telegram", "test-secret")
+        await server.start()
+        
+        update_payload = {
+            "update_id": 1,
+            "message": {
+                "message_id": 1, "date": 0, "text": "📅 Сегодня",
+                "chat": {"id": 42, "type": "private"},
+                "from": {"id": 42, "is_bot": False, "first_name": "Test"}
+            }
+        }
+        url = f"http://127.0.0.1:{server.bound_port}/telegram"
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=update_payload) as response:
+                rejected_status = response.status
+            async with session.post(url, json=update_payload, headers={SECRET_TOKEN_HEADER: "test-secret"}) as response:
+                accepted_status = response.status
+        await server.stop()
+        
+        update = application.update_queue.get_nowait()
+        if rejected_status == 403 and accepted_status == 200 and update.message.text == "📅 Сегодня":
+            print("✅ Webhook-сервер работает корректно")
+        else:
+            print(f"❌ Ошибка в webhook-сервере: {rejected_status}, {accepted_status}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования webhook-сервера: {e}")
+    
+    # 10. Тест миграций схемы и запросов по диапазону дат
+    print("\n10. Тестируем миграции и запросы по диапазону дат...")
+    try:
+        start = datetime.now() + timedelta(days=1)
+        dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(3)]
+        event_ids = [db.add_control_event(date, "Информатика", "Тест диапазона", "test") for date in dates]
+        
+        events = db.get_control_events_between(dates[0], dates[1])
+        plan = db.get_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT date, subject_name, event_type FROM control_events WHERE date BETWEEN ? AND ?",
+            (dates[0], dates[1])
+        ).fetchall()
+        uses_index = any("idx_control_events_date_subject" in row[-1] for row in plan)
+        
+        for event_id in event_ids:
+            db.delete_control_event(event_id)
+        
+        in_range = [event for event in events if event[2] == "Тест диапазона"]
+        if db.schema_version == MIGRATIONS[-1][0] and len(in_range) == 2 and uses_index:
+            print(f"✅ Миграции и диапазонные запросы работают корректно (схема v{db.schema_version})")
+        else:
+            print("❌ Ошибка в миграциях или диапазонных запросах")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования миграций: {e}")
+    
+    # 11. Тест загрузки и горячей перезагрузки файла расписания
+    print("\n11. Тестируем файл расписания и горячую перезагрузку...")
+    try:
+        raw = {
+            "semester_start": "2024-09-01",
+            "numerator": {"понедельник": [
+                {"name": "Позднее занятие", "room": "1", "start": "12:00", "end": "13:30", "type": "лекция"},
+                {"name": "Раннее занятие", "room": "2", "start": "8:30", "end": "10:00", "type": "семинар"}
+            ]},
+            "denominator": {}
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "timetable.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(raw, f, ensure_ascii=False)
+            
+            manager = ScheduleManager(path)
+            reloads = []
+            manager.add_change_listener(lambda: reloads.append(True))
+            sorted_ok = [s.name for s in manager.numerator_schedule["понедельник"].subjects] == ["Раннее занятие", "Позднее занятие"]
+            
+            raw["numerator"]["понедельник"][0]["room"] = "999"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(raw, f, ensure_ascii=False)
+            os.utime(path, (1, 1))
+            reloaded = await manager.reload_if_changed()
+            
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("{ broken json")
+            os.utime(path, (2, 2))
+            broken_reloaded = await manager.reload_if_changed()
+            
+            room = manager.numerator_schedule["понедельник"].subjects[1].room
+            if sorted_ok and reloaded and not broken_reloaded and room == "999" and len(reloads) == 1:
+                print(f"✅ Файл расписания и горячая перезагрузка работают корректно (версия {manager.timetable.version})")
+            else:
+                print("❌ Ошибка в загрузке или перезагрузке расписания")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования файла расписания: {e}")
+    
+    # 12. Тест нескольких групп
+    print("\n12. Тестируем несколько групп...")
+    try:
+        lesson = {"name": "Информатика", "room": "1", "start": "10:10", "end": "11:40", "type": "лекция"}
+        raw = {
+            "default_group": "group-a",
+            "groups": {
+                "group-a": {"title": "Группа А", "semester_start": "2024-09-01",
+                            "numerator": {"понедельник": [lesson]}, "denominator": {"понедельник": [lesson]}},
+                "group-b": {"title": "Группа Б", "semester_start": "2024-09-01",
+                            "numerator": {"вторник": [lesson]}, "denominator": {"вторник": [lesson]}}
+            }
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "timetable.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(raw, f, ensure_ascii=False)
+            manager = ScheduleManager(path)
+        
+        monday = datetime(2030, 1, 7)
+        event_id = db.add_control_event("2030-01-07", "Информатика", "Групповой тест", "test", "group-b")
+        text_a = manager.format_schedule_for_day(monday, group="group-a")
+        text_b = manager.format_schedule_for_day(monday + timedelta(days=1), group="group-b")
+        event_b = db.get_control_events_by_date("2030-01-07", "group-b")
+        event_a = db.get_control_events_by_date("2030-01-07", "group-a")
+        db.delete_control_event(event_id)
+        
+        db.add_user(-2001, "group_a_user", "Test")
+        db.add_user(-2002, "group_b_user", "Test")
+        db.set_user_group(-2002, "group-b", True)
+        users_a = db.get_group_users("group-a", include_unsubscribed=True)
+        users_b = db.get_group_users("group-b")
+        db.set_user_group(-2002, "group-b", False)
+        
+        texts_ok = "Группа А" in text_a and "Группа Б" in text_b and "Информатика" in text_a
+        events_ok = len(event_b) == 1 and len(event_a) == 0
+        users_ok = -2001 in users_a and -2002 not in users_a and users_b == [-2002]
+        if texts_ok and events_ok and users_ok:
+            print(f"✅ Несколько групп работают корректно: {list(manager.groups)}")
+        else:
+            print("❌ Ошибка в поддержке нескольких групп")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования нескольких групп: {e}")
+    
+    # 13. Тест объединения напоминаний о занятиях, начинающихся одновременно
+    print("\n13. Тестируем объединение напоминаний...")
+    try:
+        class RecordingBot:
+            def __init__(self):
+                self.messages = []
+            
+            async def send_message(self, chat_id, text, **kwargs):
+                self.messages.append((chat_id, text))
+        
+        class FakeApplication:
+            job_queue = None
+        
+        class FakeReminderContext:
+            bot = RecordingBot()
+        
+        notifier = Notifier(FakeApplication())
+        recipients = user_registry.get_user_group_map()
+        saved_recipients = dict(recipients)
+        recipients.clear()
+        recipients.update({-3001: (), -3002: ()})
+        
+        lesson = {"name": "Основы программирования", "room": "301х", "type": "лекция",
+                  "start_time": "14:05", "group": schedule_manager.default_group}
+        await notifier.send_lesson_reminder(FakeReminderContext(), [lesson, dict(lesson)])
+        
+        recipients.clear()
+        recipients.update(saved_recipients)
+        
+        messages = FakeReminderContext.bot.messages
+        if len(messages) == 2 and messages[0][1].count("Основы программирования") == 1:
+            print("✅ Напоминания объединяются корректно")
+        else:
+            print(f"❌ Ошибка объединения напоминаний: {messages}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования объединения напоминаний: {e}")
+    
+    # 14. Тест реестра пользователей с отложенной записью
+    print("\n14. Тестируем реестр пользователей...")
+    try:
+        # Отдельная БД: результат не зависит от пользователей, записанных прошлыми запусками
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            registry_db = Database(os.path.join(tmp_dir, "registry.db"))
+            registry_async_db = AsyncDatabase(registry_db)
+            try:
+                registry = UserRegistry(registry_db, registry_async_db)
+                await registry.load_async()
+                before = len(registry)
+                
+                for i in range(100):
+                    registry.add_user(-4000 - i, f"registry_{i}", "Test")
+                registry.add_user(-4000, "registry_0", "Test")
+                registry.set_user_group(-4001, "main", True)
+                
+                in_memory = registry.user_exists(-4050) and not registry_db.user_exists(-4050)
+                written = await registry.flush_async()
+                persisted = registry_db.user_exists(-4050) and registry_db.get_user_groups(-4001) == ["main"]
+                
+                reloaded = UserRegistry(registry_db, registry_async_db)
+                reloaded.load()
+                
+                # Снимок получателей переиспользуется и пересобирается только после изменения состава
+                snapshot = reloaded.get_all_users()
+                reloaded.add_user(-4100, "registry_new", "Test")
+                snapshot_ok = isinstance(snapshot, tuple) and snapshot is not reloaded.get_all_users() \
+                    and reloaded.get_all_users() is reloaded.get_all_users() and -4100 in reloaded.get_all_users()
+                
+                if in_memory and written == 101 and persisted and len(reloaded) == before + 101 \
+                        and reloaded.get_user_groups(-4001) == ["main"] and snapshot_ok:
+                    print(f"✅ Реестр пользователей работает корректно: {len(reloaded)} пользователей")
+                else:
+                    print("❌ Ошибка в реестре пользователей")
+            finally:
+                await registry_async_db.close()
+                registry_db.close()
+    except Exception as e:
+        print(f"❌ Ошибка тестирования реестра пользователей: {e}")
+    
+    # 15. Тест учета состояния доставки
+    print("\n15. Тестируем учет состояния доставки...")
+    try:
+        registry = UserRegistry(db, async_db)
+        await registry.load_async()
+        for user_id in (-5001, -5002, -5003):
+            registry.add_user(user_id, None, "Delivery")
+        
+        class FailingBot:
+            failures = {
+                -5002: Forbidden("Forbidden: bot was blocked by the user"),
+                -5003: BadRequest("Chat not found"),
+            }
+            
+            async def send_message(self, chat_id, text, **kwargs):
+                if chat_id in self.failures:
+                    raise self.failures[chat_id]
+        
+        engine = Broadcaster(concurrency=2, rate_limit=1000, per_chat_interval=0, retry_backoff=0)
+        engine.add_delivery_listener(registry.record_delivery)
+        result = await engine.broadcast(FailingBot(), [-5001, -5002, -5003], "test")
+        excluded = not ({-5002, -5003} & set(registry.get_all_users())) and -5001 in registry.get_all_users()
+        
+        await registry.flush_async()
+        states = db.get_user_delivery_states()
+        persisted = states.get(-5002) == (USER_STATUS_BLOCKED, 1) and states.get(-5003) == (USER_STATUS_CHAT_NOT_FOUND, 1)
+        filtered = -5002 not in db.get_all_users() and -5002 not in db.get_group_users("main", include_unsubscribed=True)
+        
+        registry.add_user(-5002, None, "Delivery")
+        reactivated = registry.is_active(-5002)
+        await registry.flush_async()
+        
+        if result.unreachable == 2 and excluded and persisted and filtered and reactivated \
+                and -5002 in db.get_all_users():
+            print(f"✅ Состояние доставки учитывается корректно: {registry.get_status_counts()}")
+        else:
+            print("❌ Ошибка в учете состояния доставки")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования состояния доставки: {e}")
+    
+    # 16. Тест сохраняемых заданий рассылки
+    print("\n16. Тестируем задания рассылки...")
+    try:
+        class CountingBot:
+            def __init__(self):
+                self.sent = []
+            
+            async def send_message(self, chat_id, text, **kwargs):
+                self.sent.append(chat_id)
+        
+        engine = Broadcaster(concurrency=4, rate_limit=1000, per_chat_interval=0, retry_backoff=0)
+        manager = BroadcastJobManager(async_db, engine, batch_size=10)
+        recipients = list(range(-6001, -6051, -1))
+        
+        job_id = await manager.submit("test", "test", recipients, dedupe_key="test:resume")
+        same_id = await manager.submit("test", "test", recipients, dedupe_key="test:resume")
+        
+        # Имитируем сбой: порция забрана на отправку, но итоги не зафиксированы
+        interrupted = await async_db.claim_broadcast_batch(job_id, 10)
+        bot = CountingBot()
+        resumed = await manager.resume_pending(bot)
+        await asyncio.sleep(0)
+        while manager.is_running(job_id):
+            await asyncio.sleep(0.01)
+        job = await async_db.get_broadcast_job(job_id)
+        
+        no_duplicates = len(bot.sent) == len(set(bot.sent)) == 40 and not set(interrupted) & set(bot.sent)
+        
+        cancel_id = await manager.submit("test", "test", recipients)
+        cancelled = await manager.cancel(cancel_id)
+        cancel_result = await manager.run(CountingBot(), cancel_id)
+        
+        # Завершенные и отмененные задания удаляются вместе с очередью получателей, активные остаются
+        active_id = await manager.submit("test", "test", recipients)
+        kept = await async_db.purge_broadcast_jobs(time.time() - 3600)
+        purged = await async_db.purge_broadcast_jobs(time.time() + 60)
+        outbox_left = db.get_connection().execute(
+            'SELECT COUNT(*) FROM broadcast_outbox WHERE job_id IN (?, ?)', (job_id, cancel_id)
+        ).fetchone()[0]
+        purge_ok = kept == 0 and purged >= 2 and outbox_left == 0 \
+            and await async_db.get_broadcast_job(job_id) is None \
+            and await async_db.get_broadcast_job(active_id) is not None
+        await manager.cancel(active_id)
+        
+        if same_id == job_id and resumed >= 1 and no_duplicates and job["status"] == "done" \
+                and job["success"] == 40 and job["failed"] == 10 and cancelled and cancel_result.processed == 0 \
+                and purge_ok:
+            print(f"✅ Задания рассылки работают корректно: #{job_id} {job['success']}/{job['total']}")
+        else:
+            print(f"❌ Ошибка в заданиях рассылки: {job}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования заданий рассылки: {e}")
+    
+    # 17. Тест метрик
+    print("\n17. Тестируем метрики...")
+    try:
+        db.get_all_users()
+        sent_before = MESSAGES_SENT.value(result="success")
+        await Broadcaster(rate_limit=1000, per_chat_interval=0).send(CountingBot(), -7001, "test")
+        
+        async def failing_handler(update, context):
+            raise RuntimeError("test")
+        
+        try:
+            await instrument_handler("test_handler", failing_handler)(None, None)
+        except RuntimeError:
+            pass
+        
+        server = MetricsServer(metrics, "127.0.0.1", 0)
+        await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{server.bound_port}/metrics") as response:
+                    body = await response.text()
+        finally:
+            await server.stop()
+        
+        if DB_QUERY_DURATION.count(method="get_all_users") > 0 \
+                and MESSAGES_SENT.value(result="success") == sent_before + 1 \
+                and 'bot_handler_errors_total{handler="test_handler"} 1' in body \
+                and 'bot_db_query_duration_seconds_bucket{method="get_all_users",le="+Inf"}' in body:
+            print(f"✅ Метрики работают корректно: {len(body.splitlines())} строк")
+        else:
+            print("❌ Ошибка в метриках")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования метрик: {e}")
+    
+    # 18. Тест хранилища состояния диалогов
+    print("\n18. Тестируем хранилище состояния диалогов...")
+    try:
+        memory_store = MemoryStateStore(default_ttl=60)
+        await memory_store.set("test", 1, {"step": "waiting_for_date"})
+        await memory_store.set("test", 2, {"step": "expired"}, ttl=-1)
+        memory_ok = await memory_store.get("test", 1) == {"step": "waiting_for_date"} \
+            and await memory_store.get("test", 2) is None
+        
+        # Второй экземпляр имитирует перезапуск или другой процесс с той же БД
+        await SQLiteStateStore(async_db).set("test", -8001, {"dialog": "broadcast"})
+        await SQLiteStateStore(async_db).set("test", -8002, {"dialog": "broadcast"}, ttl=-1)
+        sqlite_store = SQLiteStateStore(async_db)
+        sqlite_ok = await sqlite_store.get("test", -8001) == {"dialog": "broadcast"} \
+            and await sqlite_store.get("test", -8002) is None
+        purged = await sqlite_store.purge_expired()
+        await sqlite_store.delete("test", -8001)
+        
+        # Неполное хранилище не создается: ошибка видна сразу, а не посреди диалога
+        class IncompleteStore(StateStore):
+            async def get(self, namespace, user_id):
+                return None
+        
+        try:
+            IncompleteStore()
+            abstract_ok = False
+        except TypeError:
+            abstract_ok = True
+        
+        panel = AdminPanel(MemoryStateStore())
+        await panel._save_dialog(-8003, {"dialog": "add_event", "step": "waiting_for_date"})
+        panel_ok = await panel.has_pending_dialog(-8003) and not await panel.has_pending_dialog(-8004)
+        
+        if memory_ok and sqlite_ok and purged >= 1 and panel_ok and abstract_ok and await sqlite_store.get("test", -8001) is None:
+            print("✅ Хранилище состояния диалогов работает корректно")
+        else:
+            print("❌ Ошибка в хранилище состояния диалогов")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования хранилища состояния: {e}")
+    
+    # 19. Тест готовой разметки клавиатур и проверки роли
+    print("\n19. Тестируем разметку клавиатур и проверку роли...")
+    try:
+        groups = {"a": "Группа A", "b": "Группа B"}
+        markup_ok = get_main_keyboard() is MAIN_KEYBOARD \
+            and reply_keyboard_for(True) is ADMIN_KEYBOARD \
+            and reply_keyboard_for(False) is MAIN_KEYBOARD \
+            and get_groups_keyboard(groups, {"a"}) is get_groups_keyboard(dict(groups), ["a"]) \
+            and get_groups_keyboard(groups, {"a"}) is not get_groups_keyboard(groups, {"b"})
+        
+        admin = ADMIN_USERNAME_LIST[0] if ADMIN_USERNAME_LIST else None
+        roles_ok = not is_admin(None) and not is_admin("") and not is_admin("definitely_not_admin_8005") \
+            and (admin is None or (is_admin(admin) and is_admin(f"@{admin}")))
+        
+        if markup_ok and roles_ok:
+            print("✅ Разметка клавиатур переиспользуется, проверка роли работает")
+        else:
+            print("❌ Ошибка в разметке клавиатур или проверке роли")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования разметки: {e}")
+    
+    # 20. Тест координации процессов кластера
+    print("\n20. Тестируем кластер из нескольких процессов...")
+    try:
+        first = ClusterCoordinator(async_db, worker_id="test-a", partitions=4, lease_ttl=60)
+        second = ClusterCoordinator(async_db, worker_id="test-b", partitions=4, lease_ttl=60)
+        became_leader = await first.heartbeat()
+        await second.heartbeat()
+        await first.heartbeat()
+        await second.heartbeat()
+        split_ok = became_leader and first.is_leader and not second.is_leader \
+            and first.owned_partitions.isdisjoint(second.owned_partitions) \
+            and first.owned_partitions | second.owned_partitions == set(range(4)) \
+            and len(first.owned_partitions) == len(second.owned_partitions) == 2
+        
+        run_key = datetime.now().isoformat()
+        runs_ok = await first.claim_run("test_job", run_key) and not await second.claim_run("test_job", run_key)
+        
+        # Обновления чата из раздела первого процесса обрабатывает только он, по порядку
+        processed = []
+        
+        class RecordingApplication:
+            bot = None
+            
+            async def process_update(self, update):
+                processed.append(update.update_id)
+        
+        app = RecordingApplication()
+        worker_a = ClusterWorker(app, first)
+        worker_b = ClusterWorker(app, second)
+        chat_id = next(i for i in range(9000, 9100) if partition_for(i, 4) in first.owned_partitions)
+        base_id = 900000 + int(datetime.now().timestamp()) % 100000 * 10
+        updates = [
+            Update.de_json({"update_id": base_id + i, "message": {
+                "message_id": i, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": str(i)
+            }}, None)
+            for i in range(3)
+        ]
+        await worker_a.enqueue(updates)
+        await worker_a.enqueue(updates[:1])
+        handled_by_b = await worker_b.process_pending()
+        handled_by_a = await worker_a.process_pending()
+        inbox_ok = handled_by_b == 0 and handled_by_a == 3 and processed == [u.update_id for u in updates] \
+            and await worker_a.process_pending() == 0
+        
+        # Лидер остановился: второй процесс забирает лидерство и все разделы
+        await first.shutdown()
+        takeover = await second.heartbeat()
+        failover_ok = takeover and second.is_leader and second.owned_partitions == set(range(4))
+        await second.shutdown()
+        
+        if split_ok and runs_ok and inbox_ok and failover_ok:
+            print("✅ Кластер работает корректно: лидер один, разделы поделены, задания не дублируются")
+        else:
+            print(f"❌ Ошибка в кластере: {split_ok}, {runs_ok}, {inbox_ok}, {failover_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования кластера: {e}")
+    
+    # 21. Тест параллельной обработки обновлений с порядком внутри чата
+    print("\n21. Тестируем параллельную обработку обновлений...")
+    try:
+        processor = ChatOrderedUpdateProcessor(max_concurrent_updates=3)
+        events = []
+        running = 0
+        peak = 0
+        
+        async def handle(chat_id, n, delay):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            events.append(("start", chat_id, n))
+            await asyncio.sleep(delay)
+            events.append(("end", chat_id, n))
+            running -= 1
+        
+        def message_update(update_id, chat_id):
+            return Update.de_json({"update_id": update_id, "message": {
+                "message_id": update_id, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "x"
+            }}, None)
+        
+        # Чат 1 присылает много медленных обновлений, остальные чаты не должны их ждать
+        jobs = [(message_update(i, 1), handle(1, i, 0.02)) for i in range(5)]
+        jobs += [(message_update(100 + i, 2 + i), handle(2 + i, 0, 0.01)) for i in range(6)]
+        started = time.perf_counter()
+        await asyncio.gather(*(processor.process_update(update, coro) for update, coro in jobs))
+        elapsed = time.perf_counter() - started
+        
+        chat_one = [n for kind, chat_id, n in events if chat_id == 1 and kind == "start"]
+        sequential = all(
+            events.index(("end", 1, n)) < events.index(("start", 1, n + 1)) for n in range(4)
+        )
+        others_done_early = max(events.index(("end", 2 + i, 0)) for i in range(6)) < events.index(("end", 1, 4))
+        
+        # Процессор подменяет внутренний семафор PTB: тест падает, если его нет в установленной версии
+        semaphore_ok = "_semaphore" in BaseUpdateProcessor.__slots__ \
+            and type(processor._semaphore).__name__ == "_Unlimited"
+        
+        if chat_one == list(range(5)) and sequential and others_done_early and peak <= 3 \
+                and processor.pending_chats == 0 and semaphore_ok:
+            print(f"✅ Обновления обрабатываются параллельно с порядком в чате: пик {peak}, {elapsed * 1000:.0f} мс")
+        else:
+            print(f"❌ Ошибка параллельной обработки: {chat_one}, {sequential}, {others_done_early}, {peak}, {semaphore_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования параллельной обработки: {e}")
+    
+    # 22. Тест календаря семестров
+    print("\n22. Тестируем календарь семестров...")
+    try:
+        lesson = {"name": "Матанализ", "room": "101", "start": "10:10", "end": "11:40", "type": "лекция"}
+        other = {"name": "Физика", "room": "202", "start": "12:00", "end": "13:30", "type": "семинар"}
+        week = {day: [lesson] for day in ("понедельник", "вторник", "среда", "четверг", "пятница")}
+        calendar_raw = {
+            "numerator": week,
+            "denominator": dict(week, понедельник=[other]),
+            "semesters": [
+                {"start": "2024-09-01", "end": "2024-12-29",
+                 "holidays": ["2024-11-04"], "swaps": {"2024-11-02": "2024-11-04"}},
+                {"start": "2025-02-10", "end": "2025-06-30", "first_week": "denominator"}
+            ]
+        }
+        calendar_timetable = compile_timetable(calendar_raw)
+        calendar = calendar_timetable.group().calendar
+        
+        # Прежний расчет четности от 1 сентября сохраняется
+        legacy_ok = all(
+            calendar.is_numerator(datetime(2024, 9, 1) + timedelta(days=i)) == (((i // 7) % 2) == 0)
+            for i in range(120)
+        )
+        holiday = calendar.day("2024-11-04")
+        swapped = calendar.day("2024-11-02")
+        second = calendar.day("2025-02-10")
+        calendar_ok = holiday.holiday and holiday.day_schedule is None \
+            and swapped.swapped and swapped.day_schedule is not None \
+            and swapped.day_schedule.subjects[0].name == "Физика" \
+            and calendar.day("2025-01-15").holiday \
+            and not second.is_numerator and second.day_schedule.subjects[0].name == "Физика" \
+            and calendar.day("2024-09-01") is calendar.day(datetime(2024, 9, 1, 15, 30)) \
+            and calendar.day("2030-01-07").day_schedule is not None
+        
+        # Неделя с середины недели: прошедшие дни берутся из текущей недели с той же четностью,
+        # что и в заголовке (среда 2024-09-11 — знаменатель, в понедельник Физика)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "timetable.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(calendar_raw, f, ensure_ascii=False)
+            week_manager = ScheduleManager(path, clock=FakeClock(datetime(2024, 9, 11, 12, 0)))
+        week_text = week_manager.get_week_schedule()
+        monday_block = week_text.split("Понедельник")[1].split("Вторник")[0]
+        week_ok = "Знаменатель" in week_text and "Физика" in monday_block and "Матанализ" not in monday_block
+        
+        if legacy_ok and calendar_ok and week_ok:
+            print(f"✅ Календарь семестров работает корректно: {len(calendar._days)} дней")
+        else:
+            print(f"❌ Ошибка в календаре семестров: {legacy_ok}, {calendar_ok}, {week_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования календаря семестров: {e}")
+    
+    # 23. Тест экспорта в iCalendar
+    print("\n23. Тестируем экспорт в iCalendar...")
+    try:
+        exporter = ICalExporter(schedule_manager, db)
+        first_feed = exporter.feed()
+        group_id = first_feed.group_id
+        cached_ok = exporter.feed(group_id) is first_feed \
+            and first_feed.body.startswith(b"BEGIN:VCALENDAR\r\n") \
+            and all(len(line) <= 75 for line in first_feed.body.split(b"\r\n"))
+        
+        calendar = schedule_manager.timetable.group(group_id).calendar
+        event_date = (calendar.first_day + timedelta(days=10)).strftime("%Y-%m-%d")
+        event_id = db.add_control_event(event_date, "Тестовый предмет", "Контрольная работа")
+        second_feed = exporter.feed(group_id)
+        db.delete_control_event(event_id)
+        rebuilt_ok = second_feed is not first_feed and second_feed.etag != first_feed.etag \
+            and "Тестовый предмет".encode("utf-8") in second_feed.body.replace(b"\r\n ", b"")
+        
+        conditional_ok = is_not_modified(second_feed, second_feed.etag) \
+            and not is_not_modified(second_feed, first_feed.etag) \
+            and is_not_modified(second_feed, if_modified_since=second_feed.http_date) \
+            and not is_not_modified(second_feed)
+        
+        server = CalendarFeedServer(exporter, async_db, "127.0.0.1", 0)
+        await server.start()
+        try:
+            url = f"http://127.0.0.1:{server.bound_port}/calendar/{group_id}.ics"
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as response:
+                    etag = response.headers.get("ETag")
+                    http_ok = response.status == 200 and response.content_type == "text/calendar"
+                async with session.get(url, headers={"If-None-Match": etag}) as response:
+                    http_ok = http_ok and response.status == 304
+                async with session.get(f"http://127.0.0.1:{server.bound_port}/calendar/нет-такой.ics") as response:
+                    http_ok = http_ok and response.status == 404
+        finally:
+            await server.stop()
+        
+        if cached_ok and rebuilt_ok and conditional_ok and http_ok:
+            print(f"✅ Экспорт в iCalendar работает корректно: {len(second_feed.body)} байт")
+        else:
+            print(f"❌ Ошибка экспорта в iCalendar: {cached_ok}, {rebuilt_ok}, {conditional_ok}, {http_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования экспорта в iCalendar: {e}")
+    
+    # 24. Тест настроек рассылок и распределения расписания на завтра по минутам
+    print("\n24. Тестируем настройки рассылок...")
+    try:
+        class StubRegistry:
+            version = 1
+            
+            def get_all_users(self):
+                return list(range(1, 601))
+        
+        preferences = PreferenceStore(db, async_db, digest_time="21:00", spread_minutes=60)
+        await preferences.load_async()
+        await preferences.update(7, digest_minute=parse_minute("19:00"))
+        await preferences.update(8, digest_enabled=False)
+        stored = PreferenceStore(db, async_db)
+        stored.load()
+        
+        digests = []
+        
+        async def record_digest(context, minute, users):
+            digests.append((minute.strftime("%H:%M"), len(users)))
+        
+        claimed = set()
+        
+        async def claim_once(job, run_key):
+            if (job, run_key) in claimed:
+                return False
+            claimed.add((job, run_key))
+            return True
+        
+        scheduler = DigestScheduler(None, record_digest, StubRegistry(), preferences, claim_run=claim_once)
+        buckets = scheduler.buckets()
+        spread_ok = len(buckets) == 61 and max(len(users) for users in buckets.values()) == 10 \
+            and buckets[parse_minute("19:00")] == [7] and all(8 not in users for users in buckets.values()) \
+            and stored.get(7).digest_minute == parse_minute("19:00") and not stored.get(8).digest_enabled
+        
+        # Первый запуск — только текущая минута, после задержки догоняются пропущенные
+        await scheduler.tick(None, now=datetime(2024, 9, 9, 21, 0, 1))
+        await scheduler.tick(None, now=datetime(2024, 9, 9, 21, 3, 2))
+        await scheduler.tick(None, now=datetime(2024, 9, 9, 21, 3, 40))
+        await scheduler.wait_idle()
+        other = DigestScheduler(None, record_digest, StubRegistry(), preferences, claim_run=claim_once)
+        await other.tick(None, now=datetime(2024, 9, 9, 21, 3, 5))
+        await other.wait_idle()
+        ticks_ok = [minute for minute, _ in digests] == ["21:00", "21:01", "21:02", "21:03"]
+        
+        # Напоминания: у каждого получателя свой интервал
+        class ReminderBot:
+            def __init__(self):
+                self.messages = []
+            
+            async def send_message(self, chat_id, text, **kwargs):
+                self.messages.append((chat_id, text))
+        
+        class NoJobsApplication:
+            job_queue = None
+        
+        class ReminderContext:
+            bot = ReminderBot()
+        
+        await user_preferences.update(-4002, reminder_lead=30)
+        await user_preferences.update(-4003, reminders_enabled=False)
+        recipients = user_registry.get_user_group_map()
+        saved_recipients = dict(recipients)
+        recipients.clear()
+        recipients.update({-4001: (), -4002: (), -4003: ()})
+        lesson = {"name": "Физика", "room": "202", "type": "семинар",
+                  "start_time": "12:00", "group": schedule_manager.default_group}
+        await Notifier(NoJobsApplication()).send_lesson_reminder(
+            ReminderContext(), [dict(lesson, lead=10), dict(lesson, lead=30)]
+        )
+        recipients.clear()
+        recipients.update(saved_recipients)
+        await user_preferences.update(-4002, reminder_lead=10)
+        await user_preferences.update(-4003, reminders_enabled=True)
+        
+        texts = dict(ReminderContext.bot.messages)
+        leads_ok = len(texts) == 2 and "Через 10 минут" in texts[-4001] and "Через 30 минут" in texts[-4002] \
+            and user_preferences.reminder_leads() == {10}
+        
+        if spread_ok and ticks_ok and leads_ok:
+            print(f"✅ Настройки рассылок работают корректно: {len(buckets)} минут, пик {max(map(len, buckets.values()))}")
+        else:
+            print(f"❌ Ошибка настроек рассылок: {spread_ok}, {ticks_ok} {digests}, {leads_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования настроек рассылок: {e}")
+    
+    # 25. Тест ленивого контейнера и импорта без побочных эффектов
+    print("\n25. Тестируем контейнер приложения и холодный импорт...")
+    try:
+        services = AppContainer()
+        lazy_ok = services.created == []
+        panel = services.admin_panel
+        created = set(services.created)
+        container_ok = lazy_ok and panel is services.admin_panel \
+            and panel.schedule_manager is services.schedule_manager \
+            and {"admin_panel", "state_store", "async_database", "database", "schedule_manager"} <= created \
+            and "ical_exporter" not in created
+        services.reset()
+        container_ok = container_ok and services.created == [] and services.admin_panel is not panel
+        
+        imports = [measure(module, runs=1) for module in ("src.services.database", "src.handlers.user_handlers")]
+        imports_ok = all(not result["side_effects"] and not result["aiohttp"] for result in imports)
+        
+        if container_ok and imports_ok:
+            timings = ", ".join(f"{result['module']} {result['median_ms']} мс" for result in imports)
+            print(f"✅ Контейнер ленивый, импорт без побочных эффектов: {timings}")
+        else:
+            print(f"❌ Ошибка контейнера или импорта: {container_ok}, {imports}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования контейнера: {e}")
+    
+    # 26. Тест конвейера журнала: очередь, JSON, уровни подсистем и выборка
+    print("\n26. Тестируем конвейер журнала...")
+    try:
+        with tempfile.TemporaryDirectory() as log_dir:
+            listener = setup_logging(
+                level="INFO", levels="test.quiet=WARNING", log_format="text", log_dir=log_dir,
+                sample="test_event=5", max_bytes=1024 * 1024, backups=1
+            )
+            same_ok = setup_logging(
+                level="INFO", levels="test.quiet=WARNING", log_format="text", log_dir=log_dir,
+                sample="test_event=5", max_bytes=1024 * 1024, backups=1
+            ) is listener
+            
+            class Progress:
+                count = 1
+                
+                def __str__(self):
+                    return f"отправлено {self.count}"
+            
+            progress = Progress()
+            logging.getLogger("test.pipeline").info("Прогресс: %s", progress, extra={"chat_id": 42})
+            # Аргументы подставляются при записи, а не при выводе потоком журнала
+            progress.count = 2
+            logging.getLogger("test.quiet").info("Не должно попасть в журнал")
+            for index in range(20):
+                logging.getLogger("test.pipeline").info("Событие %s", index, extra={"event": "test_event"})
+            logging.getLogger("test.pipeline").error("Ошибка события", extra={"event": "test_event"})
+            try:
+                raise ValueError("проверка")
+            except ValueError:
+                logging.getLogger("test.pipeline").exception("Исключение")
+            shutdown_logging()
+            
+            with open(os.path.join(log_dir, "bot.log"), encoding="utf-8") as log_file:
+                entries = [json.loads(line) for line in log_file]
+        
+        messages = [entry["message"] for entry in entries]
+        sampled = [entry for entry in entries if entry.get("event") == "test_event" and entry["level"] == "INFO"]
+        pipeline_ok = same_ok and "Прогресс: отправлено 1" in messages \
+            and next(entry for entry in entries if entry["message"].startswith("Прогресс"))["chat_id"] == 42 \
+            and "Не должно попасть в журнал" not in messages \
+            and [entry["message"] for entry in sampled] == ["Событие 0", "Событие 5", "Событие 10", "Событие 15"] \
+            and all(entry["sample_rate"] == 5 for entry in sampled) \
+            and "Ошибка события" in messages \
+            and "ValueError: проверка" in entries[-1].get("exc_info", "")
+        
+        if pipeline_ok:
+            print(f"✅ Конвейер журнала работает корректно: записано {len(entries)} записей в JSON")
+        else:
+            print(f"❌ Ошибка конвейера журнала: {entries}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования журнала: {e}")
+    
+    # 27. Тест часов приложения и часовых поясов групп и пользователей
+    print("\n27. Тестируем часы и часовые пояса...")
+    try:
+        # Переход на летнее и зимнее время
+        berlin = FakeClock(datetime(2024, 3, 31, 1, 30), "Europe/Berlin")
+        skipped = berlin.localize(date(2024, 3, 31), dtime(2, 30))
+        repeated = berlin.localize(date(2024, 10, 27), dtime(2, 30))
+        first_day = berlin.today()
+        berlin.advance(hours=23)
+        dst_ok = skipped.strftime("%H:%M%z") == "03:30+0200" and repeated.utcoffset() == timedelta(hours=2) \
+            and first_day == date(2024, 3, 31) and berlin.today() == date(2024, 4, 1)
+        
+        # Группа во Владивостоке: у нее уже понедельник, когда в Москве воскресный вечер
+        lesson = {"name": "Информатика", "room": "1", "start": "10:10", "end": "11:40", "type": "лекция"}
+        raw = {
+            "default_group": "msk",
+            "semester_start": "2030-01-01",
+            "groups": {
+                "msk": {"title": "Москва", "numerator": {"понедельник": [lesson]},
+                        "denominator": {"понедельник": [lesson]}},
+                "vl": {"title": "Владивосток", "timezone": "Asia/Vladivostok",
+                       "numerator": {"понедельник": [lesson]}, "denominator": {"понедельник": [lesson]}},
+            }
+        }
+        clock = FakeClock(datetime(2030, 1, 6, 20, 0), "Europe/Moscow")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "timetable.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(raw, f, ensure_ascii=False)
+            manager = ScheduleManager(path, clock=clock)
+        today_ok = "занятий нет" in manager.get_today_schedule("msk") \
+            and "Информатика" in manager.get_today_schedule("vl")
+        
+        class PlanJobQueue:
+            def __init__(self):
+                self.scheduled = []
+            
+            def jobs(self):
+                return []
+            
+            def run_once(self, callback, when, data=None, name=None, job_kwargs=None):
+                self.scheduled.append((when, data["lessons"][0]["group"]))
+        
+        async def ignore_reminder(context, lessons):
+            pass
+        
+        plan_queue = PlanJobQueue()
+        ReminderPlanner(plan_queue, ignore_reminder, manager=manager).rebuild()
+        reminders = [(when.astimezone(timezone.utc).strftime("%d %H:%M"), group) for when, group in plan_queue.scheduled]
+        reminders_ok = reminders == [("07 00:00", "vl"), ("07 07:00", "msk")]
+        
+        feed_body = ICalExporter(manager, db).feed("vl").body.decode("utf-8")
+        ical_ok = "X-WR-TIMEZONE:Asia/Vladivostok" in feed_body and "DTSTART:20300107T001000Z" in feed_body
+        
+        # Время рассылки пользователя — в его поясе; повторившийся час не рассылается дважды
+        class ZoneRegistry:
+            version = 1
+            
+            def get_all_users(self):
+                return [-5001, -5002, -5003]
+        
+        zone_preferences = PreferenceStore(db, async_db, digest_time="21:00", spread_minutes=1)
+        await zone_preferences.load_async()
+        await zone_preferences.update(-5002, timezone="Asia/Novosibirsk")
+        await zone_preferences.update(-5003, timezone="Europe/Berlin", digest_minute=parse_minute("02:30"))
+        zone_digests = []
+        
+        async def record_zone_digest(context, minute, users):
+            zone_digests.append((minute.tzinfo.key, minute.strftime("%H:%M"), users))
+        
+        scheduler = DigestScheduler(None, record_zone_digest, ZoneRegistry(), zone_preferences, clock=clock)
+        for moment in (datetime(2030, 1, 7, 17, 0, 5), datetime(2030, 1, 7, 21, 0, 5)):
+            clock.set(moment)
+            await scheduler.tick(None)
+        fold_scheduler = DigestScheduler(None, record_zone_digest, ZoneRegistry(), zone_preferences, clock=clock)
+        for moment in (datetime(2024, 10, 27, 0, 30, 5, tzinfo=timezone.utc),
+                       datetime(2024, 10, 27, 1, 30, 5, tzinfo=timezone.utc)):
+            await fold_scheduler.tick(None, now=moment)
+        await scheduler.wait_idle()
+        await fold_scheduler.wait_idle()
+        digests_ok = zone_digests == [
+            ("Asia/Novosibirsk", "21:00", [-5002]), ("Europe/Moscow", "21:00", [-5001]),
+            ("Europe/Berlin", "02:30", [-5003]),
+        ]
+        
+        panel_ok = AdminPanel(MemoryStateStore(), clock=clock)._local_time("2030-01-06 17:00:00") == "2030-01-06 20:00"
+        
+        if dst_ok and today_ok and reminders_ok and ical_ok and digests_ok and panel_ok:
+            print("✅ Часы и часовые пояса работают корректно")
+        else:
+            print(f"❌ Ошибка часов и поясов: {dst_ok}, {today_ok}, {reminders}, {ical_ok}, {zone_digests}, {panel_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования часов и поясов: {e}")
+    
+    # Тест 28: Постраничный список мероприятий
+    print("\n28. Тестируем постраничный список мероприятий...")
+    event_ids = []
+    try:
+        for day in range(1, 26):
+            subject = "Физика" if day % 5 == 0 else "Математика"
+            event_ids.append(await async_db.add_control_event(f"2099-03-{day:02d}", subject, "тест", "test", None))
+        
+        def key(row):
+            return row[1], row[0]
+        
+        page_filter = {"start_date": "2099-03-01", "end_date": "2099-03-31"}
+        first, first_more = await async_db.get_control_events_page(10, **page_filter)
+        second, second_more = await async_db.get_control_events_page(10, after=key(first[-1]), **page_filter)
+        third, third_more = await async_db.get_control_events_page(10, after=key(second[-1]), **page_filter)
+        back, back_more = await async_db.get_control_events_page(10, before=key(second[0]), **page_filter)
+        pages_ok = (
+            [row[0] for row in first + second + third] == event_ids
+            and (first_more, second_more, third_more) == (True, True, False)
+            and back == first and not back_more
+        )
+        
+        physics, _ = await async_db.get_control_events_page(10, subject="фИЗ", **page_filter)
+        ranged, _ = await async_db.get_control_events_page(10, start_date="2099-03-10", end_date="2099-03-12")
+        filters_ok = (
+            [row[1] for row in physics] == [f"2099-03-{day:02d}" for day in (5, 10, 15, 20, 25)]
+            and [row[1] for row in ranged] == ["2099-03-10", "2099-03-11", "2099-03-12"]
+        )
+        
+        by_id_ok = (
+            (await async_db.get_control_event_by_id(event_ids[3]))[1] == "2099-03-04"
+            and await async_db.get_control_event_by_id(-1) is None
+        )
+        
+        parse_ok = (
+            parse_event_filter("2099-03-01 2099-03-31 физика") == {"start": "2099-03-01", "end": "2099-03-31", "subject": "физика"}
+            and parse_event_filter("-") == {}
+        )
+        try:
+            parse_event_filter("2099-03-31 2099-03-01")
+            parse_ok = False
+        except ValueError:
+            pass
+        
+        store = MemoryStateStore()
+        panel = AdminPanel(store, async_db)
+        await store.set(EVENT_FILTER_NAMESPACE, 1, {"start": "2099-03-01", "subject": "математика"})
+        text, markup = await panel._render_events_page(1, EVENTS_VIEW)
+        buttons = [button.callback_data for row in markup.inline_keyboard for button in row]
+        delete_text, delete_markup = await panel._render_events_page(1, EVENTS_DELETE, after=key(third[0]))
+        delete_buttons = [button.callback_data for row in delete_markup.inline_keyboard for button in row]
+        panel_ok = (
+            text.count("🆔") == 10 and "Физика" not in text
+            and f"events_page_{EVENTS_VIEW}_n_2099-03-12_{event_ids[11]}" in buttons
+            and f"events_filter_reset_{EVENTS_VIEW}" in buttons
+            and f"delete_event_{event_ids[23]}" in delete_buttons
+            and f"events_page_{EVENTS_DELETE}_p_2099-03-22_{event_ids[21]}" in delete_buttons
+            and all(len(data.encode()) <= 64 for data in buttons + delete_buttons)
+        )
+        
+        if pages_ok and filters_ok and by_id_ok and parse_ok and panel_ok:
+            print("✅ Постраничный список мероприятий работает корректно")
+        else:
+            print(f"❌ Ошибка списка мероприятий: {pages_ok}, {filters_ok}, {by_id_ok}, {parse_ok}, {panel_ok}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования списка мероприятий: {e}")
+    finally:
+        for event_id in event_ids:
+            await async_db.delete_control_event(event_id)
+    
+    # 29. Тест общих версий данных для процессов кластера
+    print("\n29. Тестируем общие версии данных в кластере...")
+    try:
+        lesson = {"name": "Матанализ", "room": "101", "start": "10:10", "end": "11:40", "type": "лекция"}
+        week = {day: [lesson] for day in ("понедельник", "вторник", "среда", "четверг", "пятница")}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "timetable.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"semester_start": "2030-01-07", "numerator": week, "denominator": week}, f, ensure_ascii=False)
+            # Два экземпляра Database на одном файле — как два процесса кластера
+            db_path = os.path.join(tmp_dir, "cluster.db")
+            writer_db, reader_db = Database(db_path), Database(db_path)
+            clock = FakeClock(datetime(2030, 1, 7, 9, 0))
+            reader_manager = ScheduleManager(path, database=reader_db, clock=clock)
+            reader_exporter = ICalExporter(reader_manager, reader_db)
+            
+            day = datetime(2030, 1, 7)
+            before_text = reader_manager.format_schedule_for_day(day)
+            before_week = reader_manager.get_week_schedule()
+            before_feed = reader_exporter.feed()
+            cached = reader_manager.format_schedule_for_day(day) is before_text and reader_exporter.feed() is before_feed
+            
+            # Мероприятие добавлено другим процессом: его подписчики изменений здесь не вызываются
+            event_id = writer_db.add_control_event("2030-01-07", "Матанализ", "Коллоквиум", "test")
+            after_text = reader_manager.format_schedule_for_day(day)
+            after_week = reader_manager.get_week_schedule()
+            after_feed = reader_exporter.feed()
+            
+            writer_db.delete_control_event(event_id)
+            removed_text = reader_manager.format_schedule_for_day(day)
+            events_version = reader_db.control_events_version
+            
+            # Настройки рассылки изменены другим процессом: рассылающий процесс видит это перед минутой
+            writer_async_db, reader_async_db = AsyncDatabase(writer_db), AsyncDatabase(reader_db)
+            writer_preferences = PreferenceStore(writer_db, writer_async_db, digest_time="21:00", spread_minutes=1)
+            reader_preferences = PreferenceStore(reader_db, reader_async_db, digest_time="21:00", spread_minutes=1)
+            await writer_preferences.load_async()
+            await reader_preferences.load_async()
+            unchanged = not await reader_preferences.refresh_async()
+            
+            class ClusterRegistry:
+                version = 1
+                
+                def get_all_users(self):
+                    return [-9001, -9002]
+            
+            cluster_digests = []
+            
+            async def record_cluster_digest(context, minute, users):
+                cluster_digests.append((minute.strftime("%H:%M"), users))
+            
+            scheduler = DigestScheduler(
+                None, record_cluster_digest, ClusterRegistry(), reader_preferences,
+                before_tick=reader_preferences.refresh_async, clock=clock
+            )
+            await writer_preferences.update(-9001, digest_enabled=False)
+            await writer_preferences.update(-9002, digest_minute=parse_minute("21:05"))
+            for moment in (datetime(2030, 1, 7, 21, 0, 5), datetime(2030, 1, 7, 21, 5, 5)):
+                clock.set(moment)
+                await scheduler.tick(None)
+            await scheduler.wait_idle()
+            
+            await writer_async_db.close()
+            await reader_async_db.close()
+            writer_db.close()
+            reader_db.close()
+        
+        events_ok = cached and "Коллоквиум" not in before_text + before_week \
+            and "Коллоквиум" in after_text and "Коллоквиум" in after_week \
+            and after_feed.etag != before_feed.etag and "Коллоквиум" not in removed_text
+        preferences_ok = unchanged and cluster_digests == [("21:05", [-9002])]
+        
+        if events_ok and preferences_ok:
+            print(f"✅ Общие версии данных работают корректно: мероприятия v{events_version}")
+        else:
+            print(f"❌ Ошибка общих версий данных: {cached}, {after_text!r}, {after_feed.etag != before_feed.etag}, "
+                  f"{unchanged}, {cluster_digests}")
+    except Exception as e:
+        print(f"❌ Ошибка тестирования общих версий данных: {e}")
+    
     print("\n🎉 Тестирование завершено!")
 
 if __name__ == "__main__":